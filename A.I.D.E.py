@@ -2,13 +2,17 @@
 🧠 A.I.D.E - COMPLETE Loan + PayU Wallet + Face Recognition (User sees ONLY PASS/FAIL)
 """
 
+import hashlib
+import os
+import sys
 import streamlit as st
-import numpy as np
-import cv2
-import time
 from PIL import Image
 from datetime import datetime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+import metrics
+from ledger import account_id
+
 # 🌐 2 REGIONAL LANGUAGES (Simplified)
 LANGUAGES = {
     'en': {
@@ -61,34 +65,83 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # 🔥 FACE COMPARISON FUNCTIONS
-def extract_face_features(image):
-    img = np.array(image)
-    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-    faces = face_cascade.detectMultiScale(gray, 1.3, 5)
-    if len(faces) == 0: return None
-    (x, y, w, h) = faces[0]
-    face = gray[y:y+h, x:x+w]
-    face = cv2.resize(face, (64, 64))
-    return face.flatten().astype(np.float32) / 255.0
+@st.cache_resource
+def get_face_engine():
+    # Loaded once per server process and shared by every session and rerun;
+    # imported here so OpenCV stays off the page's import path
+    from face_engine import FaceEngine
+    return FaceEngine()
+
+def extract_face_features(image, digest=None):
+    return get_face_engine().features(image, digest)
+
+def compare_faces(id_image, selfie_image, id_digest=None, selfie_digest=None):
+    return get_face_engine().compare(id_image, selfie_image, id_digest, selfie_digest)
+
+@st.cache_resource
+def get_ocr_engine():
+    from ocr_engine import OcrEngine
+    return OcrEngine(lang='eng')
 
-def compare_faces(id_image, selfie_image):
-    id_features = extract_face_features(id_image)
-    selfie_features = extract_face_features(selfie_image)
-    if id_features is None or selfie_features is None:
-        return {'match': False, 'confidence': 0, 'error': 'No face detected'}
-    distance = np.sqrt(np.sum((id_features - selfie_features)**2))
-    similarity = max(0, 100 - (distance * 1000))
-    match = distance < 15.0
-    return {'match': match, 'confidence': similarity, 'distance': distance}
+@st.cache_resource
+def get_pipeline():
+    # Agents as dependent stages: OCR and face matching run concurrently as
+    # soon as the uploads arrive; risk, scoring and decision follow
+    from config import METRICS_PORT
+    from pipeline import Pipeline, aide_stages
+    if METRICS_PORT:
+        # Streamlit has no /metrics route; serve one for Prometheus (AIDE_METRICS=1)
+        metrics.start_exporter(METRICS_PORT)
+    return Pipeline(aide_stages(get_ocr_engine(), get_face_engine()))
+
+def start_application():
+    documents = []
+    for key in ('income_proof', 'bank_proof'):
+        upload = st.session_state.get(key)
+        if upload is not None:
+            documents.append((upload.getvalue(), upload.name.lower().endswith('.pdf')))
+    return get_pipeline().run({
+        'application': st.session_state.user_data,
+        'documents': documents,
+        'id_image': st.session_state.id_image,
+        'selfie_image': st.session_state.selfie_image,
+        # Upload digests key the face-feature cache
+        'id_digest': st.session_state.id_digest,
+        'selfie_digest': st.session_state.selfie_digest,
+    })
 
 # 💰 PAYU WALLET CLASS
+@st.cache_resource
+def get_settlement_engine():
+    # One asyncio loop per server process polls every session's disbursals
+    from settlement import SettlementEngine
+    return SettlementEngine()
+
+@st.cache_resource
+def get_ledger():
+    # Durable wallet balances (SQLite, WAL), shared by every session
+    from ledger import Ledger
+    return Ledger()
+
 class PayUWallet:
     def __init__(self):
-        self.wallet_balances = {}
+        self.accounts = {}  # ledger account ID -> applicant name (this session)
+        self.settlements = {}  # txn_id -> (account, future of the final settlement event)
     
-    def initiate_disbursal(self, user_id, amount):
-        txn_id = f"PU{int(time.time())}"
+    @metrics.timed("wallet.initiate_disbursal")
+    def initiate_disbursal(self, account, amount, name=None):
+        # Collision-free, monotonic ID reserved from the ledger
+        ledger = get_ledger()
+        txn_id = ledger.next_txn_id()
+        self.accounts[account] = name or account
+        # Initiated and polled (backoff + jitter) on the settlement engine's
+        # loop, so the script thread returns at once
+        settlement = get_settlement_engine().track(txn_id, amount)
+        # Credit as soon as PayU settles, even if the page is closed by then
+        settlement.add_done_callback(
+            lambda done: self._credit(ledger, done, account, txn_id, amount, wait=False)
+        )
+        self.settlements[txn_id] = (account, settlement)
         return {
             'txn_id': txn_id,
             'status': 'initiated',
@@ -96,19 +149,31 @@ class PayUWallet:
             'timestamp': datetime.now().isoformat()
         }
     
+    @staticmethod
+    def _credit(ledger, settlement, account, txn_id, amount, wait=True):
+        if settlement.cancelled() or settlement.result()['status'] != 'settled':
+            return
+        # Keyed by txn_id, so the wallet is credited exactly once however
+        # often this runs (settlement callback, page reruns)
+        posting = ledger.submit(account, amount, kind='disbursal', idempotency_key=f"settle:{txn_id}", txn_id=txn_id)
+        if wait:
+            posting.result()
+    
+    @metrics.timed("wallet.check_settlement")
     def check_settlement(self, txn_id, amount):
-        time.sleep(np.random.uniform(2, 4))
-        success = np.random.random() > 0.05
-        return {
-            'status': 'settled' if success else 'pending',
-            'amount': amount if success else 0
-        }
+        # Non-blocking: 'pending' until the engine publishes a final status
+        if txn_id not in self.settlements:
+            # Not initiated by this wallet (e.g. a stale txn_id after a reset)
+            return {'status': 'unknown', 'amount': 0}
+        account, settlement = self.settlements[txn_id]
+        if not settlement.done():
+            return {'status': 'pending', 'amount': 0}
+        self._credit(get_ledger(), settlement, account, txn_id, amount)
+        event = settlement.result()
+        return {'status': event['status'], 'amount': event['amount']}
     
-    def update_wallet(self, user_id, amount):
-        if user_id not in self.wallet_balances:
-            self.wallet_balances[user_id] = 0
-        self.wallet_balances[user_id] += amount
-        return self.wallet_balances[user_id]
+    def balance(self, account):
+        return get_ledger().balance(account)
 
 # 🔥 CHATBOT FUNCTION HERE ⬇️
 # 🔥 CHATBOT FUNCTION (Add after PayUWallet class, around line 110)
@@ -229,6 +294,7 @@ elif st.session_state.step == 2:
         if id_proof:
             st.session_state.id_uploaded = True
             st.session_state.id_image = Image.open(id_proof)
+            st.session_state.id_digest = hashlib.sha256(id_proof.getvalue()).hexdigest()
             st.image(st.session_state.id_image, caption="🆔 ID Photo", width=200)
     with col2: st.file_uploader("💰 Income Proof", type=['pdf','jpg'], key="income_proof")
     with col3: st.file_uploader("🏦 Bank Statement", type=['pdf','jpg'], key="bank_proof")
@@ -237,10 +303,12 @@ elif st.session_state.step == 2:
         if selfie:
             st.session_state.selfie_uploaded = True
             st.session_state.selfie_image = Image.open(selfie)
+            st.session_state.selfie_digest = hashlib.sha256(selfie.getvalue()).hexdigest()
             st.image(st.session_state.selfie_image, caption="📸 Your Selfie", width=200)
     
     if st.button("🔍 Compare Faces", type="primary", use_container_width=True, 
                 disabled=not (st.session_state.get('selfie_uploaded', False) and st.session_state.get('id_uploaded', False))):
+        st.session_state.run = start_application()
         st.session_state.step = 3
         st.rerun()
 
@@ -254,8 +322,8 @@ elif st.session_state.step == 3:
     with col2: st.image(st.session_state.selfie_image, caption="📸 Your Selfie", width=300)
     
     with st.spinner("🔍 Analyzing facial features..."):
-        face_result = compare_faces(st.session_state.id_image, st.session_state.selfie_image)
-        st.session_state.face_results = face_result
+        # Only Leo's stage is awaited; Rex keeps reading documents meanwhile
+        face_result = st.session_state.run.result('leo')
     
     # 🔥 HIDDEN SIMILARITY/DISTANCE - USER SEES ONLY PASS/FAIL
     col1, col2 = st.columns(2)
@@ -271,16 +339,38 @@ elif st.session_state.step == 3:
         st.session_state.step = 4
         st.rerun()
 
-# STEPS 4-6: FAST PROCESSING
+# STEPS 4-6: LIVE PIPELINE PROGRESS
 elif st.session_state.step in [4, 5, 6]:
-    agents = ["🛡 Victor (Risk Analysis)", "📊 Sophia (Credit Scoring)", "🎯 Sage (Final Decision)"]
-    st.header(f"{agents[st.session_state.step-4]}")
-    st.markdown(f'<div class="agent-card {["victor", "sophia", "sage"][st.session_state.step-4]}"><h3>{current_lang_dict["step"].format(st.session_state.step)}</h3></div>', unsafe_allow_html=True)
+    run = st.session_state.run
+    st.header("🛡 Victor → 📊 Sophia → 🎯 Sage")
+    st.markdown(f'<div class="agent-card victor"><h3>{current_lang_dict["step"].format(st.session_state.step)}</h3></div>', unsafe_allow_html=True)
     
-    progress_bar = st.progress(st.session_state.step / 7)
-    time.sleep(1.2)
-    st.session_state.step += 1
-    st.rerun()
+    icons = {'waiting': '⏸', 'running': '⏳', 'done': '✅', 'failed': '❌', 'skipped': '⏭'}
+    progress_bar = st.progress(run.progress())
+    rows = {name: st.empty() for name in run.stages}
+    def render(name):
+        seconds = run.seconds.get(name)
+        timing = f" ({seconds:.2f}s)" if seconds is not None else ""
+        rows[name].markdown(f"{icons[run.status[name]]} **{run.stages[name].label}**{timing}")
+    for name in run.stages:
+        render(name)
+    # Render stage events as they happen; the stages run in the pipeline's pool
+    for event in run.events():
+        render(event['stage'])
+        progress_bar.progress(run.progress())
+    
+    if run.errors:
+        for name, error in run.errors.items():
+            st.error(f"{run.stages[name].label}: {error}")
+        if st.button("🔄 New Application", use_container_width=True):
+            for key in list(st.session_state.keys()):
+                del st.session_state[key]
+            st.rerun()
+    else:
+        st.caption(f"⏱ {run.wall_seconds:.2f}s end to end (critical path {run.critical_path():.2f}s, "
+                   f"{sum(run.seconds.values()):.2f}s of agent work)")
+        st.session_state.step = 7
+        st.rerun()
 
 # 🔥 STEP 7: FINAL RESULTS + WALLET DISBURSAL
 elif st.session_state.step == 7:
@@ -288,19 +378,15 @@ elif st.session_state.step == 7:
     st.markdown(f'<div class="agent-card sage"><h3>{current_lang_dict["step"].format(7)}</h3></div>', unsafe_allow_html=True)
     
     data = st.session_state.user_data
-    face = st.session_state.face_results
+    results = st.session_state.run.wait()
+    face, risk, decision = results['leo'], results['victor'], results['sage']
     wallet = st.session_state.payu_wallet
+    # Wallet account keyed by name + ID document, not the free-text name alone
+    account = account_id(data['name'], st.session_state.id_digest)
     
-    # Credit Score Calculation
-    dti = (data['loan_amount']/60) / data['income'] * 100
-    credit_score = min(1000, 300 + (data['income']/50000)*400 + max(0, 200 - dti*5) + 
-                      (50 if 25<=data['age']<=60 else 0) + face['confidence'])
-    approved = credit_score >= 600 and face['match']
-    
-    rates = {"Personal Loan": 12.5, "Home Loan": 9.5, "Car Loan": 10.5, "Business Loan": 14.0}
-    rate = rates.get(data['loan_type'], 12.5) if approved else 16.0
-    P, r, n = data['loan_amount'], rate/1200, 60
-    emi = P * r * (1+r)**n / ((1+r)**n - 1)
+    dti = risk['dti']
+    credit_score = results['sophia']['credit_score']
+    approved, rate, emi = decision['approved'], decision['rate'], decision['emi']
     
     # METRICS DISPLAY
     col1, col2, col3, col4 = st.columns(4)
@@ -308,6 +394,11 @@ elif st.session_state.step == 7:
     with col2: st.metric(current_lang_dict['dti_ratio'], f"{dti:.1f}%", delta=None)
     with col3: st.metric(current_lang_dict['face_match'], "✅ PASSED" if face['match'] else "❌ FAILED", delta=None)
     with col4: st.metric(current_lang_dict['emi_label'], f"₹{round(emi):,}", delta=None)
+    if st.session_state.run.trace is not None:
+        with st.expander("⏱ Agent timings"):
+            st.json(st.session_state.run.trace.to_dict())
+    if risk['income_verified'] is False:
+        st.warning(f"📄 Documents show ₹{risk['documented_income']:,.0f}/month, not the declared ₹{data['income']:,}")
     
     # FINAL DECISION + WALLET
     if approved:
@@ -322,22 +413,32 @@ elif st.session_state.step == 7:
         
         col1, col2 = st.columns(2)
         with col1:
-            if st.button("💰 Disburse to Wallet", type="primary", use_container_width=True):
-                with st.spinner("🔄 Initiating PayU disbursal..."):
-                    txn = wallet.initiate_disbursal(data['name'], data['loan_amount'])
-                    st.success(f"**{current_lang_dict['payu_txn_id']}:** `{txn['txn_id']}`")
-                    
-                    with st.spinner("🔍 Verifying PayU settlement..."):
-                        settlement = wallet.check_settlement(txn['txn_id'], data['loan_amount'])
-                        
-                        if settlement['status'] == 'settled':
-                            balance = wallet.update_wallet(data['name'], data['loan_amount'])
-                            st.markdown(f'<div class="wallet-success">{current_lang_dict["wallet_updated"]}</div>', unsafe_allow_html=True)
-                            st.balloons()
-                            st.metric(current_lang_dict['wallet_balance'], f"₹{balance:,}", f"+₹{data['loan_amount']:,}")
-                        else:
-                            st.markdown(f'<div class="wallet-pending">{current_lang_dict["settlement_pending"]}</div>', unsafe_allow_html=True)
-                            st.warning("⏳ Funds not yet deposited to merchant wallet")
+            if 'disbursal' not in st.session_state:
+                if st.button("💰 Disburse to Wallet", type="primary", use_container_width=True):
+                    with st.spinner("🔄 Initiating PayU disbursal..."):
+                        st.session_state.disbursal = wallet.initiate_disbursal(account, data['loan_amount'], name=data['name'])
+            
+            if 'disbursal' in st.session_state:
+                txn = st.session_state.disbursal
+                st.success(f"**{current_lang_dict['payu_txn_id']}:** `{txn['txn_id']}`")
+                settlement = wallet.check_settlement(txn['txn_id'], data['loan_amount'])
+                
+                if settlement['status'] == 'settled':
+                    if not txn.get('celebrated'):
+                        txn['celebrated'] = True
+                        st.balloons()
+                    balance = wallet.balance(account)
+                    st.markdown(f'<div class="wallet-success">{current_lang_dict["wallet_updated"]}</div>', unsafe_allow_html=True)
+                    st.metric(current_lang_dict['wallet_balance'], f"₹{balance:,.2f}", f"+₹{data['loan_amount']:,}")
+                elif settlement['status'] == 'pending':
+                    st.markdown(f'<div class="wallet-pending">{current_lang_dict["settlement_pending"]}</div>', unsafe_allow_html=True)
+                    st.warning("⏳ Funds not yet deposited to merchant wallet")
+                    if st.button("🔍 Refresh Settlement Status", use_container_width=True):
+                        st.rerun()
+                elif settlement['status'] == 'unknown':
+                    st.warning(f"⚠️ Transaction {txn['txn_id']} is not known to this session's wallet")
+                else:
+                    st.error(f"❌ PayU settlement {settlement['status']}; funds were not deposited")
                             
     else:
         st.markdown(f"""
@@ -356,9 +457,9 @@ elif st.session_state.step == 7:
 # SIDEBAR - WALLET STATUS
 with st.sidebar:
     st.markdown("### 💰 Wallet Balances")
-    if st.session_state.payu_wallet.wallet_balances:
-        for user, balance in st.session_state.payu_wallet.wallet_balances.items():
-            st.metric(user[:15] + "...", f"₹{balance:,}")
+    if st.session_state.payu_wallet.accounts:
+        for account, user in st.session_state.payu_wallet.accounts.items():
+            st.metric(user[:15] + "...", f"₹{st.session_state.payu_wallet.balance(account):,.2f}")
     else:
         st.info("No wallet transactions yet")
 
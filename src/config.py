@@ -5,9 +5,24 @@ import os
 
 # Base directories
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_PATH = os.path.join(BASE_DIR, "data", "credit_data.csv")
+# Training data, checked in next to the legacy model in the repo-root models/
+DATA_PATH = os.path.join(os.path.dirname(BASE_DIR), "models", "credit_data.csv")
 MODELS_DIR = os.path.join(BASE_DIR, "models")
 MODEL_PATH = os.path.join(MODELS_DIR, "loan_model.pkl")
+TREES_PATH = os.path.join(MODELS_DIR, "loan_model_trees.npz")
+
+# Versioned, pickle-free artifacts: ARTIFACTS_DIR/<version>/manifest.json
+ARTIFACTS_DIR = os.path.join(MODELS_DIR, "artifacts")
+ARTIFACT_FORMAT_VERSION = 1
+
+# Columnar cache of the training CSV (train_model.build_column_cache)
+DATA_CACHE_DIR = os.path.join(BASE_DIR, "data_cache")
+
+# Model registry: resident versions (LRU), artifact polling interval, and the
+# cap on the doubling retry delay for an artifact that failed to load
+REGISTRY_CAPACITY = 3
+REGISTRY_POLL_SECONDS = 30.0
+REGISTRY_RETRY_MAX_SECONDS = 600.0
 
 # Feature order used for both training and inference
 FEATURE_ORDER = [
@@ -21,6 +36,26 @@ FEATURE_ORDER = [
     "existing_loans",
 ]
 
+# Raw application fields accepted by batch scoring (column order for arrays)
+INPUT_FIELDS = [
+    "age",
+    "monthly_income",
+    "loan_amount",
+    "employment_years",
+    "monthly_expenses",
+    "existing_loans",
+]
+
+# Approval cut-off applied to the model's approval probability
+APPROVAL_THRESHOLD = 0.5
+
+# Rows scored per model call in batch mode
+BATCH_CHUNK_SIZE = 65536
+
+# SHAP explanations: adverse-action reasons per row, cached rows per model
+SHAP_TOP_K = 3
+SHAP_CACHE_SIZE = 100_000
+
 # Loan / risk settings
 BASE_INTEREST_RATE = 12.0  # base APR
 RISK_PREMIUM = {
@@ -30,3 +65,129 @@ RISK_PREMIUM = {
     "very_high": 8.0,
 }
 
+
+# Face embedding cache (content-addressed; see face_cache.py): on-disk byte
+# budget (least recently used entries are evicted) and in-memory entries
+FACE_CACHE_DIR = os.path.join(BASE_DIR, "cache", "face_embeddings")
+FACE_CACHE_MAX_BYTES = 64 * 2**20
+FACE_CACHE_SIZE = 4096
+
+# FaceEngine's Haar features are normalised 64x64 face crops (biometric data):
+# cached in memory only, this many entries, unless FACE_FEATURES_PERSIST opts
+# into the on-disk embedding cache above (AIDE_PERSIST_FACES=1)
+FACE_FEATURE_CACHE_SIZE = 256
+FACE_FEATURES_PERSIST = os.environ.get("AIDE_PERSIST_FACES", "0") not in ("", "0")
+
+# Face detection runs on a copy whose longer side is at most this many pixels;
+# encodings are computed on a crop resized so the face is about FACE_ENCODE_SIZE
+FACE_DETECT_MAX_SIDE = 640
+FACE_ENCODE_SIZE = 200
+
+# Document OCR (see ocr_engine.py): raster DPI, Tesseract language, worker
+# processes (None = CPU count) and per-document page / total-pixel caps
+OCR_DPI = 200
+OCR_LANG = "eng"
+OCR_WORKERS = None
+OCR_MAX_PAGES = 50
+OCR_MAX_PIXELS = 200_000_000
+# A PDF page whose text layer has at least this many letters/digits skips OCR
+OCR_MIN_TEXT_CHARS = 25
+# OCR backend held warm in each worker ("tesseract" or "easyocr") and the
+# bound on queued OCR tasks across all documents (submitters block when full)
+OCR_BACKEND = "tesseract"
+OCR_QUEUE_SIZE = 64
+OCR_QUEUE_TIMEOUT = 60.0
+
+# OCR result cache (content-addressed; see ocr_cache.py): on-disk byte budget
+# (least recently used entries are evicted) and in-memory entries
+OCR_CACHE_DIR = os.path.join(BASE_DIR, "cache", "ocr")
+OCR_CACHE_MAX_BYTES = 256 * 2**20
+OCR_CACHE_SIZE = 256
+
+# Payslip / statement field extraction (see doc_fields.py): text lines are
+# found on a copy whose longer side is at most FIELD_DETECT_MAX_SIDE, labels
+# are looked for by OCR of the first FIELD_LABEL_WIDTH line-heights of each
+# line at FIELD_TRIAGE_MAX_SIDE, and only the rows holding a label are OCR'd
+# at full resolution (padded by FIELD_ROW_PAD px)
+FIELD_DETECT_MAX_SIDE = 1000
+FIELD_TRIAGE_MAX_SIDE = 1200
+FIELD_LABEL_WIDTH = 10
+FIELD_ROW_PAD = 6
+
+# PayU settlement polling (see settlement.py): exponential backoff with full
+# jitter from SETTLEMENT_BASE_DELAY up to SETTLEMENT_MAX_DELAY seconds, at most
+# SETTLEMENT_MAX_INFLIGHT gateway calls at once, and a transaction still
+# pending after SETTLEMENT_TIMEOUT seconds is reported as expired. The latest
+# status of up to SETTLEMENT_HISTORY transactions is kept for lookups.
+SETTLEMENT_BASE_DELAY = 0.5
+SETTLEMENT_MAX_DELAY = 4.0
+SETTLEMENT_MAX_INFLIGHT = 256
+SETTLEMENT_TIMEOUT = 120.0
+SETTLEMENT_HISTORY = 10_000
+# Local PayU stub: per-call latency (s), time until a disbursal settles (s),
+# transient error rate per call and the share of disbursals that are declined
+PAYU_STUB_LATENCY = (0.05, 0.3)
+PAYU_STUB_SETTLE_SECONDS = (2.0, 4.0)
+PAYU_STUB_ERROR_RATE = 0.02
+PAYU_STUB_DECLINE_RATE = 0.05
+
+# Wallet ledger (see ledger.py): append-only postings in SQLite (WAL mode).
+# Queued postings are committed together, up to LEDGER_BATCH_SIZE per
+# transaction (group commit); each process reserves LEDGER_ID_BLOCK
+# transaction IDs at a time
+LEDGER_PATH = os.path.join(BASE_DIR, "data", "ledger.db")
+LEDGER_BATCH_SIZE = 4096
+LEDGER_SYNCHRONOUS = "FULL"
+LEDGER_ID_BLOCK = 1000
+
+# A.I.D.E stage pipeline (see pipeline.py): threads running stages concurrently,
+# and the most PDF pages Rex reads per document (it stops sooner once the
+# income is found)
+PIPELINE_WORKERS = 8
+PIPELINE_DOC_MAX_PAGES = 5
+
+# Scoring service (see scoring_service.py). Requests arriving within
+# SERVICE_BATCH_WINDOW seconds of each other are scored in one model call of
+# up to SERVICE_MAX_BATCH rows. Beyond SERVICE_QUEUE_SIZE queued requests, or
+# after SERVICE_MAX_WAIT seconds in the queue, requests are shed with a 503;
+# so is a request whose batch is not scored within SERVICE_SCORE_TIMEOUT more
+# seconds. Bodies over SERVICE_MAX_BODY_BYTES are refused with a 413.
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8600
+SERVICE_BATCH_WINDOW = 0.002
+SERVICE_MAX_BATCH = 256
+SERVICE_QUEUE_SIZE = 4096
+SERVICE_MAX_WAIT = 0.5
+SERVICE_SCORE_TIMEOUT = 5.0
+SERVICE_MAX_BODY_BYTES = 2**20
+SERVICE_TENURE_YEARS = 5
+
+# Instrumentation (see metrics.py). Off unless AIDE_METRICS=1; the sampling
+# profiler (AIDE_PROFILE=1) writes folded stacks of traced applications
+# slower than PROFILE_SLOW_SECONDS to PROFILE_DIR. AIDE_METRICS_PORT serves
+# /metrics in Prometheus text format from processes without their own server,
+# on AIDE_METRICS_HOST (loopback unless set, e.g. 0.0.0.0 for a scraper).
+METRICS_ENABLED = os.environ.get("AIDE_METRICS", "0") not in ("", "0")
+METRICS_PORT = int(os.environ.get("AIDE_METRICS_PORT", "0"))
+METRICS_HOST = os.environ.get("AIDE_METRICS_HOST", "127.0.0.1")
+METRICS_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+PROFILE_ENABLED = os.environ.get("AIDE_PROFILE", "0") not in ("", "0")
+PROFILE_INTERVAL = 0.005
+PROFILE_SLOW_SECONDS = 2.0
+PROFILE_DIR = os.path.join(BASE_DIR, "profiles")
@@ -2,79 +2,250 @@
 Credit scoring utilities: load model, build features, predict, and basic risk logic.
 """
 import os
-import pickle
+import threading
+from collections import OrderedDict
 import numpy as np
 import pandas as pd
 
-from config import FEATURE_ORDER, MODEL_PATH, BASE_INTEREST_RATE, RISK_PREMIUM
+import metrics
+from config import (
+    FEATURE_ORDER,
+    TREES_PATH,
+    BASE_INTEREST_RATE,
+    RISK_PREMIUM,
+    APPROVAL_THRESHOLD,
+    BATCH_CHUNK_SIZE,
+    SHAP_TOP_K,
+    SHAP_CACHE_SIZE,
+)
+from features import compute_features, feature_row, input_columns
+from model_registry import ModelRegistry
 
 # Cache for loaded artifacts
-_MODEL = None
+_REGISTRY = None
+_REGISTRY_LOCK = threading.Lock()
+_TREES = None
 
 
-def load_model():
-    """Load the trained model from disk (cached after first load)."""
-    global _MODEL
-    if _MODEL is None:
-        if not os.path.exists(MODEL_PATH):
+def get_registry():
+    """Process-wide ModelRegistry (created on first use)."""
+    global _REGISTRY
+    if _REGISTRY is None:
+        with _REGISTRY_LOCK:
+            if _REGISTRY is None:
+                _REGISTRY = ModelRegistry()
+    return _REGISTRY
+
+
+def get_model(version=None):
+    """ModelEntry for `version` (default: current champion)."""
+    return get_registry().get(version)
+
+
+@metrics.timed("scoring.load_model")
+def load_model(path=None):
+    """
+    Load the trained model (cached in the registry after first load).
+    Uses the champion: the newest artifact under ARTIFACTS_DIR, or the legacy
+    pickle at MODEL_PATH. If `path` is given, that artifact/pickle is loaded
+    and promoted to champion.
+    """
+    if path is not None:
+        return get_registry().load(path, promote=True).model
+    return get_model().model
+
+
+def get_model_manifest(version=None):
+    """Manifest of a loaded model version (default: champion)."""
+    return get_model(version).manifest
+
+
+def preload_model_async(watch=False):
+    """
+    Start loading the model in a daemon thread at process start, so the first
+    request finds it warm. Errors are left for the request path to surface.
+    With watch=True the registry then keeps polling for new artifacts.
+    """
+
+    def _preload():
+        try:
+            get_registry().refresh()
+        except Exception:
+            pass
+        if watch:
+            get_registry().start_watching()
+
+    thread = threading.Thread(target=_preload, name="model-preload", daemon=True)
+    thread.start()
+    return thread
+
+
+class TreeEnsemble:
+    """
+    Pure-NumPy evaluator for the node arrays written by train_model.export_trees.
+    Scores batches without importing xgboost; predict_proba mirrors XGBClassifier.
+    """
+
+    FIELDS = (
+        "feature", "threshold", "left", "right", "missing", "value",
+        "roots", "depth", "base_margin",
+    )
+
+    def __init__(
+        self, feature, threshold, left, right, missing, value, roots, depth, base_margin
+    ):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing = missing
+        self.value = value
+        self.roots = roots
+        self.depth = int(depth)
+        self.base_margin = float(base_margin)
+
+    @classmethod
+    def load(cls, path=TREES_PATH):
+        with np.load(path) as data:
+            if list(data["features"]) != FEATURE_ORDER:
+                raise ValueError(
+                    f"Tree arrays in {path} were exported for features "
+                    f"{list(data['features'])}, expected {FEATURE_ORDER}"
+                )
+            return cls(*(data[k] for k in cls.FIELDS))
+
+    def predict_margin(self, X, chunk_size=1024):
+        """Raw margin (log-odds) for an (n, 8) matrix in FEATURE_ORDER."""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_cols = X.shape
+        margin = np.empty(n_rows, dtype=np.float64)
+        for start in range(0, n_rows, chunk_size):
+            chunk = X[start : start + chunk_size]
+            flat = chunk.ravel()
+            # Offset of each row in `flat`; all trees of a row are walked in lockstep
+            row_base = (np.arange(chunk.shape[0], dtype=np.int32) * n_cols)[:, None]
+            node = np.repeat(self.roots[None, :], chunk.shape[0], axis=0)
+            for _ in range(self.depth):
+                x = flat.take(row_base + self.feature.take(node))
+                go_left = x < self.threshold.take(node)
+                split = np.where(go_left, self.left.take(node), self.right.take(node))
+                node = np.where(np.isnan(x), self.missing.take(node), split)
+            margin[start : start + chunk_size] = self.value.take(node).sum(axis=1)
+        return margin + self.base_margin
+
+    def predict_proba(self, X):
+        p = 1.0 / (1.0 + np.exp(-self.predict_margin(X)))
+        return np.column_stack([1.0 - p, p])
+
+
+def load_tree_ensemble():
+    """Load the exported tree arrays (cached after first load)."""
+    global _TREES
+    if _TREES is None:
+        if not os.path.exists(TREES_PATH):
             raise FileNotFoundError(
-                f"Model not found at {MODEL_PATH}. Train and save the model first."
+                f"Tree arrays not found at {TREES_PATH}. "
+                "Run `python train_model.py --export-trees` first."
             )
-        with open(MODEL_PATH, "rb") as f:
-            obj = pickle.load(f)
-        # Support both raw model or dict {"model": model, "features": ...}
-        _MODEL = obj.get("model") if isinstance(obj, dict) else obj
-    return _MODEL
+        _TREES = TreeEnsemble.load(TREES_PATH)
+    return _TREES
 
 
+@metrics.timed("scoring.compute_features")
 def _compute_features(app):
-    """Compute derived features from raw application data."""
-    income = float(app.get("monthly_income", 0))
-    loan_amount = float(app.get("loan_amount", 0))
-    monthly_expenses = float(app.get("monthly_expenses", income * 0.5))
-    age = float(app.get("age", 0))
-    employment_years = float(app.get("employment_years", 0))
-    existing_loans = float(app.get("existing_loans", 0))
-
-    debt_to_income = (monthly_expenses / income * 100) if income > 0 else 100.0
-    loan_to_income = (loan_amount / (income * 12) * 100) if income > 0 else 999.0
-    employment_stability = (employment_years / age) if age > 0 else 0.0
-
-    # Build feature dict in expected order
-    features = {
-        "age": age,
-        "monthly_income": income,
-        "loan_amount": loan_amount,
-        "employment_years": employment_years,
-        "debt_to_income": debt_to_income,
-        "loan_to_income": loan_to_income,
-        "employment_stability": employment_stability,
-        "existing_loans": existing_loans,
-    }
-    return features
+    """Compute derived features from raw application data (shared features kernel)."""
+    return feature_row(app)
 
 
-def predict_loan_approval(app_data):
+def predict_loan_approval(app_data, version=None):
     """
-    Predict approval using the trained model.
-    Returns dict: approved (bool), approval_probability, features_used.
+    Predict approval using the trained model (`version`, default champion).
+    Returns dict: approved (bool), approval_probability, features_used, model_version.
     """
     try:
-        model = load_model()
+        entry = get_model(version)
+        model = entry.model
         feat = _compute_features(app_data)
         row = pd.DataFrame([[feat[c] for c in FEATURE_ORDER]], columns=FEATURE_ORDER)
-        proba = model.predict_proba(row)[0]
-        pred = model.predict(row)[0]
+        with metrics.timer("scoring.predict_proba"):
+            proba = model.predict_proba(row)[0]
         prob_approve = float(proba[1]) if len(proba) > 1 else float(proba[0])
         return {
-            "approved": bool(pred),
+            "approved": prob_approve > APPROVAL_THRESHOLD,
             "approval_probability": prob_approve,
             "rejection_probability": 1.0 - prob_approve,
             "features_used": feat,
             "method": "model",
+            "model_version": entry.version,
         }
     except Exception:
         # Fallback: simple rule-based decision
+        metrics.count("scoring.rule_based_fallback")
+        return predict_rule_based(app_data)
+
+
+class FastScorer:
+    """
+    Low-latency single-application scorer.
+    Writes features into a reusable float32 row in FEATURE_ORDER (one per thread)
+    and calls the booster's inplace_predict, so no DataFrame or DMatrix is built
+    and the trees are walked once per request.
+    """
+
+    def __init__(self, model=None, threshold=APPROVAL_THRESHOLD, version=None):
+        model = load_model() if model is None else model
+        self.booster = model.get_booster() if hasattr(model, "get_booster") else model
+        self.threshold = threshold
+        self.version = version
+        self._local = threading.local()
+
+    def _buffer(self):
+        buf = getattr(self._local, "buf", None)
+        if buf is None:
+            buf = np.zeros((1, len(FEATURE_ORDER)), dtype=np.float32)
+            self._local.buf = buf
+        return buf
+
+    def predict_proba(self, feat):
+        """Approval probability for a feature dict from _compute_features."""
+        buf = self._buffer()
+        row = buf[0]
+        for i, name in enumerate(FEATURE_ORDER):
+            row[i] = feat[name]
+        with metrics.timer("scoring.predict_proba"):
+            return float(self.booster.inplace_predict(buf)[0])
+
+    def predict(self, app_data, threshold=None):
+        """Same result dict as predict_loan_approval."""
+        feat = _compute_features(app_data)
+        prob = self.predict_proba(feat)
+        cutoff = self.threshold if threshold is None else threshold
+        return {
+            "approved": prob > cutoff,
+            "approval_probability": prob,
+            "rejection_probability": 1.0 - prob,
+            "features_used": feat,
+            "method": "model_fast",
+            "model_version": self.version,
+        }
+
+
+def predict_loan_approval_fast(app_data, threshold=APPROVAL_THRESHOLD, version=None):
+    """
+    Latency-oriented variant of predict_loan_approval for interactive requests.
+    The scorer is cached on the model entry, so a model swap replaces it too.
+    Falls back to the rule-based decision if the model cannot be loaded.
+    """
+    try:
+        entry = get_model(version)
+        scorer = entry.cache.get("fast_scorer")
+        if scorer is None:
+            scorer = entry.cache["fast_scorer"] = FastScorer(
+                entry.model, version=entry.version
+            )
+        return scorer.predict(app_data, threshold=threshold)
+    except Exception:
+        metrics.count("scoring.rule_based_fallback")
         return predict_rule_based(app_data)
 
 
@@ -121,6 +292,7 @@ def predict_rule_based(app):
         "rejection_probability": 1.0 - prob,
         "features_used": feat,
         "method": "rule_based",
+        "model_version": None,
     }
 
 
@@ -156,23 +328,153 @@ def calculate_emi(loan_amount, annual_rate, tenure_years):
     return round(emi, 2)
 
 
+# Result rows returned by predict_loan_approval_batch
+BATCH_RESULT_DTYPE = np.dtype(
+    [("approved", "?"), ("probability", "f8"), ("risk_level", "U9")]
+)
+
+
+def _rule_based_scores(X):
+    """Vectorised predict_rule_based score on an (n, 8) FEATURE_ORDER matrix."""
+    f = {c: X[:, i] for i, c in enumerate(FEATURE_ORDER)}
+    income = f["monthly_income"]
+    dti = f["debt_to_income"]
+    score = np.select(
+        [income >= 50000, income >= 30000, income >= 20000], [0.3, 0.2, 0.1], 0.0
+    )
+    score += np.where((f["age"] >= 25) & (f["age"] <= 60), 0.2, 0.0)
+    score += np.select([dti < 40, dti < 60], [0.2, 0.1], 0.0)
+    score += np.where(f["employment_years"] >= 2, 0.2, 0.0)
+    score += np.where(f["loan_to_income"] < 200, 0.1, 0.0)
+    score -= np.where(f["existing_loans"] > 2, 0.1, 0.0)
+    return np.clip(score, 0.0, 1.0), score >= 0.5
+
+
+def _risk_levels_batch(prob, dti):
+    """Vectorised calculate_risk_level."""
+    return np.select(
+        [(prob >= 0.8) & (dti < 40), (prob >= 0.6) & (dti < 60), prob >= 0.4],
+        ["low", "medium", "high"],
+        "very_high",
+    )
+
+
+def predict_loan_approval_batch(
+    apps, chunk_size=BATCH_CHUNK_SIZE, model=None, version=None
+):
+    """
+    Score many applications at once.
+    apps: list of dicts, a DataFrame, or an (n, 6) array in INPUT_FIELDS order.
+    Returns a structured array (BATCH_RESULT_DTYPE): approved, probability, risk_level.
+    The model (default: registry `version`, champion if None; a TreeEnsemble
+    also works) is called once per chunk of `chunk_size` rows; if it cannot be
+    loaded the rule-based fallback is applied to the whole batch.
+    """
+    X = compute_features(input_columns(apps))
+    n = X.shape[0]
+    out = np.empty(n, dtype=BATCH_RESULT_DTYPE)
+    if n == 0:
+        return out
+
+    try:
+        model = get_model(version).model if model is None else model
+        prob = np.empty(n, dtype=np.float64)
+        Xf = X.astype(np.float32)
+        for start in range(0, n, chunk_size):
+            with metrics.timer("scoring.predict_proba_batch"):
+                proba = model.predict_proba(Xf[start : start + chunk_size])
+            col = 1 if proba.shape[1] > 1 else 0
+            prob[start : start + chunk_size] = proba[:, col]
+        approved = prob > APPROVAL_THRESHOLD
+    except Exception:
+        metrics.count("scoring.rule_based_fallback", n)
+        prob, approved = _rule_based_scores(X)
+
+    dti = X[:, FEATURE_ORDER.index("debt_to_income")]
+    out["approved"] = approved
+    out["probability"] = prob
+    out["risk_level"] = _risk_levels_batch(prob, dti)
+    return out
+
+
+def _shap_rows(entry, X, use_cache=True):
+    """
+    SHAP values (n, 8) for FEATURE_ORDER rows, in log-odds of approval.
+    The TreeExplainer and a per-row result cache (keyed by the float32 feature
+    vector) live in the model entry's cache, so they are dropped with the model.
+    """
+    import shap
+
+    explainer = entry.cache.get("shap_explainer")
+    if explainer is None:
+        explainer = entry.cache["shap_explainer"] = shap.TreeExplainer(entry.model)
+    lock = entry.cache.setdefault("shap_lock", threading.Lock())
+    results = entry.cache.setdefault("shap_results", OrderedDict())
+
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    out = np.empty(X.shape, dtype=np.float32)
+    keys = [row.tobytes() for row in X]
+    todo = []
+    with lock:
+        for i, key in enumerate(keys):
+            hit = results.get(key) if use_cache else None
+            if hit is None:
+                todo.append(i)
+            else:
+                results.move_to_end(key)
+                out[i] = hit
+
+    if todo:
+        vals = explainer.shap_values(X[todo])
+        if isinstance(vals, list):
+            vals = vals[1]  # positive class
+        out[todo] = vals
+        if use_cache:
+            with lock:
+                for i in todo:
+                    results[keys[i]] = out[i].copy()
+                while len(results) > SHAP_CACHE_SIZE:
+                    results.popitem(last=False)
+    return out
+
+
+def explain_batch(apps, top_k=SHAP_TOP_K, version=None, use_cache=True):
+    """
+    Adverse-action reasons for many applications with one shap_values call.
+    apps: same inputs as predict_loan_approval_batch.
+    Returns a dict of compact arrays:
+      reason_codes  (n, top_k) int8   indices into FEATURE_ORDER, most adverse first;
+                                      -1 where fewer than top_k features pushed
+                                      towards rejection
+      contributions (n, top_k) float32 matching SHAP values (negative = adverse)
+    """
+    entry = get_model(version)
+    X = compute_features(input_columns(apps))
+    vals = _shap_rows(entry, X, use_cache=use_cache)
+    k = min(top_k, len(FEATURE_ORDER))
+    order = np.argsort(vals, axis=1)[:, :k]
+    contrib = np.take_along_axis(vals, order, axis=1)
+    adverse = contrib < 0
+    return {
+        "reason_codes": np.where(adverse, order, -1).astype(np.int8),
+        "contributions": np.where(adverse, contrib, 0.0).astype(np.float32),
+        "feature_names": list(FEATURE_ORDER),
+        "model_version": entry.version,
+        "method": "shap",
+    }
+
+
 def get_shap_explanation(app_data):
     """
     Optional SHAP explanation. Requires shap installed.
     Returns a dict with feature_importance if successful; otherwise a fallback message.
     """
     try:
-        import shap
-
-        model = load_model()
+        entry = get_model()
         feat = _compute_features(app_data)
-        row = pd.DataFrame([[feat[c] for c in FEATURE_ORDER]], columns=FEATURE_ORDER)
-        explainer = shap.TreeExplainer(model)
-        shap_vals = explainer.shap_values(row)
-        if isinstance(shap_vals, list):
-            shap_vals = shap_vals[1]  # positive class
-        importance = dict(zip(FEATURE_ORDER, shap_vals[0]))
+        row = np.array([[feat[c] for c in FEATURE_ORDER]])
+        shap_vals = _shap_rows(entry, row)
+        importance = dict(zip(FEATURE_ORDER, shap_vals[0].tolist()))
         return {"feature_importance": importance, "method": "shap"}
     except Exception as e:
         return {"message": f"SHAP not available: {e}", "method": "fallback"}
-
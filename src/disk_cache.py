@@ -0,0 +1,143 @@
+"""
+Content-addressed store shared by face_cache and ocr_cache.
+
+An in-memory LRU sits in front of an on-disk store that is bounded by
+max_bytes; the least recently used files are evicted first. Files live at
+<cache_dir>/<key[:2]>/<key><suffix> and are written then renamed, so readers
+never see a partial file. The size index is rebuilt from the directory
+(mtime order) on start-up and assumes one process writes the directory.
+
+Subclasses only choose the file suffix and how values are serialised.
+"""
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class DiskLRUCache:
+    """Memory LRU over a size-bounded on-disk LRU; cache_dir=None is memory only."""
+
+    suffix = ".bin"
+
+    def __init__(self, cache_dir: Optional[str], capacity: int, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self._memory: "OrderedDict[str, Any]" = OrderedDict()
+        self._disk: "OrderedDict[str, int]" = OrderedDict()  # key -> file size
+        self.disk_bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if cache_dir is not None:
+            self._scan()
+
+    # --- serialisation (per cache) ------------------------------------------#
+
+    def dumps(self, value: Any) -> bytes:
+        raise NotImplementedError
+
+    def loads(self, payload: bytes) -> Any:
+        raise NotImplementedError
+
+    # --- store --------------------------------------------------------------#
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + self.suffix)
+
+    def _scan(self) -> None:
+        """Rebuild the disk index, oldest first, from an existing directory."""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(self.suffix):
+                    st = os.stat(os.path.join(root, name))
+                    entries.append((st.st_mtime, name[: -len(self.suffix)], st.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self.disk_bytes += size
+
+    def _remember(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.capacity:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Cached value or None; files are read outside the lock."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+            on_disk = key in self._disk
+        if on_disk:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    value = self.loads(f.read())
+                os.utime(path)  # keeps LRU order across restarts
+            except (OSError, ValueError):
+                with self._lock:
+                    if key in self._disk:
+                        self.disk_bytes -= self._disk.pop(key)
+            else:
+                with self._lock:
+                    if key in self._disk:
+                        self._disk.move_to_end(key)
+                    self.disk_hits += 1
+                self._remember(key, value)
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: Any) -> None:
+        """Store `value`; the file is written outside the lock."""
+        self._remember(key, value)
+        if self.cache_dir is None:
+            return
+        payload = self.dumps(value)
+        if len(payload) > self.max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+        with self._lock:
+            self.disk_bytes += len(payload) - self._disk.pop(key, 0)
+            self._disk[key] = len(payload)
+            evicted = []
+            while self.disk_bytes > self.max_bytes:
+                old, size = self._disk.popitem(last=False)
+                self.disk_bytes -= size
+                self.evictions += 1
+                evicted.append(old)
+        for old in evicted:
+            try:
+                os.remove(self._path(old))
+            except OSError:
+                pass
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self.disk_bytes,
+                "max_bytes": self.max_bytes,
+                "resident": len(self._memory),
+            }
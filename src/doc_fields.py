@@ -0,0 +1,233 @@
+"""
+Structured fields (net salary, employer, account number) from payslips and
+bank statements, in a form credit_scoring accepts.
+
+OCR of a whole page at full resolution is the expensive part, so images go
+through a layout pass first. A morphology pass on a downscaled copy finds
+the text lines. One low-resolution OCR pass over the start of each line
+(stacked into a narrow strip) finds the ones with a field label. Only those
+rows are OCR'd again at full resolution, one line each. parse_fields() reads
+the fields from any text (ROI rows, full-page OCR or a PDF text layer) with
+one precompiled pattern set.
+"""
+import bisect
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from config import (
+    FIELD_DETECT_MAX_SIDE,
+    FIELD_LABEL_WIDTH,
+    FIELD_ROW_PAD,
+    FIELD_TRIAGE_MAX_SIDE,
+)
+
+Box = Tuple[int, int, int, int]  # x, y, w, h
+
+# --- Parsing ---------------------------------------------------------------- #
+
+# Amount fields capture the rest of the label's line; the value is the first
+# plausible amount after the label (see parse_amount), so dates and
+# references around it are skipped: "Net Pay (March 2024): 72,315.50" and
+# "Net Pay Rs. 72,315.50 for March 2024" both read 72315.5
+AMOUNT = re.compile(
+    r"(?P<currency>(?:rs\.?|inr|₹)\s*)?"
+    r"(?<![0-9,])(?P<number>[0-9]+(?:,[0-9]{2,3})*(?:\.[0-9]{1,2})?)(?![0-9])",
+    re.I,
+)
+# Without a currency marker or digit grouping, a bare number is only taken
+# as an amount in this range, and never if it looks like a year
+BARE_AMOUNT_RANGE = (1000, 10**8)
+YEARS = range(1900, 2101)
+
+FIELD_PATTERNS = {
+    "net_salary": re.compile(
+        r"\b(?:net\s*(?:pay|salary|amount|income)|take[\s-]*home(?:\s*pay)?)"
+        r"([^\n]*)",
+        re.I,
+    ),
+    "gross_salary": re.compile(
+        r"\b(?:gross\s*(?:pay|salary|earnings|income)|total\s*earnings)([^\n]*)",
+        re.I,
+    ),
+    "employer": re.compile(
+        r"\b(?:employer|company)(?:\s*name)?\s*[:\-]\s*(\S[^\n]*?)\s*$", re.I | re.M
+    ),
+    "account_number": re.compile(
+        r"\b(?:a/?c|account)(?:\s*(?:no\.?|number|#))?\s*[:\-]?\s*"
+        r"([0-9Xx*][0-9Xx* \-]{4,22}[0-9])",
+        re.I,
+    ),
+}
+AMOUNT_FIELDS = ("net_salary", "gross_salary")
+# Any line matching this is worth a full-resolution read
+FIELD_LABELS = re.compile(
+    r"\b(?:net|take\s*home|gross|earning|salary|employer|company|a/?c|account)\b",
+    re.I,
+)
+
+
+def parse_amount(text: str) -> Optional[float]:
+    """
+    First plausible amount in `text` ("Rs. 1,20,000.00" -> 120000.0), or
+    None: one with a currency marker, digit grouping or paise, or a bare
+    number in BARE_AMOUNT_RANGE that is not a year.
+    """
+    for match in AMOUNT.finditer(text):
+        number = match.group("number")
+        value = float(number.replace(",", ""))
+        if match.group("currency") or "," in number or "." in number:
+            return value
+        low, high = BARE_AMOUNT_RANGE
+        if low <= value < high and int(value) not in YEARS:
+            return value
+    return None
+
+
+def parse_fields(text: str) -> Dict[str, object]:
+    """Fields found in `text` (first match of each); missing fields are omitted."""
+    fields: Dict[str, object] = {}
+    for name, pattern in FIELD_PATTERNS.items():
+        match = pattern.search(text)
+        if match is None:
+            continue
+        value = match.group(1).strip()
+        if name in AMOUNT_FIELDS:
+            value = parse_amount(value)
+        elif name == "account_number":
+            value = re.sub(r"[\s\-]", "", value)
+        if value:
+            fields[name] = value
+    return fields
+
+
+def application_fields(fields: Dict[str, object]) -> Dict[str, float]:
+    """The credit_scoring inputs the document supports (monthly_income)."""
+    income = fields.get("net_salary") or fields.get("gross_salary")
+    return {"monthly_income": float(income)} if income else {}
+
+
+def join_pages(results: Iterable[Dict[str, object]]) -> str:
+    """Document text in page order from OcrEngine.iter_pdf() results."""
+    by_page = {r["page"]: r["text"] for r in results}
+    return "\n".join(by_page[p] for p in sorted(by_page))
+
+
+# --- Layout ----------------------------------------------------------------- #
+
+def _scaled(gray: np.ndarray, max_side: int) -> Tuple[np.ndarray, float]:
+    scale = min(1.0, max_side / max(gray.shape))
+    if scale == 1.0:
+        return gray, scale
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return small, scale
+
+
+def union_boxes(boxes: Iterable[Box]) -> Box:
+    boxes = list(boxes)
+    x0 = min(b[0] for b in boxes)
+    y0 = min(b[1] for b in boxes)
+    x1 = max(b[0] + b[2] for b in boxes)
+    y1 = max(b[1] + b[3] for b in boxes)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def find_text_lines(
+    gray: np.ndarray, max_side: int = FIELD_DETECT_MAX_SIDE
+) -> List[Box]:
+    """
+    Text-line boxes at full resolution, top to bottom. Characters are smeared
+    horizontally on a downscaled, inverted Otsu mask (a 1 px tall kernel, so
+    lines never merge) and each connected component is one word group.
+    """
+    small, scale = _scaled(gray, max_side)
+    _, ink = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    gap = max(small.shape[1] // 80, 3)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (gap, 1))
+    merged = cv2.morphologyEx(ink, cv2.MORPH_CLOSE, kernel)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(merged, connectivity=8)
+    height, width = gray.shape
+    max_h = small.shape[0] // 12  # taller blobs are logos, photos or stamps
+    lines = []
+    for x, y, w, h, area in stats[1:]:
+        if h < 3 or h > max_h or area < 8:
+            continue
+        x0 = max(int(x / scale) - FIELD_ROW_PAD, 0)
+        y0 = max(int(y / scale) - FIELD_ROW_PAD, 0)
+        x1 = min(int((x + w) / scale) + FIELD_ROW_PAD, width)
+        y1 = min(int((y + h) / scale) + FIELD_ROW_PAD, height)
+        lines.append((x0, y0, x1 - x0, y1 - y0))
+    return sorted(lines, key=lambda b: (b[1], b[0]))
+
+
+def label_rows(lines: List[Box], spans: Iterable[Tuple[float, float]]) -> List[Box]:
+    """
+    One box per labelled row: the union of every line box crossing the middle
+    of each (y0, y1) span, so a label and its right-aligned value stay together.
+    """
+    rows = []
+    for y0, y1 in spans:
+        mid = (y0 + y1) / 2
+        row = [b for b in lines if b[1] <= mid <= b[1] + b[3]]
+        if row:
+            rows.append(union_boxes(row))
+    return list(dict.fromkeys(rows))
+
+
+def label_strip(
+    gray: np.ndarray, lines: List[Box]
+) -> Tuple[np.ndarray, List[int]]:
+    """
+    The start of every line (at most FIELD_LABEL_WIDTH line-heights, where
+    labels sit) stacked into one narrow image, at triage resolution. Returns
+    the strip and the top row of each line in it.
+    """
+    small, scale = _scaled(gray, FIELD_TRIAGE_MAX_SIDE)
+    crops = []
+    for x, y, w, h in lines:
+        x0, y0, h0 = int(x * scale), int(y * scale), max(int(h * scale), 1)
+        w0 = min(int(w * scale), FIELD_LABEL_WIDTH * h0)
+        crops.append(small[y0 : y0 + h0, x0 : x0 + w0])
+    gap = max(int(np.median([c.shape[0] for c in crops])) // 2, 2)
+    height = sum(c.shape[0] + gap for c in crops) + gap
+    width = max(c.shape[1] for c in crops) + 2 * gap
+    strip = np.full((height, width), 255, np.uint8)
+    tops, y = [], gap
+    for crop in crops:
+        strip[y : y + crop.shape[0], gap : gap + crop.shape[1]] = crop
+        tops.append(y)
+        y += crop.shape[0] + gap
+    return strip, tops
+
+
+def extract_fields(img: np.ndarray, backend) -> Dict[str, object]:
+    """
+    Fields from a page image, OCR'ing only the labelled rows at full size.
+    `backend` is an ocr_engine backend (read_lines / read_line).
+    Returns {"fields", "text" (the rows read), "lines", "rows"}.
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    lines = find_text_lines(gray)
+    result: Dict[str, object] = {"fields": {}, "text": "", "lines": len(lines)}
+    if not lines:
+        return {**result, "rows": 0}
+
+    # One low-resolution OCR call over the line starts finds the labelled lines
+    strip, tops = label_strip(gray, lines)
+    spans = []
+    for text, (x, y, w, h) in backend.read_lines(Image.fromarray(strip)):
+        if FIELD_LABELS.search(text):
+            line = lines[max(bisect.bisect_right(tops, y + h // 2) - 1, 0)]
+            spans.append((line[1], line[1] + line[3]))
+
+    texts = []
+    rows = label_rows(lines, spans)
+    for x, y, w, h in rows:
+        crop = gray[y : y + h, x : x + w]
+        _, crop = cv2.threshold(crop, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+        texts.append(backend.read_line(Image.fromarray(crop)).strip())
+    text = "\n".join(texts)
+    return {**result, "fields": parse_fields(text), "text": text, "rows": len(rows)}
@@ -0,0 +1,89 @@
+"""
+Content-addressed cache for face embeddings.
+
+Entries are keyed by sha256(detector model name + image bytes), so the same
+photo is only detected/encoded once no matter how often it is re-verified.
+A "no face" result is cached too, as an empty array. Values are stored as
+.npy files in a DiskLRUCache (see disk_cache.py).
+"""
+import hashlib
+import io
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from config import FACE_CACHE_DIR, FACE_CACHE_MAX_BYTES, FACE_CACHE_SIZE
+from disk_cache import DiskLRUCache
+
+
+class EmbeddingCache(DiskLRUCache):
+    """Embedding store; cache_dir=None is memory only."""
+
+    suffix = ".npy"
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = FACE_CACHE_DIR,
+        capacity: int = FACE_CACHE_SIZE,
+        max_bytes: int = FACE_CACHE_MAX_BYTES,
+    ):
+        super().__init__(cache_dir, capacity, max_bytes)
+        self.compute_seconds = 0.0
+
+    @staticmethod
+    def key(image_bytes: bytes, model: str) -> str:
+        h = hashlib.sha256(model.encode())
+        h.update(b"\0")
+        h.update(image_bytes)
+        return h.hexdigest()
+
+    def dumps(self, encoding: np.ndarray) -> bytes:
+        buf = io.BytesIO()
+        np.save(buf, encoding)
+        return buf.getvalue()
+
+    def loads(self, payload: bytes) -> np.ndarray:
+        return np.load(io.BytesIO(payload))
+
+    def put(self, key: str, encoding: np.ndarray) -> None:
+        super().put(key, np.asarray(encoding))
+
+    def get_or_compute(
+        self, image_bytes: bytes, model: str, compute: Callable[[], np.ndarray]
+    ) -> np.ndarray:
+        """Return the cached encoding for these bytes, running `compute` on a miss."""
+        key = self.key(image_bytes, model)
+        encoding = self.get(key)
+        if encoding is None:
+            t0 = time.perf_counter()
+            encoding = np.asarray(compute())
+            with self._lock:
+                self.compute_seconds += time.perf_counter() - t0
+            self.put(key, encoding)
+        return encoding
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters and the detector time the hits are estimated to save."""
+        stats = super().stats()
+        with self._lock:
+            avg_compute = self.compute_seconds / self.misses if self.misses else 0.0
+            hits = self.memory_hits + self.disk_hits
+            stats["compute_seconds"] = round(self.compute_seconds, 4)
+            stats["estimated_saved_seconds"] = round(hits * avg_compute, 4)
+        return stats
+
+
+_DEFAULT_CACHE: Optional[EmbeddingCache] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Process-wide cache (created on first use)."""
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        with _DEFAULT_LOCK:
+            if _DEFAULT_CACHE is None:
+                _DEFAULT_CACHE = EmbeddingCache()
+    return _DEFAULT_CACHE
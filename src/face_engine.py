@@ -0,0 +1,136 @@
+"""
+Haar-cascade face pipeline used by the Streamlit app (A.I.D.E.py).
+
+FaceEngine loads the cascade once and is meant to be shared by every session
+in the process: detection runs on a bounded-size copy of the frame, and the
+64x64 face features are cached under the upload's digest. The features are
+face crops, so the cache is memory-only unless persisting is opted into
+(config.FACE_FEATURES_PERSIST).
+"""
+import threading
+import time
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+import metrics
+from config import (
+    FACE_DETECT_MAX_SIDE,
+    FACE_FEATURE_CACHE_SIZE,
+    FACE_FEATURES_PERSIST,
+)
+from face_cache import EmbeddingCache, get_embedding_cache
+
+CASCADE_FILE = "haarcascade_frontalface_default.xml"
+FEATURE_SIZE = 64
+# compare(): feature distance below which two faces match
+MATCH_DISTANCE = 15.0
+
+
+class FaceEngine:
+    def __init__(
+        self,
+        cascade_path: Optional[str] = None,
+        max_side: int = FACE_DETECT_MAX_SIDE,
+        cache: Optional[EmbeddingCache] = None,
+        persist: bool = FACE_FEATURES_PERSIST,
+    ):
+        t0 = time.perf_counter()
+        self.cascade_path = cascade_path or cv2.data.haarcascades + CASCADE_FILE
+        self.cascade = cv2.CascadeClassifier(self.cascade_path)
+        if self.cascade.empty():
+            raise RuntimeError(f"Could not load Haar cascade: {self.cascade_path}")
+        self.load_seconds = time.perf_counter() - t0
+        self.max_side = max_side
+        if cache is None:
+            cache = (
+                get_embedding_cache()
+                if persist
+                else EmbeddingCache(cache_dir=None, capacity=FACE_FEATURE_CACHE_SIZE)
+            )
+        self.cache = cache
+        # CascadeClassifier is not safe to share between threads mid-detection
+        self._lock = threading.Lock()
+
+    def _detect(self, gray: np.ndarray):
+        with self._lock, metrics.timer("face.detect"):
+            return self.cascade.detectMultiScale(gray, 1.3, 5)
+
+    def detect_features(self, img: np.ndarray) -> np.ndarray:
+        """
+        Normalised 64x64 grayscale crop of the largest face, flattened
+        (empty array if no face). Detection runs on a copy whose longer side
+        is at most max_side; the full frame is only scanned as a fallback.
+        """
+        gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+        scale = max(gray.shape) / self.max_side
+        faces = ()
+        if scale > 1:
+            small = cv2.resize(
+                gray, None, fx=1 / scale, fy=1 / scale, interpolation=cv2.INTER_AREA
+            )
+            faces = [
+                np.round(np.asarray(f) * scale).astype(int) for f in self._detect(small)
+            ]
+        if len(faces) == 0:
+            faces = self._detect(gray)
+        if len(faces) == 0:
+            return np.empty(0, dtype=np.float32)
+        x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+        face = cv2.resize(
+            gray[y : y + h, x : x + w],
+            (FEATURE_SIZE, FEATURE_SIZE),
+            interpolation=cv2.INTER_AREA,
+        )
+        return face.flatten().astype(np.float32) / 255.0
+
+    def features(self, image, digest: Optional[str] = None) -> Optional[np.ndarray]:
+        """
+        Face features of a PIL image or RGB array; None if no face. Cached
+        under `digest` (e.g. sha256 of the uploaded file) when one is given;
+        otherwise computed without touching the cache.
+        """
+        if digest is None:
+            features = self.detect_features(np.asarray(image))
+        else:
+            features = self.cache.get_or_compute(
+                digest.encode(),
+                f"haar{FEATURE_SIZE}@{self.max_side}",
+                lambda: self.detect_features(np.asarray(image)),
+            )
+        return None if features.size == 0 else features
+
+    @metrics.timed("face.compare")
+    def compare(
+        self,
+        id_image,
+        selfie_image,
+        id_digest: Optional[str] = None,
+        selfie_digest: Optional[str] = None,
+    ) -> Dict[str, object]:
+        id_features = self.features(id_image, id_digest)
+        selfie_features = self.features(selfie_image, selfie_digest)
+        if id_features is None or selfie_features is None:
+            return {"match": False, "confidence": 0, "error": "No face detected"}
+        distance = float(np.sqrt(np.sum((id_features - selfie_features) ** 2)))
+        similarity = max(0, 100 - (distance * 1000))
+        return {
+            "match": distance < MATCH_DISTANCE,
+            "confidence": similarity,
+            "distance": distance,
+        }
+
+
+_ENGINE: Optional[FaceEngine] = None
+_ENGINE_LOCK = threading.Lock()
+
+
+def get_face_engine() -> FaceEngine:
+    """Process-wide engine (created on first use)."""
+    global _ENGINE
+    if _ENGINE is None:
+        with _ENGINE_LOCK:
+            if _ENGINE is None:
+                _ENGINE = FaceEngine()
+    return _ENGINE
@@ -0,0 +1,288 @@
+"""
+1:N face search over 128-d face_recognition encodings.
+
+FaceIndex stores vectors in one contiguous array (float32, float16 or int8)
+and supports:
+- exact top-k search (blocked, vectorised squared-L2 via matrix products)
+- approximate search with an inverted-file (IVF) layer: vectors are bucketed
+  by nearest k-means centroid and a query only scans the `nprobe` closest lists
+- incremental inserts in both modes
+
+Used to flag duplicate applicants: a new selfie that lands within the match
+threshold (0.6, as in face_match) of a face already on file.
+"""
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+DIM = 128
+# int8 codes: value = code / INT8_SCALE; encodings sit well inside [-0.5, 0.5]
+INT8_SCALE = 127 / 0.5
+SEARCH_BLOCK = 65536
+
+
+def _merge_topk(best_d, best_p, d, p, k):
+    """Running top-k (unordered) of two (q, *) distance/position candidate sets."""
+    cand_d = np.concatenate([best_d, d], axis=1)
+    cand_p = np.concatenate([best_p, p], axis=1)
+    top = np.argpartition(cand_d, k - 1, axis=1)[:, :k]
+    return (
+        np.take_along_axis(cand_d, top, axis=1),
+        np.take_along_axis(cand_p, top, axis=1),
+    )
+
+
+class FaceIndex:
+    def __init__(self, dim: int = DIM, dtype: str = "float32"):
+        if dtype not in ("float32", "float16", "int8"):
+            raise ValueError(f"Unsupported storage dtype: {dtype}")
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self._vectors = np.empty((0, dim), dtype=self.dtype)
+        self._norms = np.empty(0, dtype=np.float32)  # squared norms of decoded vectors
+        self._ids = np.empty(0, dtype=np.int64)
+        self._size = 0
+        self._next_id = 0
+        # IVF state (set by train_ivf)
+        self.centroids: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+        self._ranges: List[slice] = []
+        self._tails: List[List[np.ndarray]] = []
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes used by the stored vectors."""
+        return self._vectors[: self._size].nbytes
+
+    def save(self, path: str) -> None:
+        """Write the index (vectors, ids and IVF layout) to one .npz file."""
+        extra = {}
+        if self.centroids is not None:
+            extra = {"centroids": self.centroids, "offsets": self._offsets}
+        np.savez(
+            path,
+            vectors=self._vectors[: self._size],
+            ids=self._ids[: self._size],
+            next_id=self._next_id,
+            **extra,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "FaceIndex":
+        with np.load(path) as data:
+            vectors = data["vectors"]
+            index = cls(dim=vectors.shape[1], dtype=vectors.dtype.name)
+            index._reserve(len(vectors))
+            index._vectors[: len(vectors)] = vectors
+            decoded = index._decode(vectors)
+            index._norms[: len(vectors)] = np.einsum("ij,ij->i", decoded, decoded)
+            index._ids[: len(vectors)] = data["ids"]
+            index._size = len(vectors)
+            index._next_id = int(data["next_id"])
+            if "centroids" in data:
+                index.centroids = data["centroids"]
+                index._set_lists(data["offsets"])
+                # Rows added after training live past the last list range
+                trained = int(index._offsets[-1])
+                index._assign(np.arange(trained, index._size), decoded[trained:])
+        return index
+
+    # --- Storage ------------------------------------------------------------ #
+
+    def _encode(self, x: np.ndarray) -> np.ndarray:
+        if self.dtype == np.int8:
+            return np.clip(np.rint(x * INT8_SCALE), -127, 127).astype(np.int8)
+        return x.astype(self.dtype)
+
+    def _decode(self, codes: np.ndarray) -> np.ndarray:
+        if self.dtype == np.int8:
+            return codes.astype(np.float32) * np.float32(1 / INT8_SCALE)
+        return codes.astype(np.float32, copy=False)
+
+    def _reserve(self, extra: int) -> None:
+        needed = self._size + extra
+        if needed <= len(self._vectors):
+            return
+        capacity = max(needed, 2 * len(self._vectors), 1024)
+        for name in ("_vectors", "_norms", "_ids"):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[: self._size] = old[: self._size]
+            setattr(self, name, new)
+
+    def add(self, vectors: np.ndarray, ids: Optional[np.ndarray] = None) -> np.ndarray:
+        """Append vectors (n, dim); returns their ids (auto-assigned if not given)."""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        n = len(vectors)
+        if ids is None:
+            ids = np.arange(self._next_id, self._next_id + n, dtype=np.int64)
+        ids = np.asarray(ids, dtype=np.int64)
+        self._next_id = max(self._next_id, int(ids.max()) + 1) if n else self._next_id
+
+        self._reserve(n)
+        start, stop = self._size, self._size + n
+        codes = self._encode(vectors)
+        decoded = self._decode(codes)
+        self._vectors[start:stop] = codes
+        self._norms[start:stop] = np.einsum("ij,ij->i", decoded, decoded)
+        self._ids[start:stop] = ids
+        self._size = stop
+
+        if self.centroids is not None:
+            self._assign(np.arange(start, stop), decoded)
+        return ids
+
+    # --- Exact search ------------------------------------------------------- #
+
+    def _scan(self, queries: np.ndarray, segments, k: int):
+        """
+        Top-k (squared distance, position) over `segments`: storage slices
+        (contiguous, no copy) and/or arrays of positions. Small segments are
+        batched so the top-k merge runs about once per SEARCH_BLOCK candidates.
+        """
+        q = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        q_norms = np.einsum("ij,ij->i", q, q)[:, None]
+        best_d = np.full((len(q), k), np.inf, dtype=np.float32)
+        best_p = np.full((len(q), k), -1, dtype=np.int64)
+        pending_d, pending_p, width = [], [], 0
+        for seg in segments:
+            pos = np.arange(seg.start, seg.stop) if isinstance(seg, slice) else seg
+            if not len(pos):
+                continue
+            block = self._decode(self._vectors[seg])
+            pending_d.append(q_norms + self._norms[seg] - 2 * (q @ block.T))
+            pending_p.append(pos)
+            width += len(pos)
+            if width >= SEARCH_BLOCK:
+                best_d, best_p = self._flush(best_d, best_p, pending_d, pending_p, k)
+                pending_d, pending_p, width = [], [], 0
+        if pending_d:
+            best_d, best_p = self._flush(best_d, best_p, pending_d, pending_p, k)
+        return best_d, best_p
+
+    @staticmethod
+    def _flush(best_d, best_p, pending_d, pending_p, k):
+        d = np.concatenate(pending_d, axis=1)
+        p = np.broadcast_to(np.concatenate(pending_p), d.shape)
+        return _merge_topk(best_d, best_p, d, p, k)
+
+    def _blocks(self):
+        for start in range(0, self._size, SEARCH_BLOCK):
+            yield slice(start, min(start + SEARCH_BLOCK, self._size))
+
+    def _finish(self, sq_dist: np.ndarray, positions: np.ndarray):
+        if self._size == 0:
+            return np.full(sq_dist.shape, np.inf), np.full(positions.shape, -1)
+        order = np.argsort(sq_dist, axis=1)
+        sq_dist = np.take_along_axis(sq_dist, order, axis=1)
+        positions = np.take_along_axis(positions, order, axis=1)
+        dist = np.sqrt(np.maximum(sq_dist, 0))
+        ids = np.where(positions >= 0, self._ids[np.maximum(positions, 0)], -1)
+        return dist, ids
+
+    def search(
+        self, queries: np.ndarray, k: int = 5, exact: bool = True, nprobe: int = 8
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Nearest faces for each query: (distances (q, k), ids (q, k)), closest first.
+        Missing slots (fewer than k candidates) have distance inf and id -1.
+        exact=False uses the IVF lists (train_ivf must have been called).
+        """
+        if exact or self.centroids is None:
+            return self._finish(*self._scan(queries, self._blocks(), k))
+        q = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        best_d = np.full((len(q), k), np.inf, dtype=np.float32)
+        best_p = np.full((len(q), k), -1, dtype=np.int64)
+        probes = self._nearest_lists(q, nprobe)
+        if len(q) <= probes.shape[1]:
+            # Few queries: one scan per query over all of its lists
+            for i in range(len(q)):
+                segments = [s for lst in probes[i] for s in self._list_segments(lst)]
+                best_d[i], best_p[i] = self._scan(q[i], segments, k)
+            return self._finish(best_d, best_p)
+        # Many queries: visit each probed list once, for all queries that probe it
+        flat = probes.ravel()
+        order = np.argsort(flat, kind="stable")
+        query_of = order // probes.shape[1]
+        starts = np.flatnonzero(np.r_[True, np.diff(flat[order]) != 0])
+        for lst, qi in zip(flat[order][starts], np.split(query_of, starts[1:])):
+            d, p = self._scan(q[qi], self._list_segments(lst), k)
+            best_d[qi], best_p[qi] = _merge_topk(best_d[qi], best_p[qi], d, p, k)
+        return self._finish(best_d, best_p)
+
+    def matches(self, query: np.ndarray, threshold: float = 0.6, k: int = 10, **kw):
+        """[(id, distance)] of stored faces within `threshold` of one query encoding."""
+        dist, ids = self.search(query, k=k, **kw)
+        keep = dist[0] <= threshold
+        return list(zip(ids[0][keep].tolist(), dist[0][keep].tolist()))
+
+    # --- IVF ---------------------------------------------------------------- #
+
+    def train_ivf(
+        self, nlist: int = 1024, sample: int = 100_000, iters: int = 10, seed: int = 0
+    ) -> None:
+        """
+        Fit `nlist` k-means centroids on a sample, then reorder storage so each
+        inverted list is one contiguous slice. Later inserts go to per-list
+        position tails until the next train_ivf.
+        """
+        if self._size == 0:
+            raise ValueError("Cannot train IVF lists on an empty index")
+        rng = np.random.default_rng(seed)
+        take = rng.choice(self._size, size=min(sample, self._size), replace=False)
+        data = self._decode(self._vectors[np.sort(take)])
+        nlist = min(nlist, len(data))
+        centroids = data[rng.choice(len(data), size=nlist, replace=False)].copy()
+        for _ in range(iters):
+            assign = self._argmin_l2(data, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, data)
+            counts = np.bincount(assign, minlength=nlist)[:, None]
+            filled = counts[:, 0] > 0
+            centroids[filled] = sums[filled] / counts[filled]
+
+        assign = np.concatenate(
+            [
+                self._argmin_l2(self._decode(self._vectors[seg]), centroids)
+                for seg in self._blocks()
+            ]
+        )
+        order = np.argsort(assign, kind="stable")
+        for name in ("_vectors", "_norms", "_ids"):
+            arr = getattr(self, name)
+            arr[: self._size] = arr[: self._size][order]
+        offsets = np.searchsorted(assign[order], np.arange(nlist + 1))
+        self.centroids = centroids
+        self._set_lists(offsets)
+
+    def _set_lists(self, offsets: np.ndarray) -> None:
+        self._offsets = offsets
+        self._ranges = [slice(int(a), int(b)) for a, b in zip(offsets, offsets[1:])]
+        self._tails = [[] for _ in range(len(offsets) - 1)]
+
+    @staticmethod
+    def _argmin_l2(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        c_norms = np.einsum("ij,ij->i", centroids, centroids)
+        return np.argmin(c_norms[None, :] - 2 * (x @ centroids.T), axis=1)
+
+    def _nearest_lists(self, q: np.ndarray, nprobe: int) -> np.ndarray:
+        c_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        d = c_norms[None, :] - 2 * (q @ self.centroids.T)
+        nprobe = min(nprobe, len(self.centroids))
+        return np.argpartition(d, nprobe - 1, axis=1)[:, :nprobe]
+
+    def _assign(self, positions: np.ndarray, decoded: np.ndarray) -> None:
+        """Add newly inserted positions to their lists' tails."""
+        lists = self._argmin_l2(decoded, self.centroids)
+        order = np.argsort(lists, kind="stable")
+        lists, positions = lists[order], positions[order]
+        starts = np.flatnonzero(np.r_[True, np.diff(lists) != 0])
+        for lst, chunk in zip(lists[starts], np.split(positions, starts[1:])):
+            tail = self._tails[lst]
+            tail[:] = [np.concatenate(tail + [chunk])]
+
+    def _list_segments(self, lst: int) -> list:
+        return [self._ranges[lst]] + self._tails[lst]
@@ -6,27 +6,152 @@ Features:
 - Converts distance to an intuitive 0–100% confidence (lower distance = higher confidence).
 - Clear, structured output for Match/No Match with confidence.
 - Modular functions for easy reuse in Streamlit or scripts.
+- Encodings are cached by image content (see face_cache.py), so re-verifying
+  the same photo skips detection entirely.
+- Detection runs on a bounded-size downscaled copy; only the face crop is
+  encoded, at the resolution the encoder needs.
+- Batch mode verifies a whole manifest of pairs, encoding each distinct image
+  once across a process pool and streaming JSONL results. Workers only read
+  the embedding cache; the parent writes it, so the cache keeps one writer.
 """
 
-from typing import Dict, Tuple
+import csv
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, TextIO, Tuple
 import numpy as np
 import face_recognition
+from PIL import Image
+
+import metrics
+from config import FACE_DETECT_MAX_SIDE, FACE_ENCODE_SIZE
+from face_cache import EmbeddingCache, get_embedding_cache
+
+# (top, right, bottom, left), as returned by face_recognition.face_locations
+Box = Tuple[int, int, int, int]
 
 
 # --- Core utilities --------------------------------------------------------- #
 
-def load_encoding(image_path: str, model: str = "hog") -> np.ndarray:
+def _resized(image: np.ndarray, scale: float) -> np.ndarray:
+    """Image shrunk by `scale` (> 1) on both axes."""
+    h, w = image.shape[:2]
+    size = (max(1, round(w / scale)), max(1, round(h / scale)))
+    return np.asarray(
+        Image.fromarray(image).resize(size, Image.BILINEAR, reducing_gap=2.0)
+    )
+
+
+def locate_faces(
+    image: np.ndarray,
+    model: str = "hog",
+    max_side: Optional[int] = FACE_DETECT_MAX_SIDE,
+    first_only: bool = True,
+) -> List[Box]:
+    """
+    Face boxes in full-resolution coordinates, largest first.
+    Detection runs on a copy with longer side <= max_side (None = full
+    resolution). If nothing is found the detection side doubles, up to the full
+    image; the search stops at the first size that finds a face. first_only
+    keeps just the largest face.
+    """
+    h, w = image.shape[:2]
+    longest = max(h, w)
+    side = min(max_side or longest, longest)
+    while True:
+        scale = longest / side
+        small = _resized(image, scale) if scale > 1 else image
+        with metrics.timer("face.face_locations"):
+            locations = face_recognition.face_locations(small, model=model)
+        found = [
+            (
+                max(0, int(top * scale)),
+                min(w, round(right * scale)),
+                min(h, round(bottom * scale)),
+                max(0, int(left * scale)),
+            )
+            for top, right, bottom, left in locations
+        ]
+        if found or side >= longest:
+            break
+        side = min(2 * side, longest)
+    found.sort(key=lambda b: (b[2] - b[0]) * (b[1] - b[3]), reverse=True)
+    return found[:1] if first_only else found
+
+
+def encode_face(
+    image: np.ndarray, box: Box, face_size: Optional[int] = FACE_ENCODE_SIZE
+) -> np.ndarray:
+    """
+    Encoding of one face from a padded crop around `box`, shrunk so the face
+    is about face_size pixels tall (None = native resolution). The encoder
+    works on a 150px chip, so larger faces only cost landmark time.
+    """
+    top, right, bottom, left = box
+    h, w = image.shape[:2]
+    pad = (bottom - top) // 2
+    y0, x0 = max(0, top - pad), max(0, left - pad)
+    crop = image[y0 : min(h, bottom + pad), x0 : min(w, right + pad)]
+    local = (top - y0, right - x0, bottom - y0, left - x0)
+    scale = (bottom - top) / face_size if face_size else 1.0
+    if scale > 1:
+        crop = _resized(crop, scale)
+        local = tuple(int(v / scale) for v in local)
+    with metrics.timer("face.face_encodings"):
+        return face_recognition.face_encodings(np.ascontiguousarray(crop), [local])[0]
+
+
+def encode_image_bytes(
+    data: bytes, model: str = "hog", max_side: Optional[int] = FACE_DETECT_MAX_SIDE
+) -> np.ndarray:
+    """
+    Detect and encode the largest face in encoded image bytes (JPEG/PNG).
+    max_side=None runs the original full-resolution detection and encoding.
+    Returns an empty array if no face is found.
+    """
+    image = face_recognition.load_image_file(io.BytesIO(data))
+    if max_side is None:
+        with metrics.timer("face.face_locations"):
+            locations = face_recognition.face_locations(image, model=model)
+        if not locations:
+            return np.empty(0)
+        with metrics.timer("face.face_encodings"):
+            return face_recognition.face_encodings(image, locations)[0]
+    boxes = locate_faces(image, model=model, max_side=max_side)
+    if not boxes:
+        return np.empty(0)
+    return encode_face(image, boxes[0])
+
+
+def load_encoding(
+    image_path: str, model: str = "hog", use_cache: bool = True
+) -> np.ndarray:
     """
     Load a face image and return the first face encoding.
     model: "hog" (CPU fast) or "cnn" (GPU/slow but more accurate).
+    The embedding cache is checked before any detection runs.
     Raises ValueError if no face is found.
     """
-    image = face_recognition.load_image_file(image_path)
-    locations = face_recognition.face_locations(image, model=model)
-    if not locations:
+    with open(image_path, "rb") as f:
+        data = f.read()
+    if use_cache:
+        encoding = get_embedding_cache().get_or_compute(
+            data, _cache_model(model), lambda: encode_image_bytes(data, model)
+        )
+    else:
+        encoding = encode_image_bytes(data, model)
+    if encoding.size == 0:
         raise ValueError(f"No face detected in: {image_path}")
-    encodings = face_recognition.face_encodings(image, locations)
-    return encodings[0]
+    return encoding
+
+
+def _cache_model(model: str) -> str:
+    """Cache key model: detection and encode sizes both change the encoding."""
+    return f"{model}@{FACE_DETECT_MAX_SIDE}/{FACE_ENCODE_SIZE}"
 
 
 def distance_to_confidence(distance: float, threshold: float = 0.6) -> float:
@@ -46,15 +171,20 @@ def distance_to_confidence(distance: float, threshold: float = 0.6) -> float:
 
 
 def compare_faces(
-    reference_path: str, candidate_path: str, threshold: float = 0.6, model: str = "hog"
+    reference_path: str,
+    candidate_path: str,
+    threshold: float = 0.6,
+    model: str = "hog",
+    use_cache: bool = True,
 ) -> Dict[str, object]:
     """
     Compare two face images and return a rich result dictionary.
     - threshold: typical face_recognition default is 0.6.
     - model: "hog" (fast CPU) or "cnn" (accurate, requires dlib with CUDA).
+    - use_cache: look encodings up in the embedding cache first.
     """
-    ref_enc = load_encoding(reference_path, model=model)
-    cand_enc = load_encoding(candidate_path, model=model)
+    ref_enc = load_encoding(reference_path, model=model, use_cache=use_cache)
+    cand_enc = load_encoding(candidate_path, model=model, use_cache=use_cache)
 
     # Euclidean distance
     distance = np.linalg.norm(ref_enc - cand_enc)
@@ -72,6 +202,171 @@ def compare_faces(
     }
 
 
+# --- Batch verification ---------------------------------------------------- #
+
+# Per-worker settings (set by _init_worker)
+_WORKER_MODEL = "hog"
+_WORKER_CACHE = True
+
+
+def read_manifest(path: str) -> List[Dict[str, str]]:
+    """
+    Pairs from a CSV (header with reference,candidate[,id]) or JSONL manifest
+    (one {"reference": ..., "candidate": ..., "id": ...} object per line).
+    Pairs without an id get their 0-based row number.
+    """
+    with open(path, newline="") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    pairs = []
+    for i, row in enumerate(rows):
+        if not row.get("reference") or not row.get("candidate"):
+            raise ValueError(f"{path}: row {i} needs 'reference' and 'candidate'")
+        pairs.append(
+            {
+                "id": row.get("id") or str(i),
+                "reference": row["reference"],
+                "candidate": row["candidate"],
+            }
+        )
+    return pairs
+
+
+def _init_worker(model: str, use_cache: bool) -> None:
+    global _WORKER_MODEL, _WORKER_CACHE
+    _WORKER_MODEL, _WORKER_CACHE = model, use_cache
+    # Touch the dlib models once here rather than inside the first task
+    face_recognition.face_locations(np.zeros((32, 32, 3), dtype=np.uint8))
+
+
+def _encode_path(
+    path: str,
+) -> Tuple[str, Optional[str], Optional[np.ndarray], bool, Optional[str], float]:
+    """
+    (path, cache key, encoding or None, cache hit, error, seconds) for one
+    image, run in a worker. An empty encoding means no face. The cache is only
+    read here; the parent stores new encodings.
+    """
+    t0 = time.perf_counter()
+    key, encoding, hit, error = None, None, False, None
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        if _WORKER_CACHE:
+            key = EmbeddingCache.key(data, _cache_model(_WORKER_MODEL))
+            encoding = get_embedding_cache().get(key)
+            hit = encoding is not None
+        if encoding is None:
+            encoding = encode_image_bytes(data, _WORKER_MODEL)
+    except OSError as e:  # unreadable / undecodable file
+        encoding, error = None, f"Cannot read {path}: {e}"
+    except Exception as e:  # decoder or detector failure: only this image fails
+        encoding, error = None, f"Cannot encode {path}: {type(e).__name__}: {e}"
+    return path, key, encoding, hit, error, time.perf_counter() - t0
+
+
+def verify_pairs(
+    pairs: List[Dict[str, str]],
+    out: TextIO,
+    threshold: float = 0.6,
+    model: str = "hog",
+    workers: Optional[int] = None,
+    use_cache: bool = True,
+) -> Dict[str, object]:
+    """
+    Verify every pair, writing one JSON result per line to `out` as soon as
+    both of its images are encoded (so output order follows completion, not
+    the manifest). Each distinct image path is encoded once. Returns run stats.
+    A failure on one image or pair is written as that row's "error"; each line
+    is flushed so a crash loses no finished rows. New encodings are written to
+    the embedding cache here, in the parent, never by the workers.
+    """
+    t_start = time.perf_counter()
+    waiting: Dict[str, List[int]] = {}
+    for i, pair in enumerate(pairs):
+        waiting.setdefault(pair["reference"], []).append(i)
+        waiting.setdefault(pair["candidate"], []).append(i)
+    encodings: Dict[str, Tuple[Optional[np.ndarray], Optional[str]]] = {}
+    stats = {
+        "pairs": len(pairs),
+        "distinct_images": len(waiting),
+        "reused_encodings": 2 * len(pairs) - len(waiting),
+        "failed_detections": 0,
+        "unreadable_images": 0,
+        "encode_errors": 0,
+        "cache_hits": 0,
+        "matches": 0,
+        "errors": 0,
+        "encode_seconds": 0.0,  # summed over workers
+        "compare_seconds": 0.0,
+    }
+
+    def emit(i: int) -> None:
+        pair = pairs[i]
+        ref, ref_err = encodings[pair["reference"]]
+        cand, cand_err = encodings[pair["candidate"]]
+        result = dict(pair)
+        try:
+            if ref_err or cand_err:
+                raise ValueError(ref_err or cand_err)
+            distance = float(np.linalg.norm(ref - cand))
+            result.update(
+                match=distance <= threshold,
+                distance=distance,
+                confidence=round(distance_to_confidence(distance, threshold), 2),
+            )
+            stats["matches"] += result["match"]
+        except Exception as e:
+            result = dict(pair, error=str(e) or type(e).__name__)
+            stats["errors"] += 1
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+
+    cache = get_embedding_cache() if use_cache else None
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(model, use_cache)
+    ) as pool:
+        futures = {pool.submit(_encode_path, path): path for path in waiting}
+        for fut in as_completed(futures):
+            try:
+                path, key, encoding, hit, error, seconds = fut.result()
+            except Exception as e:  # worker died or the result did not unpickle
+                path, key, encoding, hit, seconds = futures[fut], None, None, False, 0.0
+                error = f"Cannot encode {path}: {type(e).__name__}: {e}"
+            stats["encode_seconds"] += seconds
+            stats["cache_hits"] += hit
+            if key is not None and not hit and encoding is not None:
+                cache.put(key, encoding)  # "no face" (empty) is cached too
+            if encoding is not None and encoding.size == 0:
+                encoding, error = None, f"No face detected in: {path}"
+            if error:
+                if error.startswith("No face"):
+                    stats["failed_detections"] += 1
+                elif error.startswith("Cannot read"):
+                    stats["unreadable_images"] += 1
+                else:
+                    stats["encode_errors"] += 1
+            encodings[path] = (encoding, error)
+            t0 = time.perf_counter()
+            for i in dict.fromkeys(waiting.pop(path)):  # a pair may repeat a path
+                pair = pairs[i]
+                if pair["reference"] in encodings and pair["candidate"] in encodings:
+                    emit(i)
+            stats["compare_seconds"] += time.perf_counter() - t0
+    out.flush()
+
+    wall = time.perf_counter() - t_start
+    stats["wall_seconds"] = round(wall, 3)
+    stats["pairs_per_second"] = round(len(pairs) / wall, 1) if wall else 0.0
+    stats["images_per_second"] = round(len(encodings) / wall, 1) if wall else 0.0
+    for k in ("encode_seconds", "compare_seconds"):
+        stats[k] = round(stats[k], 3)
+    return stats
+
+
 # --- Pretty-print helpers --------------------------------------------------- #
 
 def format_result(result: Dict[str, object]) -> str:
@@ -109,21 +404,59 @@ if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser(description="Face matcher with confidence scores")
-    parser.add_argument("reference", help="Reference face image path")
-    parser.add_argument("candidate", help="Candidate face image path")
+    parser.add_argument("reference", nargs="?", help="Reference face image path")
+    parser.add_argument("candidate", nargs="?", help="Candidate face image path")
     parser.add_argument("--threshold", type=float, default=0.6, help="Match threshold")
     parser.add_argument(
         "--model", choices=["hog", "cnn"], default="hog", help="face_recognition model"
     )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Bypass the embedding cache"
+    )
+    parser.add_argument(
+        "--cache-stats", action="store_true", help="Print embedding cache counters"
+    )
+    parser.add_argument(
+        "--manifest", help="Batch mode: CSV/JSONL of reference,candidate[,id] pairs"
+    )
+    parser.add_argument(
+        "--output", help="Batch mode: JSONL results file (default: stdout)"
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Batch mode: process count (default: CPUs)"
+    )
     args = parser.parse_args()
 
+    if args.manifest:
+        out = open(args.output, "w") if args.output else sys.stdout
+        try:
+            stats = verify_pairs(
+                read_manifest(args.manifest),
+                out,
+                threshold=args.threshold,
+                model=args.model,
+                workers=args.workers,
+                use_cache=not args.no_cache,
+            )
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        # Stats go to stderr so stdout stays pure JSONL
+        print(json.dumps(stats, indent=2), file=sys.stderr)
+        sys.exit(0)
+    if not (args.reference and args.candidate):
+        parser.error("reference and candidate are required without --manifest")
+
     try:
         res = compare_faces(
             reference_path=args.reference,
             candidate_path=args.candidate,
             threshold=args.threshold,
             model=args.model,
+            use_cache=not args.no_cache,
         )
         print(format_result(res))
     except Exception as e:
         print(f"Error: {e}")
+    if args.cache_stats:
+        print(f"Embedding cache: {get_embedding_cache().stats()}")
@@ -0,0 +1,134 @@
+"""
+Feature engineering shared by training, single-row and batch inference.
+
+Training and batch inference go through one vectorised kernel
+(derive_features); single-row serving uses feature_row, a plain-Python twin
+of it with the same DERIVED_BOUNDS, so serving sees exactly the feature
+values the model was trained on, including the clipping of the derived
+ratios.
+"""
+import math
+import sys
+
+import numpy as np
+
+from config import FEATURE_ORDER, INPUT_FIELDS
+
+# Clip ranges for the derived features (same as training always used)
+DERIVED_BOUNDS = {
+    "debt_to_income": (0.0, 300.0),
+    "loan_to_income": (0.0, 500.0),
+    "employment_stability": (0.0, 1.0),
+}
+
+_FMAX = sys.float_info.max
+
+
+def derive_features(
+    monthly_income, loan_amount, monthly_expenses, age, employment_years
+):
+    """
+    Derived ratio columns from raw NumPy columns (dtype is preserved).
+    Income is floored at 1 so zero/negative income yields the clipped maximum
+    DTI/LTI; a non-positive age yields zero employment stability.
+    """
+    income = np.maximum(monthly_income, 1)
+    derived = {
+        "debt_to_income": monthly_expenses / income * 100,
+        "loan_to_income": loan_amount / (income * 12) * 100,
+        "employment_stability": employment_years / np.where(age > 0, age, np.inf),
+    }
+    for name, (lo, hi) in DERIVED_BOUNDS.items():
+        derived[name] = np.clip(derived[name], lo, hi)
+    return derived
+
+
+def input_columns(apps):
+    """
+    Normalise applications into float64 columns keyed by INPUT_FIELDS.
+    Accepts a list of dicts, a DataFrame, or a 2-D array with INPUT_FIELDS columns.
+    Missing values default to 0, except monthly_expenses (half the income).
+    """
+    if hasattr(apps, "columns"):  # DataFrame
+        n = len(apps)
+        cols = {
+            k: apps[k].to_numpy(dtype=np.float64)
+            if k in apps.columns
+            else np.full(n, np.nan)
+            for k in INPUT_FIELDS
+        }
+    elif isinstance(apps, np.ndarray):
+        arr = np.asarray(apps, dtype=np.float64)
+        if arr.ndim != 2 or arr.shape[1] != len(INPUT_FIELDS):
+            raise ValueError(
+                f"Expected an (n, {len(INPUT_FIELDS)}) array with columns {INPUT_FIELDS}"
+            )
+        cols = {k: arr[:, i] for i, k in enumerate(INPUT_FIELDS)}
+    else:
+        apps = list(apps)
+        n = len(apps)
+        cols = {
+            k: np.fromiter(
+                (float(a.get(k, np.nan)) for a in apps), dtype=np.float64, count=n
+            )
+            for k in INPUT_FIELDS
+        }
+
+    for k in INPUT_FIELDS:
+        if k != "monthly_expenses":
+            cols[k] = np.nan_to_num(cols[k], nan=0.0)
+    exp = cols["monthly_expenses"]
+    cols["monthly_expenses"] = np.where(
+        np.isnan(exp), cols["monthly_income"] * 0.5, exp
+    )
+    return cols
+
+
+def compute_features(cols):
+    """(n, 8) feature matrix in FEATURE_ORDER from input_columns() output."""
+    feats = dict(cols)
+    feats.update(
+        derive_features(
+            cols["monthly_income"],
+            cols["loan_amount"],
+            cols["monthly_expenses"],
+            cols["age"],
+            cols["employment_years"],
+        )
+    )
+    return np.column_stack([feats[c] for c in FEATURE_ORDER])
+
+
+def _clip(value, bounds):
+    lo, hi = bounds
+    return lo if value < lo else hi if value > hi else value
+
+
+def feature_row(app):
+    """
+    Feature dict (FEATURE_ORDER keys, Python floats) for one application.
+    Plain-Python twin of input_columns + derive_features: NumPy's per-call
+    overhead dominates on a single row. Same defaults, floors and
+    DERIVED_BOUNDS clipping, so the values match the batch kernel exactly.
+    """
+    raw = {}
+    for k in INPUT_FIELDS:
+        v = float(app.get(k, np.nan))
+        if k != "monthly_expenses" and not -_FMAX <= v <= _FMAX:
+            v = 0.0 if v != v else math.copysign(_FMAX, v)  # as np.nan_to_num
+        raw[k] = v
+    if raw["monthly_expenses"] != raw["monthly_expenses"]:
+        raw["monthly_expenses"] = raw["monthly_income"] * 0.5
+    income = max(raw["monthly_income"], 1.0)
+    age = raw["age"]
+    raw["debt_to_income"] = _clip(
+        raw["monthly_expenses"] / income * 100, DERIVED_BOUNDS["debt_to_income"]
+    )
+    raw["loan_to_income"] = _clip(
+        raw["loan_amount"] / (income * 12) * 100, DERIVED_BOUNDS["loan_to_income"]
+    )
+    raw["employment_stability"] = _clip(
+        raw["employment_years"] / age if age > 0 else 0.0,
+        DERIVED_BOUNDS["employment_stability"],
+    )
+    return {c: raw[c] for c in FEATURE_ORDER}
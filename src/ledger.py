@@ -0,0 +1,384 @@
+"""
+Durable wallet ledger.
+
+Every credit or debit is an append-only row in a SQLite database in WAL mode
+(updates and deletes are rejected by triggers). An insert trigger keeps the
+`balances` table, keyed by account, in step, so a balance lookup is one
+primary-key read that never waits for writers.
+
+All writes go through one writer thread that does group commit: it takes
+every posting queued while the previous transaction was syncing and commits
+them in one transaction (up to batch_size), so thousands of concurrent
+post() calls share a handful of fsyncs. A caller's future resolves only
+after its transaction has committed.
+
+Transaction IDs come from a counter in the database, reserved id_block at a
+time per process, so they never collide (even within one second or across
+processes) and increase monotonically within a process. A posting may carry
+an idempotency key: re-posting the same key returns the original posting
+instead of moving money twice. Amounts are stored as integer paise.
+"""
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Optional
+
+import metrics
+from config import LEDGER_BATCH_SIZE, LEDGER_ID_BLOCK, LEDGER_PATH, LEDGER_SYNCHRONOUS
+
+TXN_PREFIX = "PU"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS postings (
+    seq INTEGER PRIMARY KEY,
+    txn_id TEXT NOT NULL UNIQUE,
+    account TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    idempotency_key TEXT UNIQUE,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS balances (
+    account TEXT PRIMARY KEY,
+    balance INTEGER NOT NULL,
+    postings INTEGER NOT NULL,
+    last_seq INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS txn_ids (next INTEGER NOT NULL);
+INSERT INTO txn_ids (next) SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM txn_ids);
+CREATE TRIGGER IF NOT EXISTS postings_balance AFTER INSERT ON postings BEGIN
+    INSERT INTO balances (account, balance, postings, last_seq)
+    VALUES (NEW.account, NEW.amount, 1, NEW.seq)
+    ON CONFLICT (account) DO UPDATE SET
+        balance = balance + excluded.balance,
+        postings = postings + 1,
+        last_seq = excluded.last_seq;
+END;
+CREATE TRIGGER IF NOT EXISTS postings_no_update BEFORE UPDATE ON postings BEGIN
+    SELECT RAISE(ABORT, 'ledger postings are append-only');
+END;
+CREATE TRIGGER IF NOT EXISTS postings_no_delete BEFORE DELETE ON postings BEGIN
+    SELECT RAISE(ABORT, 'ledger postings are append-only');
+END;
+"""
+INSERT_POSTING = """
+INSERT INTO postings (txn_id, account, amount, kind, idempotency_key, created_at)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (idempotency_key) DO NOTHING
+"""
+POSTING_COLUMNS = (
+    "seq",
+    "txn_id",
+    "account",
+    "amount",
+    "kind",
+    "idempotency_key",
+    "created_at",
+)
+SELECT_BY_KEY = (
+    f"SELECT {', '.join(POSTING_COLUMNS)} FROM postings WHERE idempotency_key = ?"
+)
+
+
+def account_id(*parts: str) -> str:
+    """Stable wallet account ID from identifying parts (name, ID document digest)."""
+    h = hashlib.sha256("\0".join(p.strip().casefold() for p in parts).encode())
+    return "W" + h.hexdigest()[:20]
+
+
+def to_paise(amount: float) -> int:
+    return int(round(amount * 100))
+
+
+def _row(seq: int, posting: tuple) -> Dict[str, object]:
+    return {**dict(zip(POSTING_COLUMNS, (seq, *posting))), "duplicate": False}
+
+
+class Ledger:
+    """Append-only SQLite ledger with a group-committing writer thread."""
+
+    def __init__(
+        self,
+        path: str = LEDGER_PATH,
+        batch_size: int = LEDGER_BATCH_SIZE,
+        synchronous: str = LEDGER_SYNCHRONOUS,
+        id_block: int = LEDGER_ID_BLOCK,
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.synchronous = synchronous
+        self.id_block = id_block
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._local = threading.local()
+        self._ids_lock = threading.Lock()
+        self._next_id = self._id_limit = 0
+        self.commits = 0
+        self.committed = 0
+        self._writer = threading.Thread(
+            target=self._write_loop, name="ledger", daemon=True
+        )
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path, isolation_level=None, check_same_thread=False, timeout=30
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        """Per-thread read connection (WAL readers do not block the writer)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            conn.execute("PRAGMA query_only=1")
+        return conn
+
+    # --- Transaction IDs ---------------------------------------------------- #
+
+    def _reserve_ids(self) -> int:
+        """First ID of a fresh block of id_block IDs."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            (first,) = conn.execute("SELECT next FROM txn_ids").fetchone()
+            conn.execute("UPDATE txn_ids SET next = ?", (first + self.id_block,))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return first
+
+    def next_txn_id(self) -> str:
+        """A new, never reused transaction ID ("PU" + 12 digits)."""
+        with self._ids_lock:
+            if self._next_id >= self._id_limit:
+                self._next_id = self._reserve_ids()
+                self._id_limit = self._next_id + self.id_block
+            n = self._next_id
+            self._next_id += 1
+        return f"{TXN_PREFIX}{n:012d}"
+
+    # --- Writes ------------------------------------------------------------- #
+
+    def _posting(
+        self,
+        account: str,
+        amount: float,
+        kind: str = "disbursal",
+        idempotency_key: Optional[str] = None,
+        txn_id: Optional[str] = None,
+    ) -> tuple:
+        return (
+            txn_id or self.next_txn_id(),
+            account,
+            to_paise(amount),
+            kind,
+            idempotency_key,
+            time.time(),
+        )
+
+    def submit_many(self, postings: Iterable[Dict[str, object]]) -> Future:
+        """
+        Queue postings (dicts of post() arguments) to commit atomically
+        together; the future resolves to their rows once committed.
+        """
+        fut: Future = Future()
+        self._queue.put(([self._posting(**p) for p in postings], fut))
+        return fut
+
+    def submit(self, account: str, amount: float, **kwargs) -> Future:
+        """Queue one posting; the future resolves to its row once committed."""
+        fut: Future = Future()
+        self._queue.put(([self._posting(account, amount, **kwargs)], fut))
+        return fut
+
+    def post(
+        self,
+        account: str,
+        amount: float,
+        kind: str = "disbursal",
+        idempotency_key: Optional[str] = None,
+        txn_id: Optional[str] = None,
+    ) -> Dict[str, object]:
+        """
+        Credit (or, with a negative amount, debit) an account and wait for the
+        commit. Returns the posting row plus "duplicate": True if the
+        idempotency key was already used (nothing new is posted).
+        """
+        fut = self.submit(
+            account, amount, kind=kind, idempotency_key=idempotency_key, txn_id=txn_id
+        )
+        return fut.result()[0]
+
+    def post_many(
+        self, postings: Iterable[Dict[str, object]]
+    ) -> List[Dict[str, object]]:
+        """Post several postings atomically and wait for the commit."""
+        return self.submit_many(postings).result()
+
+    def _insert(self, conn: sqlite3.Connection, posting: tuple) -> Dict[str, object]:
+        cur = conn.execute(INSERT_POSTING, posting)
+        if cur.rowcount:
+            return _row(cur.lastrowid, posting)
+        # Idempotency key seen before: hand back the original posting
+        original = dict(
+            zip(POSTING_COLUMNS, conn.execute(SELECT_BY_KEY, (posting[4],)).fetchone())
+        )
+        if (original["account"], original["amount"]) != posting[1:3]:
+            raise ValueError(
+                f"Idempotency key {posting[4]!r} was used for a different posting"
+            )
+        return {**original, "duplicate": True}
+
+    def _insert_batch(self, conn: sqlite3.Connection, batch: list) -> list:
+        """
+        Fast path: postings without an idempotency key go in with one
+        executemany. The writer holds the write lock, so their seqs are the
+        next consecutive rowids. Raises on any conflict.
+        """
+        plain = [p for postings, _ in batch for p in postings if p[4] is None]
+        (last,) = conn.execute("SELECT IFNULL(MAX(seq), 0) FROM postings").fetchone()
+        conn.executemany(INSERT_POSTING, plain)
+        seqs = iter(range(last + 1, last + 1 + len(plain)))
+        outcomes = []
+        for postings, _ in batch:
+            rows = []
+            for p in postings:
+                if p[4] is None:
+                    rows.append(_row(next(seqs), p))
+                else:
+                    rows.append(self._insert(conn, p))
+            outcomes.append(rows)
+        return outcomes
+
+    def _insert_isolated(self, conn: sqlite3.Connection, batch: list) -> list:
+        """Slow path: each submission in a savepoint, so a bad one fails alone."""
+        outcomes = []
+        for postings, _ in batch:
+            conn.execute("SAVEPOINT submission")
+            try:
+                rows = [self._insert(conn, p) for p in postings]
+            except (sqlite3.IntegrityError, ValueError) as e:
+                conn.execute("ROLLBACK TO submission")
+                rows = e
+            conn.execute("RELEASE submission")
+            outcomes.append(rows)
+        return outcomes
+
+    @metrics.timed("ledger.commit")
+    def _commit(self, conn: sqlite3.Connection, batch: list) -> None:
+        """One transaction for the whole batch."""
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                outcomes = self._insert_batch(conn, batch)
+            except (sqlite3.IntegrityError, ValueError):
+                conn.execute("ROLLBACK")
+                conn.execute("BEGIN IMMEDIATE")
+                outcomes = self._insert_isolated(conn, batch)
+            conn.execute("COMMIT")
+        except BaseException as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        self.commits += 1
+        for (postings, fut), rows in zip(batch, outcomes):
+            if isinstance(rows, Exception):
+                fut.set_exception(rows)
+            else:
+                self.committed += len(postings)
+                fut.set_result(rows)
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            # Group commit: everything queued meanwhile joins this transaction
+            batch, size, stop = [item], len(item[0]), False
+            while size < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+                size += len(item[0])
+            self._commit(conn, batch)
+            if stop:
+                break
+        conn.close()
+
+    def close(self) -> None:
+        """Commit everything already queued, then stop the writer."""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+
+    # --- Reads -------------------------------------------------------------- #
+
+    def account(self, account: str) -> Optional[Dict[str, object]]:
+        """{"account", "balance" (rupees), "postings", "last_seq"} or None."""
+        row = self._reader().execute(
+            "SELECT balance, postings, last_seq FROM balances WHERE account = ?",
+            (account,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "account": account,
+            "balance": row[0] / 100,
+            "postings": row[1],
+            "last_seq": row[2],
+        }
+
+    def balance(self, account: str) -> float:
+        """Current balance in rupees (0 for an unknown account)."""
+        row = self._reader().execute(
+            "SELECT balance FROM balances WHERE account = ?", (account,)
+        ).fetchone()
+        return row[0] / 100 if row else 0.0
+
+    def verify(self) -> int:
+        """Accounts whose balance row disagrees with the sum of their postings."""
+        (mismatched,) = self._reader().execute(
+            """
+            SELECT COUNT(*) FROM balances b
+            LEFT JOIN (
+                SELECT account, SUM(amount) AS total, COUNT(*) AS n
+                FROM postings GROUP BY account
+            ) p USING (account)
+            WHERE p.total IS NOT b.balance OR p.n IS NOT b.postings
+            """
+        ).fetchone()
+        return mismatched
+
+
+_LEDGER: Optional[Ledger] = None
+_LEDGER_LOCK = threading.Lock()
+
+
+def get_ledger() -> Ledger:
+    """Process-wide ledger (created on first use)."""
+    global _LEDGER
+    if _LEDGER is None:
+        with _LEDGER_LOCK:
+            if _LEDGER is None:
+                _LEDGER = Ledger()
+    return _LEDGER
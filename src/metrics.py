@@ -0,0 +1,495 @@
+"""
+Lightweight instrumentation: per-stage timers, counters and histograms,
+per-application traces and an opt-in sampling profiler.
+
+    with metrics.timer("scoring.predict_proba"):
+        proba = model.predict_proba(row)
+
+    @metrics.timed("scoring.compute_features")
+    def _compute_features(app): ...
+
+Everything is off unless AIDE_METRICS=1 (or enable()). When it is off,
+timer() returns a shared no-op context manager and timed() functions cost
+one flag check, so the hooks can stay in hot paths.
+
+Stage timings go to the aide_stage_seconds histogram (label "stage"), and
+failures to aide_stage_errors_total. count() bumps aide_events_total
+(label "event"). render_prometheus() exports everything in the Prometheus
+text format.
+
+A Trace collects the spans timed while it is bound to a thread (trace() for
+synchronous code, start_trace() + use_trace() across threads, as in
+pipeline.py). With the profiler on (AIDE_PROFILE=1), the threads of every
+open trace are sampled every PROFILE_INTERVAL seconds. A trace that takes
+longer than PROFILE_SLOW_SECONDS has its stacks written in folded format
+("frame;frame;frame count", for flamegraph.pl or speedscope) to PROFILE_DIR.
+"""
+import bisect
+import contextlib
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence
+
+from config import (
+    METRICS_BUCKETS,
+    METRICS_ENABLED,
+    METRICS_HOST,
+    PROFILE_DIR,
+    PROFILE_ENABLED,
+    PROFILE_INTERVAL,
+    PROFILE_SLOW_SECONDS,
+)
+
+_enabled = METRICS_ENABLED
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(on: bool = True) -> None:
+    """Turn recording on or off at runtime (default: AIDE_METRICS)."""
+    global _enabled
+    _enabled = on
+
+
+# --- Metric families -------------------------------------------------------- #
+
+_FAMILIES: List["_Family"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Family:
+    kind = ""
+
+    def __init__(self, name: str, help: str, label: Optional[str] = None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self._series: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        _FAMILIES.append(self)
+
+    def _labels(self, value: str, extra: str = "") -> str:
+        parts = [f'{self.label}="{_escape(value)}"'] if self.label else []
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+class CounterFamily(_Family):
+    kind = "counter"
+
+    def inc(self, label: str = "", n: float = 1) -> None:
+        if not _enabled:
+            return
+        with self._lock:
+            self._series[label] = self._series.get(label, 0) + n
+
+    def value(self, label: str = "") -> float:
+        return self._series.get(label, 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for label, value in sorted(self._series.items()):
+                lines.append(f"{self.name}{self._labels(label)} {value}")
+        return lines
+
+
+class _Buckets:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, n: int):
+        self.counts = [0] * n
+        self.sum = 0.0
+        self.count = 0
+
+
+class HistogramFamily(_Family):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label: Optional[str] = None,
+        buckets: Sequence[float] = METRICS_BUCKETS,
+    ):
+        super().__init__(name, help, label)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, label: str = "") -> None:
+        if not _enabled:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = _Buckets(len(self.buckets) + 1)
+            series.counts[i] += 1
+            series.sum += value
+            series.count += 1
+
+    def snapshot(self, label: str = "") -> Dict[str, float]:
+        """{"count", "sum", "mean"} for one series (zeros if never observed)."""
+        series = self._series.get(label)
+        if series is None:
+            return {"count": 0, "sum": 0.0, "mean": 0.0}
+        return {
+            "count": series.count,
+            "sum": series.sum,
+            "mean": series.sum / series.count,
+        }
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for label, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, series.counts):
+                    cumulative += n
+                    le = self._labels(label, f'le="{bound:g}"')
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                inf = self._labels(label, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{inf} {series.count}")
+                lines.append(f"{self.name}_sum{self._labels(label)} {series.sum:.6f}")
+                lines.append(f"{self.name}_count{self._labels(label)} {series.count}")
+        return lines
+
+
+STAGE_SECONDS = HistogramFamily(
+    "aide_stage_seconds", "Wall time of each instrumented stage.", "stage"
+)
+STAGE_ERRORS = CounterFamily(
+    "aide_stage_errors_total", "Instrumented stages that raised.", "stage"
+)
+EVENTS = CounterFamily("aide_events_total", "Notable events by name.", "event")
+
+
+def count(event: str, n: float = 1) -> None:
+    """Bump aide_events_total{event=...}."""
+    EVENTS.inc(event, n)
+
+
+def observe(stage: str, seconds: float) -> None:
+    """Record a duration measured elsewhere (e.g. in an OCR worker process)."""
+    STAGE_SECONDS.observe(seconds, stage)
+    trace = _CURRENT.get()
+    if trace is not None:
+        trace.span(stage, time.perf_counter() - seconds, seconds)
+
+
+def render_prometheus() -> str:
+    """Every metric family in the Prometheus text exposition format."""
+    lines: List[str] = []
+    for family in _FAMILIES:
+        lines.extend(family.render())
+    return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+    """Drop all recorded series (benchmarks and tests)."""
+    for family in _FAMILIES:
+        family.reset()
+
+
+# --- Timers ----------------------------------------------------------------- #
+
+class _Timer:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> "_Timer":
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        seconds = time.perf_counter() - self.t0
+        STAGE_SECONDS.observe(seconds, self.name)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(self.name)
+        trace = _CURRENT.get()
+        if trace is not None:
+            trace.span(self.name, self.t0, seconds)
+
+
+_NULL = contextlib.nullcontext()
+
+
+def timer(name: str):
+    """Context manager timing a stage (a shared no-op while disabled)."""
+    return _Timer(name) if _enabled else _NULL
+
+
+def timed(name: str):
+    """Decorator form of timer()."""
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Timer(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+# --- Traces ----------------------------------------------------------------- #
+
+_CURRENT: ContextVar[Optional["Trace"]] = ContextVar("aide_trace", default=None)
+
+
+class Trace:
+    """Spans of one application, across every thread it ran on."""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.seconds: Optional[float] = None
+        self.spans: List[tuple] = []
+        self.samples: Counter = Counter()
+        self.profile_path: Optional[str] = None
+        self._threads: Counter = Counter()  # thread ident -> bindings
+        self._lock = threading.Lock()
+
+    def span(self, name: str, start: float, seconds: float) -> None:
+        thread = threading.current_thread().name
+        with self._lock:
+            self.spans.append((name, start - self.started, seconds, thread))
+
+    def finish(self) -> None:
+        if self.seconds is None:
+            self.seconds = time.perf_counter() - self.started
+            _PROFILER.finished(self)
+
+    def to_dict(self) -> Dict[str, object]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s[1])
+        return {
+            "trace_id": self.trace_id,
+            "seconds": self.seconds,
+            "spans": [
+                {
+                    "name": name,
+                    "start_ms": round(start * 1000, 3),
+                    "ms": round(seconds * 1000, 3),
+                    "thread": thread,
+                }
+                for name, start, seconds, thread in spans
+            ],
+            "profile": self.profile_path,
+        }
+
+    def to_chrome(self) -> Dict[str, object]:
+        """Chrome trace-event JSON (chrome://tracing, Perfetto)."""
+        start_us = self.wall_started * 1e6
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "traceEvents": [
+                {
+                    "name": name,
+                    "ph": "X",
+                    "ts": start_us + start * 1e6,
+                    "dur": seconds * 1e6,
+                    "pid": self.trace_id,
+                    "tid": thread,
+                }
+                for name, start, seconds, thread in spans
+            ]
+        }
+
+    def folded(self) -> str:
+        """Profiler samples as folded stacks, one "a;b;c count" line each."""
+        return "".join(f"{stack} {n}\n" for stack, n in self.samples.most_common())
+
+
+def start_trace(trace_id: str) -> Optional[Trace]:
+    """A new open Trace, or None while disabled. Call finish() when done."""
+    if not _enabled:
+        return None
+    trace = Trace(trace_id)
+    _PROFILER.watch(trace)
+    return trace
+
+
+@contextlib.contextmanager
+def use_trace(trace: Optional[Trace]):
+    """Record this thread's timers into `trace` (no-op for None)."""
+    if trace is None:
+        yield None
+        return
+    ident = threading.get_ident()
+    token = _CURRENT.set(trace)
+    with trace._lock:
+        trace._threads[ident] += 1
+    try:
+        yield trace
+    finally:
+        with trace._lock:
+            trace._threads[ident] -= 1
+            if trace._threads[ident] <= 0:
+                del trace._threads[ident]
+        _CURRENT.reset(token)
+
+
+@contextlib.contextmanager
+def trace(trace_id: str):
+    """Trace a synchronous block; yields the Trace (None while disabled)."""
+    current = start_trace(trace_id)
+    try:
+        with use_trace(current):
+            yield current
+    finally:
+        if current is not None:
+            current.finish()
+
+
+def current_trace() -> Optional[Trace]:
+    return _CURRENT.get()
+
+
+# --- Sampling profiler ------------------------------------------------------ #
+
+def _stack(frame) -> str:
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+        frame = frame.f_back
+    return ";".join(reversed(frames))
+
+
+class SlowRequestProfiler:
+    """Samples the threads of open traces; dumps the stacks of slow ones."""
+
+    def __init__(
+        self,
+        enabled: bool = PROFILE_ENABLED,
+        interval: float = PROFILE_INTERVAL,
+        slow_seconds: float = PROFILE_SLOW_SECONDS,
+        out_dir: str = PROFILE_DIR,
+    ):
+        self.enabled = enabled
+        self.interval = interval
+        self.slow_seconds = slow_seconds
+        self.out_dir = out_dir
+        self._traces: set = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, trace: Trace) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._traces.add(trace)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="profiler", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                traces = list(self._traces)
+            if not traces:
+                continue
+            frames = sys._current_frames()
+            for trace in traces:
+                with trace._lock:
+                    idents = list(trace._threads)
+                for ident in idents:
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        trace.samples[_stack(frame)] += 1
+
+    def finished(self, trace: Trace) -> None:
+        with self._lock:
+            if trace not in self._traces:
+                return
+            self._traces.discard(trace)
+        if trace.seconds < self.slow_seconds or not trace.samples:
+            return
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(trace.wall_started))
+        path = os.path.join(self.out_dir, f"{stamp}-{trace.trace_id}.folded")
+        with open(path, "w") as f:
+            f.write(trace.folded())
+        trace.profile_path = path
+        count("profile.dumped")
+
+
+_PROFILER = SlowRequestProfiler()
+
+
+def enable_profiler(
+    on: bool = True,
+    slow_seconds: Optional[float] = None,
+    out_dir: Optional[str] = None,
+) -> None:
+    """Turn the slow-trace profiler on or off at runtime (default: AIDE_PROFILE)."""
+    _PROFILER.enabled = on
+    if slow_seconds is not None:
+        _PROFILER.slow_seconds = slow_seconds
+    if out_dir is not None:
+        _PROFILER.out_dir = out_dir
+
+
+# --- Exporter --------------------------------------------------------------- #
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_EXPORTER: Optional[ThreadingHTTPServer] = None
+_EXPORTER_LOCK = threading.Lock()
+
+
+def start_exporter(port: int, host: str = METRICS_HOST) -> ThreadingHTTPServer:
+    """Serve /metrics on a daemon thread (once per process); loopback by default."""
+    global _EXPORTER
+    with _EXPORTER_LOCK:
+        if _EXPORTER is None:
+            _EXPORTER = ThreadingHTTPServer((host, port), _MetricsHandler)
+            _EXPORTER.daemon_threads = True
+            threading.Thread(
+                target=_EXPORTER.serve_forever, name="metrics", daemon=True
+            ).start()
+    return _EXPORTER
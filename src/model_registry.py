@@ -0,0 +1,299 @@
+"""
+Model artifacts and a version-keyed model registry.
+
+Artifacts live in ARTIFACTS_DIR/<version>/ (see train_model.save_artifact).
+The registry keeps a few versions resident (LRU), tracks which one is the
+champion, and can watch ARTIFACTS_DIR so retrained models are loaded off the
+request path and swapped in without restarting the process.
+"""
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from config import (
+    FEATURE_ORDER,
+    MODEL_PATH,
+    ARTIFACTS_DIR,
+    ARTIFACT_FORMAT_VERSION,
+    REGISTRY_CAPACITY,
+    REGISTRY_POLL_SECONDS,
+    REGISTRY_RETRY_MAX_SECONDS,
+)
+
+LEGACY_VERSION = "legacy-pickle"
+
+
+# --- Artifact loading ------------------------------------------------------- #
+
+def _created_at(root, version):
+    """Manifest created_at (ISO, UTC) of a version; "" if it cannot be read."""
+    try:
+        with open(os.path.join(root, version, "manifest.json")) as f:
+            return str(json.load(f).get("created_at") or "")
+    except (OSError, ValueError):
+        return ""
+
+
+def list_artifacts(root=ARTIFACTS_DIR):
+    """
+    Versions under `root` that have a manifest, oldest first by the manifest's
+    created_at (then by name), so the order does not depend on naming.
+    """
+    if not os.path.isdir(root):
+        return []
+    versions = [
+        d for d in os.listdir(root)
+        if os.path.exists(os.path.join(root, d, "manifest.json"))
+    ]
+    return sorted(versions, key=lambda v: (_created_at(root, v), v))
+
+
+def latest_artifact(root=ARTIFACTS_DIR):
+    """Newest artifact directory (by manifest time) that has a manifest, or None."""
+    versions = list_artifacts(root)
+    return os.path.join(root, versions[-1]) if versions else None
+
+
+def read_manifest(artifact_dir):
+    """Read and validate an artifact manifest against this build's FEATURE_ORDER."""
+    with open(os.path.join(artifact_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    if manifest.get("format_version", 0) > ARTIFACT_FORMAT_VERSION:
+        raise ValueError(
+            f"Artifact {artifact_dir} has format {manifest['format_version']}, "
+            f"this build reads up to {ARTIFACT_FORMAT_VERSION}"
+        )
+    if manifest.get("feature_order") != FEATURE_ORDER:
+        raise ValueError(
+            f"Artifact {artifact_dir} was trained on {manifest.get('feature_order')}, "
+            f"expected {FEATURE_ORDER}"
+        )
+    return manifest
+
+
+def load_artifact(artifact_dir):
+    """Load (model, manifest) from an artifact directory (full read of the booster)."""
+    from xgboost import XGBClassifier
+
+    manifest = read_manifest(artifact_dir)
+    model = XGBClassifier()
+    model.load_model(os.path.join(artifact_dir, manifest["booster"]))
+    return model, manifest
+
+
+def load_pickle(path):
+    """Load (model, manifest) from the legacy {"model", "features"} pickle."""
+    with open(path, "rb") as f:
+        obj = pickle.load(f)
+    # Support both raw model or dict {"model": model, "features": ...}
+    if not isinstance(obj, dict):
+        return obj, {"version": LEGACY_VERSION}
+    features = obj.get("features")
+    if features is not None and list(features) != FEATURE_ORDER:
+        raise ValueError(
+            f"Model at {path} was trained on {features}, expected {FEATURE_ORDER}"
+        )
+    return obj.get("model"), {"version": LEGACY_VERSION, "feature_order": features}
+
+
+@metrics.timed("model.load_path")
+def load_path(path):
+    """Load (model, manifest) from an artifact directory or a legacy pickle."""
+    if os.path.isdir(path):
+        return load_artifact(path)
+    if os.path.exists(path):
+        return load_pickle(path)
+    raise FileNotFoundError(
+        f"Model not found at {path}. Train and save the model first."
+    )
+
+
+# --- Registry --------------------------------------------------------------- #
+
+class ModelEntry:
+    """A resident model version. `cache` holds objects derived from the model."""
+
+    __slots__ = ("version", "model", "manifest", "cache")
+
+    def __init__(self, version, model, manifest):
+        self.version = version
+        self.model = model
+        self.manifest = manifest
+        self.cache = {}
+
+
+class ModelRegistry:
+    """
+    Keeps up to `capacity` model versions resident with LRU eviction.
+    The champion (default for get()) is never evicted and is replaced by a
+    single reference swap, so in-flight requests finish on the entry they got.
+    An artifact that fails to load is retried with a doubling delay, capped at
+    `retry_max`, while the current champion keeps serving.
+    """
+
+    def __init__(
+        self,
+        root=ARTIFACTS_DIR,
+        capacity=REGISTRY_CAPACITY,
+        poll_interval=REGISTRY_POLL_SECONDS,
+        legacy_path=MODEL_PATH,
+        retry_max=REGISTRY_RETRY_MAX_SECONDS,
+    ):
+        self.root = root
+        self.capacity = max(1, capacity)
+        self.poll_interval = poll_interval
+        self.legacy_path = legacy_path
+        self.retry_max = retry_max
+        self._entries = OrderedDict()
+        self._champion = None
+        self._seen = set()
+        self._failures = {}  # path -> (attempts, monotonic time of next retry, error)
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    # Lookup
+
+    def get(self, version=None):
+        """Entry for `version` (default: champion), loading it if not resident."""
+        if version is None:
+            entry = self._champion
+            if entry is None:
+                self.refresh()
+                entry = self._champion
+            if entry is None:
+                failures = "; ".join(
+                    f"{path}: {error!r}"
+                    for path, (_, _, error) in self._failures.items()
+                )
+                raise FileNotFoundError(
+                    f"No loadable model: {failures}"
+                    if failures
+                    else f"No model artifacts in {self.root} "
+                    f"and no model at {self.legacy_path}"
+                )
+            return entry
+        with self._lock:
+            entry = self._entries.get(version)
+            if entry is not None:
+                self._entries.move_to_end(version)
+                return entry
+        return self.load(os.path.join(self.root, version))
+
+    def champion_version(self):
+        entry = self._champion
+        return entry.version if entry is not None else None
+
+    def versions(self):
+        """Resident versions, least recently used first."""
+        with self._lock:
+            return list(self._entries)
+
+    # Loading
+
+    def load(self, path, promote=False):
+        """Load an artifact directory or pickle, register it, optionally promote it."""
+        with self._load_lock:
+            model, manifest = load_path(path)
+        version = manifest.get("version") or os.path.basename(os.path.normpath(path))
+        entry = ModelEntry(version, model, manifest)
+        with self._lock:
+            self._seen.add(version)
+            self._entries[version] = entry
+            self._entries.move_to_end(version)
+            if promote or self._champion is None:
+                self._champion = entry
+            self._evict()
+        return entry
+
+    def _evict(self):
+        while len(self._entries) > self.capacity:
+            for version in self._entries:
+                if self._champion is None or version != self._champion.version:
+                    del self._entries[version]
+                    break
+            else:
+                break
+
+    def refresh(self):
+        """
+        Promote the newest artifact if it has not been seen yet. While nothing is
+        loaded, a newest artifact that fails falls back to the newest loadable
+        older artifact and then to the legacy pickle. Serialised, so concurrent
+        first get() calls load the model once. Raises the newest artifact's
+        load error unless a fallback was promoted; returns the champion version.
+        """
+        with self._refresh_lock:
+            versions = list_artifacts(self.root)
+            paths = [os.path.join(self.root, v) for v in versions]
+            error = None
+            newest = versions[-1] if versions else None
+            if newest is not None and newest not in self._seen:
+                if self._retry_due(paths[-1]):
+                    error = self._try_load(paths[-1])
+            if self._champion is None:
+                fallbacks = paths[::-1]  # the newest is skipped while backing off
+                if os.path.exists(self.legacy_path):
+                    fallbacks.append(self.legacy_path)
+                for path in fallbacks:
+                    if self._retry_due(path):
+                        failed = self._try_load(path)
+                        if failed is None:
+                            error = None
+                            break
+                        error = error or failed
+            if error is not None:
+                raise error
+            return self.champion_version()
+
+    def _retry_due(self, path):
+        failure = self._failures.get(path)
+        return failure is None or time.monotonic() >= failure[1]
+
+    def _try_load(self, path):
+        """Load and promote `path`; on failure schedule a retry and return the error."""
+        try:
+            self.load(path, promote=True)
+        except Exception as e:
+            attempts = self._failures.get(path, (0, 0.0, None))[0] + 1
+            delay = min(self.poll_interval * 2 ** (attempts - 1), self.retry_max)
+            self._failures[path] = (attempts, time.monotonic() + delay, e)
+            metrics.count("model.load_failures")
+            return e
+        self._failures.pop(path, None)
+        return None
+
+    # Watching
+
+    def start_watching(self):
+        """Poll `root` every `poll_interval` seconds in a daemon thread."""
+        if self._watcher is not None and self._watcher.is_alive():
+            return self._watcher
+        self._stop.clear()
+        self._watcher = threading.Thread(
+            target=self._watch, name="model-registry-watch", daemon=True
+        )
+        self._watcher.start()
+        return self._watcher
+
+    def stop_watching(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def _watch(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                # A broken artifact must not take the watcher down; refresh()
+                # schedules its retry and the champion keeps serving.
+                pass
+            self._stop.wait(self.poll_interval)
@@ -0,0 +1,65 @@
+"""
+Content-addressed cache for OCR results.
+
+Keys are sha256 of the OCR settings (backend, language, DPI, preprocessing,
+page caps) plus the document bytes, so a rerun or a re-upload of the same
+file skips decoding, preprocessing and OCR. Values are JSON (image text or
+per-page PDF results) stored in a DiskLRUCache (see disk_cache.py). Values go
+in and come out as copies, so callers may mutate what they put or get.
+"""
+import copy
+import hashlib
+import json
+import threading
+from typing import Any, Dict, Optional
+
+from config import OCR_CACHE_DIR, OCR_CACHE_MAX_BYTES, OCR_CACHE_SIZE
+from disk_cache import DiskLRUCache
+
+
+class OcrCache(DiskLRUCache):
+    """OCR result store; cache_dir=None is memory only."""
+
+    suffix = ".json"
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = OCR_CACHE_DIR,
+        max_bytes: int = OCR_CACHE_MAX_BYTES,
+        capacity: int = OCR_CACHE_SIZE,
+    ):
+        super().__init__(cache_dir, capacity, max_bytes)
+
+    @staticmethod
+    def key(data: bytes, settings: Dict[str, Any]) -> str:
+        h = hashlib.sha256(json.dumps(settings, sort_keys=True).encode())
+        h.update(b"\0")
+        h.update(data)
+        return h.hexdigest()
+
+    def dumps(self, value: Any) -> bytes:
+        return json.dumps(value).encode()
+
+    def loads(self, payload: bytes) -> Any:
+        return json.loads(payload)
+
+    def get(self, key: str) -> Optional[Any]:
+        value = super().get(key)
+        return None if value is None else copy.deepcopy(value)
+
+    def put(self, key: str, value: Any) -> None:
+        super().put(key, copy.deepcopy(value))
+
+
+_DEFAULT_CACHE: Optional[OcrCache] = None
+_DEFAULT_LOCK = threading.Lock()
+
+
+def get_ocr_cache() -> OcrCache:
+    """Process-wide cache (created on first use)."""
+    global _DEFAULT_CACHE
+    if _DEFAULT_CACHE is None:
+        with _DEFAULT_LOCK:
+            if _DEFAULT_CACHE is None:
+                _DEFAULT_CACHE = OcrCache()
+    return _DEFAULT_CACHE
@@ -0,0 +1,539 @@
+"""
+Document OCR engine for images and multi-page PDFs.
+
+PDF pages are rasterized lazily, one page per task inside the worker process
+that OCRs it, so a document never sits fully rasterized in memory. Results
+stream back as pages finish (completion order) for progress reporting, and
+per-document caps bound the page count and total pixels.
+
+Born-digital PDFs skip all of that: pages whose text layer (Poppler's
+pdftotext) carries usable text are returned directly, and only the remaining
+pages are rasterized and OCR'd. Each result says which path it took.
+
+Each worker process holds one OcrBackend (a tesserocr API handle, or a warm
+EasyOCR Reader) with its language data loaded once; images reach it as
+in-memory buffers. Tasks go through a bounded queue: submitters block once
+OCR_QUEUE_SIZE tasks are outstanding, and give up after OCR_QUEUE_TIMEOUT.
+
+Finished results are cached by content and settings (see ocr_cache.py).
+extract_fields() reads payslip fields from an image without OCR'ing the whole
+page (see doc_fields.py).
+"""
+import logging
+import multiprocessing as mp
+import os
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import pytesseract
+from PIL import Image
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+import metrics
+from config import (
+    FIELD_DETECT_MAX_SIDE,
+    FIELD_LABEL_WIDTH,
+    FIELD_ROW_PAD,
+    FIELD_TRIAGE_MAX_SIDE,
+    OCR_BACKEND,
+    OCR_DPI,
+    OCR_LANG,
+    OCR_MAX_PAGES,
+    OCR_MAX_PIXELS,
+    OCR_MIN_TEXT_CHARS,
+    OCR_QUEUE_SIZE,
+    OCR_QUEUE_TIMEOUT,
+    OCR_WORKERS,
+)
+from doc_fields import Box, extract_fields, union_boxes
+from ocr_cache import OcrCache, get_ocr_cache
+
+log = logging.getLogger(__name__)
+
+
+class OcrBusyError(RuntimeError):
+    """The OCR queue stayed full for longer than the submit timeout."""
+
+
+# --- Backends --------------------------------------------------------------- #
+
+class TesseractBackend:
+    """
+    tesserocr C-API handle (traineddata loaded once, image passed in memory).
+    Falls back to pytesseract (one tesseract process per call) without it.
+    """
+
+    name = "tesseract"
+    # image_to_data columns that identify a text line
+    LINE_KEYS = ("block_num", "par_num", "line_num")
+
+    def __init__(self, lang: str = OCR_LANG):
+        self.lang = lang
+        try:
+            import tesserocr
+        except ImportError:
+            log.warning(
+                "tesserocr is not installed; falling back to pytesseract, which "
+                "starts one tesseract process per call"
+            )
+            metrics.count("ocr.pytesseract_fallback")
+            self._tesserocr = self._api = None
+        else:
+            self._tesserocr = tesserocr
+            self._api = tesserocr.PyTessBaseAPI(lang=lang)
+
+    def image_to_string(self, image: Image.Image) -> str:
+        if self._api is None:
+            return pytesseract.image_to_string(image, lang=self.lang)
+        self._api.SetImage(image)
+        return self._api.GetUTF8Text()
+
+    def read_lines(self, image: Image.Image) -> List[Tuple[str, Box]]:
+        """(text, (x, y, w, h)) for each text line Tesseract finds."""
+        if self._api is None:
+            data = pytesseract.image_to_data(
+                image, lang=self.lang, output_type=pytesseract.Output.DICT
+            )
+            words: Dict[tuple, list] = {}
+            for i, word in enumerate(data["text"]):
+                if word.strip():
+                    line = tuple(data[k][i] for k in self.LINE_KEYS)
+                    box = tuple(data[k][i] for k in ("left", "top", "width", "height"))
+                    words.setdefault(line, []).append((word, box))
+            return [
+                (" ".join(w for w, _ in line), union_boxes(b for _, b in line))
+                for line in words.values()
+            ]
+        level = self._tesserocr.RIL.TEXTLINE
+        self._api.SetImage(image)
+        self._api.Recognize()
+        iterator = self._api.GetIterator()
+        if iterator is None:
+            return []
+        lines = []
+        for item in self._tesserocr.iterate_level(iterator, level):
+            box = item.BoundingBox(level)
+            if box is not None:
+                x0, y0, x1, y1 = box
+                text = item.GetUTF8Text(level) or ""
+                lines.append((text, (x0, y0, x1 - x0, y1 - y0)))
+        return lines
+
+    def read_line(self, image: Image.Image) -> str:
+        """Text of a crop holding a single line (page segmentation skipped)."""
+        if self._api is None:
+            return pytesseract.image_to_string(image, lang=self.lang, config="--psm 7")
+        self._api.SetPageSegMode(self._tesserocr.PSM.SINGLE_LINE)
+        try:
+            self._api.SetImage(image)
+            return self._api.GetUTF8Text()
+        finally:
+            self._api.SetPageSegMode(self._tesserocr.PSM.AUTO)
+
+
+class EasyOcrBackend:
+    """Warm easyocr.Reader (CPU); lines are joined in reading order."""
+
+    name = "easyocr"
+    # Tesseract language codes -> EasyOCR codes
+    LANGS = {"eng": "en", "hin": "hi", "kan": "kn", "tam": "ta", "mal": "ml"}
+
+    def __init__(self, lang: str = OCR_LANG):
+        import easyocr
+
+        langs = [self.LANGS.get(code, code) for code in lang.split("+")]
+        self._reader = easyocr.Reader(langs, gpu=False, verbose=False)
+
+    def image_to_string(self, image: Image.Image) -> str:
+        lines = self._reader.readtext(np.asarray(image), detail=0, paragraph=True)
+        return "\n".join(lines)
+
+    def read_lines(self, image: Image.Image) -> List[Tuple[str, Box]]:
+        """(text, (x, y, w, h)) for each detected text segment."""
+        lines = []
+        for points, text, _ in self._reader.readtext(np.asarray(image), detail=1):
+            xs, ys = [p[0] for p in points], [p[1] for p in points]
+            x0, y0 = int(min(xs)), int(min(ys))
+            lines.append((text, (x0, y0, int(max(xs)) - x0, int(max(ys)) - y0)))
+        return lines
+
+    def read_line(self, image: Image.Image) -> str:
+        return " ".join(self._reader.readtext(np.asarray(image), detail=0))
+
+
+BACKENDS = {"tesseract": TesseractBackend, "easyocr": EasyOcrBackend}
+
+
+# --- Single images ---------------------------------------------------------- #
+
+# Image preprocessing settings (part of the OCR cache key)
+PREPROCESS = {"threshold": "otsu", "median_blur": 3}
+
+
+def preprocess(img: np.ndarray) -> Image.Image:
+    """Grayscale, Otsu threshold and median denoise of a BGR image."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    return Image.fromarray(cv2.medianBlur(thresh, PREPROCESS["median_blur"]))
+
+
+def decode_image(data: bytes) -> np.ndarray:
+    """BGR array from encoded JPEG/PNG bytes. Raises ValueError if undecodable."""
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image. File might be corrupted.")
+    return img
+
+
+# --- PDF text layer -------------------------------------------------------- #
+
+def extract_text_layer(pdf_path: str, last_page: int) -> List[str]:
+    """
+    Text layer of pages 1..last_page via Poppler's pdftotext, one string per
+    page. Returns [] if pdftotext is unavailable or fails.
+    """
+    cmd = ["pdftotext", "-layout", "-enc", "UTF-8", "-l", str(last_page)]
+    try:
+        out = subprocess.run(
+            cmd + [pdf_path, "-"], capture_output=True, check=True, timeout=120
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return []
+    # pdftotext ends every page with a form feed
+    return out.decode("utf-8", "replace").split("\f")[:last_page]
+
+
+def has_usable_text(text: str) -> bool:
+    """Enough letters/digits that the page does not need OCR."""
+    return sum(c.isalnum() for c in text) >= OCR_MIN_TEXT_CHARS
+
+
+# --- Worker side ------------------------------------------------------------ #
+
+# Per-worker backend (set by _init_worker)
+_BACKEND = None
+
+
+def _init_worker(backend: str, lang: str, tesseract_cmd: str) -> None:
+    global _BACKEND
+    # Spawned workers re-import pytesseract; carry over a configured binary path
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    _BACKEND = BACKENDS[backend](lang)
+
+
+def _backend_name() -> str:
+    return _BACKEND.name
+
+
+def _ocr_image(data: bytes) -> str:
+    """Decode, preprocess and OCR one encoded image."""
+    return _BACKEND.image_to_string(preprocess(decode_image(data)))
+
+
+def _image_fields(data: bytes) -> Dict[str, object]:
+    """Field extraction from one encoded image, OCR'ing only labelled rows."""
+    return extract_fields(decode_image(data), _BACKEND)
+
+
+def _ocr_page(pdf_path: str, page: int, dpi: int) -> Dict[str, object]:
+    """Rasterize and OCR one page; failures are reported, not raised."""
+    t0 = time.perf_counter()
+    result: Dict[str, object] = {"page": page}
+    try:
+        image = convert_from_path(
+            pdf_path, dpi=dpi, first_page=page, last_page=page, grayscale=True
+        )[0]
+        t1 = time.perf_counter()
+        result["pixels"] = image.width * image.height
+        result["text"] = _BACKEND.image_to_string(image)
+        result["rasterize_seconds"] = round(t1 - t0, 4)
+        result["ocr_seconds"] = round(time.perf_counter() - t1, 4)
+    except Exception as e:  # one bad page must not sink the whole document
+        result.update(pixels=0, text="", error=str(e))
+    result["seconds"] = round(time.perf_counter() - t0, 4)
+    return result
+
+
+def _page_pixels(info: Dict[str, object], dpi: int) -> int:
+    """Estimated raster size of a page from pdfinfo's "Page size" (points)."""
+    match = re.match(r"([\d.]+) x ([\d.]+)", str(info.get("Page size", "")))
+    w_pt, h_pt = (float(v) for v in match.groups()) if match else (612.0, 792.0)
+    return int(w_pt * dpi / 72) * int(h_pt * dpi / 72)
+
+
+# --- Engine ----------------------------------------------------------------- #
+
+class OcrEngine:
+    """Long-lived worker pool for document OCR (created on first PDF)."""
+
+    def __init__(
+        self,
+        workers: Optional[int] = OCR_WORKERS,
+        dpi: int = OCR_DPI,
+        lang: str = OCR_LANG,
+        max_pages: int = OCR_MAX_PAGES,
+        max_pixels: int = OCR_MAX_PIXELS,
+        text_layer: bool = True,
+        backend: str = OCR_BACKEND,
+        queue_size: int = OCR_QUEUE_SIZE,
+        queue_timeout: Optional[float] = OCR_QUEUE_TIMEOUT,
+        cache: Optional[OcrCache] = None,
+        use_cache: bool = True,
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(
+                f"Unknown OCR backend {backend!r}; choose from {list(BACKENDS)}"
+            )
+        self.workers = workers or os.cpu_count() or 1
+        self.dpi = dpi
+        self.lang = lang
+        self.max_pages = max_pages
+        self.max_pixels = max_pixels
+        self.text_layer = text_layer
+        self.backend = backend
+        self.queue_timeout = queue_timeout
+        self.cache = (cache or get_ocr_cache()) if use_cache else None
+        self._slots = threading.BoundedSemaphore(max(queue_size, 1))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: the Streamlit server is multi-threaded, so avoid fork
+                self._pool = ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=mp.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(
+                        self.backend,
+                        self.lang,
+                        pytesseract.pytesseract.tesseract_cmd,
+                    ),
+                )
+            return self._pool
+
+    def submit(self, fn, *args) -> Future:
+        """Queue a task on the pool, blocking while the queue is full."""
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise OcrBusyError("OCR queue is full; try again shortly")
+        try:
+            pool = self._executor()
+            try:
+                fut = pool.submit(fn, *args)
+            except BrokenProcessPool:  # a worker died: replace the pool once
+                with self._lock:
+                    if self._pool is pool:
+                        self._pool = None
+                pool.shutdown(wait=False)
+                fut = self._executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        fut.add_done_callback(lambda _: self._slots.release())
+        return fut
+
+    def warm(self) -> None:
+        """Start every worker and load its backend now instead of on first use."""
+        wait([self.submit(_backend_name) for _ in range(self.workers)])
+
+    def settings(self, kind: str) -> Dict[str, object]:
+        """Everything besides the input bytes that changes the OCR output."""
+        settings = {"kind": kind, "backend": self.backend, "lang": self.lang}
+        if kind == "image":
+            settings["preprocess"] = PREPROCESS
+        elif kind == "fields":
+            settings.update(
+                detect_max_side=FIELD_DETECT_MAX_SIDE,
+                triage_max_side=FIELD_TRIAGE_MAX_SIDE,
+                label_width=FIELD_LABEL_WIDTH,
+                row_pad=FIELD_ROW_PAD,
+            )
+        else:
+            settings.update(
+                dpi=self.dpi,
+                max_pages=self.max_pages,
+                max_pixels=self.max_pixels,
+                text_layer=self.text_layer,
+                min_text_chars=OCR_MIN_TEXT_CHARS,
+            )
+        return settings
+
+    def _run(self, stage: str, fn, *args):
+        # Workers are separate processes, so OCR is timed here, queueing included
+        with metrics.timer(stage):
+            return self.submit(fn, *args).result()
+
+    def _cached(self, key: str):
+        cached = self.cache.get(key)
+        metrics.count("ocr.cache_miss" if cached is None else "ocr.cache_hit")
+        return cached
+
+    def ocr_image(self, data: bytes) -> str:
+        """OCR an encoded JPEG/PNG in a worker. ValueError if undecodable."""
+        if self.cache is None:
+            return self._run("ocr.image", _ocr_image, data)
+        key = self.cache.key(data, self.settings("image"))
+        cached = self._cached(key)
+        if cached is not None:
+            return cached["text"]
+        text = self._run("ocr.image", _ocr_image, data)
+        self.cache.put(key, {"text": text})
+        return text
+
+    def extract_fields(self, data: bytes) -> Dict[str, object]:
+        """
+        Payslip/statement fields from an encoded image (see doc_fields.py),
+        OCR'ing only the labelled rows at full resolution. ValueError if
+        undecodable.
+        """
+        if self.cache is None:
+            return self._run("ocr.fields", _image_fields, data)
+        key = self.cache.key(data, self.settings("fields"))
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        result = self._run("ocr.fields", _image_fields, data)
+        self.cache.put(key, result)
+        return result
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+    def plan(self, pdf_path: str) -> Dict[str, object]:
+        """
+        Which pages come from the text layer and which need OCR, under the
+        caps: at most max_pages pages, and OCR pages within max_pixels.
+        """
+        info = pdfinfo_from_path(pdf_path)
+        total = int(info["Pages"])
+        last = min(total, self.max_pages)
+        t0 = time.perf_counter()
+        layer = extract_text_layer(pdf_path, last) if self.text_layer else []
+        layer_seconds = time.perf_counter() - t0
+        text_pages = {
+            page: text
+            for page, text in enumerate(layer, start=1)
+            if has_usable_text(text)
+        }
+        ocr_pages = [p for p in range(1, last + 1) if p not in text_pages]
+        by_pixels = self.max_pixels // max(_page_pixels(info, self.dpi), 1)
+        ocr_pages = ocr_pages[: int(by_pixels)]
+        return {
+            "total": total,
+            "planned": len(text_pages) + len(ocr_pages),
+            "text_pages": text_pages,
+            "ocr_pages": ocr_pages,
+            "layer_seconds": layer_seconds,
+        }
+
+    def iter_pdf(self, pdf_bytes: bytes) -> Iterator[Dict[str, object]]:
+        """
+        Yield one result per page as it is ready:
+        {"page", "text", "source" ("text" or "ocr"), "seconds", ...,
+         "done", "planned", "total"} plus "error" for a failed page.
+        Text-layer pages come first. For OCR pages, at most 2x workers are
+        in flight, and submission stops early if the real pixel count
+        exhausts the max_pixels budget. A cached document replays its
+        results at once, each marked "cached"; only documents read in full
+        without page errors are cached.
+        """
+        if self.cache is None:
+            yield from self._run_pdf(pdf_bytes)
+            return
+        key = self.cache.key(pdf_bytes, self.settings("pdf"))
+        cached = self._cached(key)
+        if cached is not None:
+            for result in cached:
+                yield {**result, "cached": True}
+            return
+        results = []
+        for result in self._run_pdf(pdf_bytes):
+            results.append(result)
+            yield result
+        if not any("error" in r for r in results):
+            self.cache.put(key, results)
+
+    def _run_pdf(self, pdf_bytes: bytes) -> Iterator[Dict[str, object]]:
+        fd, pdf_path = tempfile.mkstemp(suffix=".pdf")
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_bytes)
+        pending: Dict[Future, int] = {}  # future -> page
+        try:
+            plan = self.plan(pdf_path)
+            counts = {"planned": plan["planned"], "total": plan["total"]}
+            done = pixels = 0
+            per_page = plan["layer_seconds"] / max(len(plan["text_pages"]), 1)
+            for page, text in plan["text_pages"].items():
+                done += 1
+                yield {
+                    "page": page,
+                    "text": text,
+                    "source": "text",
+                    "pixels": 0,
+                    "seconds": round(per_page, 4),
+                    "done": done,
+                    **counts,
+                }
+
+            pages = iter(plan["ocr_pages"])
+            while True:
+                while len(pending) < 2 * self.workers and pixels < self.max_pixels:
+                    page = next(pages, None)
+                    if page is None:
+                        break
+                    pending[self.submit(_ocr_page, pdf_path, page, self.dpi)] = page
+                if not pending:
+                    break
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in sorted(finished, key=pending.get):
+                    page = pending.pop(fut)
+                    try:
+                        result = fut.result()
+                    except Exception as e:  # e.g. BrokenProcessPool: fail the page
+                        result = {
+                            "page": page,
+                            "pixels": 0,
+                            "text": "",
+                            "error": f"{type(e).__name__}: {e}",
+                            "seconds": 0.0,
+                        }
+                    if "error" in result:
+                        metrics.count("ocr.page_error")
+                    else:
+                        # Measured in the worker around rasterizing / image_to_string
+                        metrics.observe("ocr.rasterize", result["rasterize_seconds"])
+                        metrics.observe("ocr.image_to_string", result["ocr_seconds"])
+                    done += 1
+                    pixels += result["pixels"]
+                    yield {**result, "source": "ocr", "done": done, **counts}
+        finally:
+            for fut in pending:
+                fut.cancel()
+            wait(pending)
+            os.remove(pdf_path)
+
+
+_ENGINE: Optional[OcrEngine] = None
+_ENGINE_LOCK = threading.Lock()
+
+
+def get_ocr_engine() -> OcrEngine:
+    """Process-wide engine (created on first use)."""
+    global _ENGINE
+    if _ENGINE is None:
+        with _ENGINE_LOCK:
+            if _ENGINE is None:
+                _ENGINE = OcrEngine()
+    return _ENGINE
@@ -0,0 +1,361 @@
+"""
+Headless stage engine for the A.I.D.E application pipeline.
+
+Each agent is a Stage that declares the stages it needs. A Pipeline starts a
+stage on its thread pool as soon as all of its dependencies have finished,
+so independent stages overlap and an application takes as long as its
+critical path, not the sum of its stages. The heavy stages hand their work
+to the OCR worker processes and to OpenCV, which release the GIL.
+
+    Maya (validation) --.----------------------------.
+    Rex (document OCR) -+-> Victor (risk) -> Sophia  +-> Sage (decision)
+    Leo (face match) ---'----------------> (scoring) '
+
+Progress is published as events ({"stage", "status", "seconds", ...}) that a
+UI renders from its own thread through PipelineRun.events(). A failed stage
+skips everything downstream of it. With metrics enabled, each run carries a
+metrics.Trace of its stages and everything timed inside them.
+"""
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import metrics
+from config import PIPELINE_DOC_MAX_PAGES, PIPELINE_WORKERS
+
+WAITING, RUNNING, DONE, FAILED, SKIPPED = (
+    "waiting",
+    "running",
+    "done",
+    "failed",
+    "skipped",
+)
+
+
+class Stage:
+    """A named step; fn(inputs, deps) gets the run inputs and its deps' results."""
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[Dict[str, object], Dict[str, object]], object],
+        needs: Sequence[str] = (),
+        label: Optional[str] = None,
+    ):
+        self.name = name
+        self.fn = fn
+        self.needs = tuple(needs)
+        self.label = label or name
+
+
+class PipelineRun:
+    """One application going through a Pipeline (returned by Pipeline.run)."""
+
+    def __init__(
+        self, stages: Dict[str, Stage], inputs: Dict[str, object], run_id: str
+    ):
+        self.run_id = run_id
+        self.stages = stages
+        self.inputs = inputs
+        self.status = {name: WAITING for name in stages}
+        self.results: Dict[str, object] = {}
+        self.errors: Dict[str, BaseException] = {}
+        self.seconds: Dict[str, float] = {}
+        self.started = time.perf_counter()
+        self.wall_seconds: Optional[float] = None
+        self._futures = {name: Future() for name in stages}
+        self._events: "queue.Queue" = queue.Queue()
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self.trace = metrics.start_trace(run_id)
+
+    def _publish(self, stage: str, status: str, **extra) -> None:
+        self.status[stage] = status
+        event = {"stage": stage, "label": self.stages[stage].label, "status": status}
+        event.update(extra)
+        self._events.put(event)
+
+    def result(self, stage: str, timeout: Optional[float] = None) -> object:
+        """Wait for one stage; raises its error (or RuntimeError if skipped)."""
+        return self._futures[stage].result(timeout)
+
+    def wait(self, timeout: Optional[float] = None) -> Dict[str, object]:
+        """Wait for the whole run; returns every finished stage's result."""
+        self._done.wait(timeout)
+        return self.results
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def events(self, timeout: Optional[float] = None) -> Iterator[Dict[str, object]]:
+        """Yield events as they happen until the run finishes (or `timeout`)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                yield self._events.get(timeout=0.05)
+            except queue.Empty:
+                if self._done.is_set() and self._events.empty():
+                    return
+                if deadline is not None and time.monotonic() >= deadline:
+                    return
+
+    def progress(self) -> float:
+        """Share of stages that are no longer waiting or running."""
+        finished = sum(s in (DONE, FAILED, SKIPPED) for s in self.status.values())
+        return finished / len(self.status)
+
+    def critical_path(self) -> float:
+        """Longest chain of measured stage times, in seconds."""
+        finish: Dict[str, float] = {}
+        for name, stage in self.stages.items():  # stages are in dependency order
+            before = max((finish[d] for d in stage.needs), default=0.0)
+            finish[name] = before + self.seconds.get(name, 0.0)
+        return max(finish.values(), default=0.0)
+
+
+class Pipeline:
+    """Runs Stages concurrently in dependency order on a shared thread pool."""
+
+    def __init__(self, stages: Iterable[Stage], workers: int = PIPELINE_WORKERS):
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            unknown = [d for d in stage.needs if d not in self.stages]
+            if unknown:
+                raise ValueError(
+                    f"Stage {stage.name!r} needs {unknown}, which must be declared "
+                    "before it"
+                )
+            self.stages[stage.name] = stage
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="pipeline")
+        self._run_ids = itertools.count(1)
+        self._dependents: Dict[str, List[str]] = {name: [] for name in self.stages}
+        for stage in self.stages.values():
+            for dep in stage.needs:
+                self._dependents[dep].append(stage.name)
+
+    def run(self, inputs: Dict[str, object]) -> PipelineRun:
+        """Start an application; returns at once with its PipelineRun."""
+        run = PipelineRun(self.stages, inputs, f"app-{next(self._run_ids)}")
+        for stage in self.stages.values():
+            if not stage.needs:
+                self._start(run, stage)
+        return run
+
+    def _start(self, run: PipelineRun, stage: Stage) -> None:
+        with run._lock:
+            if run.status[stage.name] != WAITING:
+                return
+            run._publish(stage.name, RUNNING)
+        deps = {d: run.results[d] for d in stage.needs}
+        self._pool.submit(self._execute, run, stage, deps)
+
+    def _execute(self, run: PipelineRun, stage: Stage, deps: Dict[str, object]) -> None:
+        t0 = time.perf_counter()
+        try:
+            with metrics.use_trace(run.trace), metrics.timer(f"pipeline.{stage.name}"):
+                result = stage.fn(run.inputs, deps)
+        except BaseException as e:
+            self._finish(run, stage, None, e, time.perf_counter() - t0)
+        else:
+            self._finish(run, stage, result, None, time.perf_counter() - t0)
+
+    def _finish(
+        self,
+        run: PipelineRun,
+        stage: Stage,
+        result: object,
+        error: Optional[BaseException],
+        seconds: float,
+    ) -> None:
+        ready = []
+        with run._lock:
+            run.seconds[stage.name] = seconds
+            if error is None:
+                run.results[stage.name] = result
+                run._publish(stage.name, DONE, seconds=round(seconds, 4))
+                run._futures[stage.name].set_result(result)
+                for name in self._dependents[stage.name]:
+                    if all(d in run.results for d in self.stages[name].needs):
+                        ready.append(self.stages[name])
+            else:
+                run.errors[stage.name] = error
+                run._publish(
+                    stage.name, FAILED, seconds=round(seconds, 4), error=str(error)
+                )
+                run._futures[stage.name].set_exception(error)
+                self._skip_dependents(run, stage.name)
+            if all(s not in (WAITING, RUNNING) for s in run.status.values()):
+                run.wall_seconds = time.perf_counter() - run.started
+                metrics.observe("pipeline.application", run.wall_seconds)
+                if run.trace is not None:
+                    run.trace.finish()
+                run._done.set()
+        for next_stage in ready:
+            self._start(run, next_stage)
+
+    def _skip_dependents(self, run: PipelineRun, name: str) -> None:
+        for dependent in self._dependents[name]:
+            if run.status[dependent] == WAITING:
+                run._publish(dependent, SKIPPED, error=f"{name} failed")
+                run._futures[dependent].set_exception(
+                    RuntimeError(f"Stage {dependent!r} skipped: {name!r} failed")
+                )
+                self._skip_dependents(run, dependent)
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# --- A.I.D.E stages --------------------------------------------------------- #
+
+# Loan terms used by Sage (annual %, tenure in months)
+LOAN_RATES = {
+    "Personal Loan": 12.5,
+    "Home Loan": 9.5,
+    "Car Loan": 10.5,
+    "Business Loan": 14.0,
+}
+REJECTED_RATE = 16.0
+TENURE_MONTHS = 60
+APPROVAL_SCORE = 600
+# Documented income further than this from the declared one is flagged
+INCOME_TOLERANCE = 0.2
+
+
+def validate_application(inputs, deps) -> Dict[str, object]:
+    """Maya: required personal details, as credit_scoring input fields."""
+    app = inputs["application"]
+    if not str(app.get("name", "")).strip():
+        raise ValueError("Name is required")
+    if not 18 <= app.get("age", 0) <= 70:
+        raise ValueError("Age must be between 18 and 70")
+    if app.get("income", 0) <= 0 or app.get("loan_amount", 0) <= 0:
+        raise ValueError("Income and loan amount must be positive")
+    return {
+        "age": app["age"],
+        "monthly_income": app["income"],
+        "loan_amount": app["loan_amount"],
+        "employment_years": app.get("employment", 0),
+        "loan_type": app.get("loan_type", "Personal Loan"),
+    }
+
+
+def make_document_stage(
+    ocr_engine, max_pages: int = PIPELINE_DOC_MAX_PAGES
+) -> Callable:
+    """
+    Rex: fields from the uploaded income proof / bank statement. A PDF is read
+    page by page and reading stops once it yields an income, or after
+    max_pages pages; unread pages are never OCR'd.
+    """
+    from doc_fields import application_fields, join_pages, parse_fields
+
+    def read_pdf(data) -> Dict[str, object]:
+        results = []
+        pages = ocr_engine.iter_pdf(data)
+        try:
+            for result in pages:
+                results.append(result)
+                found = parse_fields(join_pages(results))
+                if application_fields(found) or len(results) >= max_pages:
+                    return found
+        finally:
+            pages.close()  # cancels the pages still queued for OCR
+        return parse_fields(join_pages(results))
+
+    def read_documents(inputs, deps) -> Dict[str, object]:
+        fields: Dict[str, object] = {}
+        errors = []
+        for data, is_pdf in inputs.get("documents", []):
+            # An unreadable upload leaves income unverified; it is not fatal
+            try:
+                if is_pdf:
+                    found = read_pdf(data)
+                else:
+                    found = ocr_engine.extract_fields(data)["fields"]
+            except Exception as e:
+                errors.append(str(e))
+                continue
+            for name, value in found.items():
+                fields.setdefault(name, value)
+        return {"fields": fields, "errors": errors, **application_fields(fields)}
+
+    return read_documents
+
+
+def make_face_stage(face_engine) -> Callable:
+    """Leo: ID photo vs selfie."""
+
+    def match_faces(inputs, deps) -> Dict[str, object]:
+        return face_engine.compare(
+            inputs["id_image"],
+            inputs["selfie_image"],
+            inputs.get("id_digest"),
+            inputs.get("selfie_digest"),
+        )
+
+    return match_faces
+
+
+def assess_risk(inputs, deps) -> Dict[str, object]:
+    """Victor: debt-to-income and whether the documents back the declared income."""
+    app, docs = deps["maya"], deps["rex"]
+    dti = (app["loan_amount"] / TENURE_MONTHS) / app["monthly_income"] * 100
+    documented = docs.get("monthly_income")
+    verified = None
+    if documented:
+        verified = abs(documented - app["monthly_income"]) <= (
+            INCOME_TOLERANCE * app["monthly_income"]
+        )
+    return {"dti": dti, "documented_income": documented, "income_verified": verified}
+
+
+def score_application(inputs, deps) -> Dict[str, object]:
+    """Sophia: credit score from income, DTI, age and face-match confidence."""
+    app, risk, face = deps["maya"], deps["victor"], deps["leo"]
+    score = min(
+        1000,
+        300
+        + (app["monthly_income"] / 50000) * 400
+        + max(0, 200 - risk["dti"] * 5)
+        + (50 if 25 <= app["age"] <= 60 else 0)
+        + face["confidence"],
+    )
+    return {"credit_score": score}
+
+
+def decide(inputs, deps) -> Dict[str, object]:
+    """Sage: approval, interest rate and EMI."""
+    app, score, face = deps["maya"], deps["sophia"], deps["leo"]
+    approved = score["credit_score"] >= APPROVAL_SCORE and bool(face["match"])
+    rate = LOAN_RATES.get(app["loan_type"], 12.5) if approved else REJECTED_RATE
+    r, n = rate / 1200, TENURE_MONTHS
+    emi = app["loan_amount"] * r * (1 + r) ** n / ((1 + r) ** n - 1)
+    return {"approved": approved, "rate": rate, "emi": emi}
+
+
+def aide_stages(ocr_engine, face_engine) -> List[Stage]:
+    return [
+        Stage("maya", validate_application, label="🧠 Maya (Data Validation)"),
+        Stage("rex", make_document_stage(ocr_engine), label="🔍 Rex (Document OCR)"),
+        Stage("leo", make_face_stage(face_engine), label="👤 Leo (Face Recognition)"),
+        Stage(
+            "victor", assess_risk, ("maya", "rex"), label="🛡 Victor (Risk Analysis)"
+        ),
+        Stage(
+            "sophia",
+            score_application,
+            ("maya", "victor", "leo"),
+            label="📊 Sophia (Credit Scoring)",
+        ),
+        Stage(
+            "sage",
+            decide,
+            ("maya", "sophia", "leo"),
+            label="🎯 Sage (Final Decision)",
+        ),
+    ]
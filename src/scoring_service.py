@@ -0,0 +1,433 @@
+"""
+Headless HTTP/JSON credit-scoring service with request micro-batching.
+
+    python scoring_service.py serve --port 8600
+    python scoring_service.py loadgen --url http://127.0.0.1:8600 --concurrency 64
+
+POST /score takes one application (INPUT_FIELDS, plus optional tenure_years)
+or a JSON list of them and returns approval, probability, risk level,
+interest rate and EMI for each. GET /healthz returns batching counters and
+GET /metrics the Prometheus metrics (recorded with AIDE_METRICS=1).
+
+A model call costs about the same for one row as for hundreds, so
+MicroBatcher holds the first queued request for up to `window` seconds,
+collects whatever else arrives (up to `max_batch`) and scores the lot with
+one predict_loan_approval_batch call. The queue is bounded: when it is full,
+or a request has waited longer than `max_wait`, the request is shed with
+503 + Retry-After instead of adding to everyone's latency. A request whose
+batch has not been scored SERVICE_SCORE_TIMEOUT seconds after that also gets
+a 503, and a body over SERVICE_MAX_BODY_BYTES a 413.
+"""
+import argparse
+import http.client
+import json
+import math
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import numpy as np
+
+import metrics
+from config import (
+    SERVICE_BATCH_WINDOW,
+    SERVICE_HOST,
+    SERVICE_MAX_BATCH,
+    SERVICE_MAX_BODY_BYTES,
+    SERVICE_MAX_WAIT,
+    SERVICE_PORT,
+    SERVICE_QUEUE_SIZE,
+    SERVICE_SCORE_TIMEOUT,
+    SERVICE_TENURE_YEARS,
+)
+from credit_scoring import (
+    calculate_emi,
+    calculate_interest_rate,
+    predict_loan_approval_batch,
+)
+
+REQUIRED_FIELDS = ("monthly_income", "loan_amount")
+# Accepted (min, max) per field; anything outside is a 400, so a single
+# request cannot make the batch's model or EMI arithmetic misbehave
+FIELD_RANGES = {
+    "age": (18, 100),
+    "monthly_income": (1, 1e9),
+    "loan_amount": (1, 1e10),
+    "employment_years": (0, 80),
+    "monthly_expenses": (0, 1e9),
+    "existing_loans": (0, 100),
+    "tenure_years": (1, 40),
+}
+
+BATCH_SIZE = metrics.HistogramFamily(
+    "aide_service_batch_size",
+    "Requests scored per model call.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+
+
+class Overloaded(RuntimeError):
+    """The request was shed (queue full or waited too long); retry later."""
+
+
+def validate(payload) -> Dict[str, float]:
+    """One application from JSON; raises ValueError with a client-facing message."""
+    if not isinstance(payload, dict):
+        raise ValueError("Each application must be a JSON object")
+    app = {}
+    for name, (low, high) in FIELD_RANGES.items():
+        value = payload.get(name)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{name} must be a number")
+        if not (math.isfinite(value) and low <= value <= high):
+            raise ValueError(f"{name} must be between {low:g} and {high:g}")
+        app[name] = value
+    missing = [name for name in REQUIRED_FIELDS if name not in app]
+    if missing:
+        raise ValueError(f"Missing required fields: {missing}")
+    return app
+
+
+def score_batch(apps: List[Dict[str, float]]) -> List[Dict[str, object]]:
+    """Decision, pricing and EMI for many applications (one model call)."""
+    scored = predict_loan_approval_batch(apps)
+    results = []
+    for app, row in zip(apps, scored):
+        risk = str(row["risk_level"])
+        rate = calculate_interest_rate(risk)
+        tenure = app.get("tenure_years", SERVICE_TENURE_YEARS)
+        results.append(
+            {
+                "approved": bool(row["approved"]),
+                "approval_probability": float(row["probability"]),
+                "risk_level": risk,
+                "interest_rate": rate,
+                "emi": calculate_emi(app["loan_amount"], rate, tenure),
+            }
+        )
+    return results
+
+
+# --- Batching --------------------------------------------------------------- #
+
+class MicroBatcher:
+    """Merges concurrent submit() calls into batched score_batch calls."""
+
+    def __init__(
+        self,
+        score: Callable[[List[Dict[str, float]]], List[object]] = score_batch,
+        window: float = SERVICE_BATCH_WINDOW,
+        max_batch: int = SERVICE_MAX_BATCH,
+        queue_size: int = SERVICE_QUEUE_SIZE,
+        max_wait: float = SERVICE_MAX_WAIT,
+    ):
+        self.score = score
+        self.window = window
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: "queue.Queue" = queue.Queue(queue_size)
+        self._thread = threading.Thread(target=self._run, name="batcher", daemon=True)
+        self._thread.start()
+        self.stats = Counter()
+
+    def submit(self, app: Dict[str, float]) -> Future:
+        """Queue one application; raises Overloaded when the queue is full."""
+        future: Future = Future()
+        try:
+            self._queue.put_nowait((future, app, time.monotonic()))
+        except queue.Full:
+            self.stats["shed_full"] += 1
+            metrics.count("service.shed_full")
+            raise Overloaded("Scoring queue is full") from None
+        return future
+
+    def _collect(self) -> Optional[list]:
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                # Past the window, still take whatever is already queued
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # finish this batch, then stop
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            now, live = time.monotonic(), []
+            for future, app, queued in batch:
+                if now - queued > self.max_wait:
+                    self.stats["shed_stale"] += 1
+                    metrics.count("service.shed_stale")
+                    future.set_exception(Overloaded("Request waited too long"))
+                else:
+                    live.append((future, app))
+            if not live:
+                continue
+            self.stats["batches"] += 1
+            self.stats["requests"] += len(live)
+            metrics.observe("service.queue_wait", now - batch[0][2])
+            BATCH_SIZE.observe(len(live))
+            try:
+                with metrics.timer("service.score_batch"):
+                    results = self.score([app for _, app in live])
+            except Exception:
+                # Re-score row by row so only the request that broke it fails
+                self.stats["batch_retries"] += 1
+                self._score_each(live)
+                continue
+            for (future, _), result in zip(live, results):
+                future.set_result(result)
+
+    def _score_each(self, live: list) -> None:
+        for future, app in live:
+            try:
+                future.set_result(self.score([app])[0])
+            except Exception as e:
+                self.stats["errors"] += 1
+                future.set_exception(e)
+
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def close(self) -> None:
+        """Score what is already queued, then stop the batch thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+# --- HTTP ------------------------------------------------------------------- #
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so clients reuse connections
+
+    def _send(self, status: int, body, headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body = metrics.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if self.path != "/healthz":
+            return self._send(404, {"error": "Not found"})
+        batcher = self.server.batcher
+        stats = dict(batcher.stats, queued=batcher.queued())
+        if stats.get("batches"):
+            stats["mean_batch"] = round(stats["requests"] / stats["batches"], 2)
+        self._send(200, stats)
+
+    def do_POST(self):
+        if self.path != "/score":
+            return self._send(404, {"error": "Not found"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length < 0:
+                raise ValueError("Invalid Content-Length")
+            if length > SERVICE_MAX_BODY_BYTES:
+                return self._send(  # the body is never read: drop the connection
+                    413,
+                    {"error": f"Body over {SERVICE_MAX_BODY_BYTES} bytes"},
+                    {"Connection": "close"},
+                )
+            payload = json.loads(self.rfile.read(length))
+            many = isinstance(payload, list)
+            apps = [validate(p) for p in (payload if many else [payload])]
+        except ValueError as e:  # includes JSONDecodeError
+            return self._send(400, {"error": str(e)})
+        batcher = self.server.batcher
+        retry = {"Retry-After": str(max(1, math.ceil(batcher.max_wait)))}
+        try:
+            futures = [batcher.submit(app) for app in apps]
+            # Queue time is capped by max_wait; past the deadline the model is stuck
+            deadline = time.monotonic() + batcher.max_wait + SERVICE_SCORE_TIMEOUT
+            results = [f.result(max(0.0, deadline - time.monotonic())) for f in futures]
+        except Overloaded as e:
+            return self._send(503, {"error": str(e)}, retry)
+        except FutureTimeout:
+            metrics.count("service.timeout")
+            return self._send(503, {"error": "Scoring timed out"}, retry)
+        except Exception as e:
+            return self._send(500, {"error": f"Scoring failed: {e}"})
+        self._send(200, results if many else results[0])
+
+    def log_message(self, format, *args):
+        pass  # one line per request would dominate the service's own cost
+
+
+class ScoringServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # listen backlog for bursts of new connections
+
+    def __init__(self, host: str = SERVICE_HOST, port: int = SERVICE_PORT, **batch):
+        super().__init__((host, port), ScoringHandler)
+        self.batcher = MicroBatcher(**batch)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "ScoringServer":
+        """Serve on a background thread (for tests and benchmarks)."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def close(self) -> None:
+        self.shutdown()
+        self.server_close()
+        self.batcher.close()
+
+
+# --- Load generator --------------------------------------------------------- #
+
+def load_test(
+    url: str,
+    apps: List[Dict[str, float]],
+    requests: int = 10_000,
+    concurrency: int = 64,
+) -> Dict[str, object]:
+    """
+    Closed-loop load: `concurrency` keep-alive clients POST one application
+    each until `requests` are done. Returns throughput, latency percentiles
+    (ms, successful requests) and a count per HTTP status.
+    """
+    parts = urlsplit(url)
+    bodies = [json.dumps(app).encode() for app in apps]
+    headers = {"Content-Type": "application/json"}
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    counter = iter(range(requests))
+    lock = threading.Lock()
+
+    def client():
+        conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+        local, codes = [], Counter()
+        for i in counter:  # shared iterator hands out request numbers
+            t0 = time.perf_counter()
+            try:
+                conn.request("POST", "/score", bodies[i % len(bodies)], headers)
+                response = conn.getresponse()
+                response.read()
+                codes[response.status] += 1
+                if response.status == 200:
+                    local.append(time.perf_counter() - t0)
+            except (OSError, http.client.HTTPException):
+                codes["error"] += 1
+                conn.close()
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            statuses.update(codes)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - t0
+    ms = np.asarray(latencies or [0.0]) * 1000
+    return {
+        "requests": requests,
+        "seconds": seconds,
+        "throughput": statuses[200] / seconds,
+        "p50": float(np.percentile(ms, 50)),
+        "p90": float(np.percentile(ms, 90)),
+        "p99": float(np.percentile(ms, 99)),
+        "statuses": dict(statuses),
+    }
+
+
+def format_report(report: Dict[str, object]) -> str:
+    return (
+        f"{report['throughput']:9.1f} req/s  p50 {report['p50']:7.2f} ms  "
+        f"p90 {report['p90']:7.2f} ms  p99 {report['p99']:7.2f} ms  "
+        f"{report['statuses']}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("serve", help="Run the scoring service")
+    p.add_argument("--host", default=SERVICE_HOST)
+    p.add_argument("--port", type=int, default=SERVICE_PORT)
+    p.add_argument("--window-ms", type=float, default=SERVICE_BATCH_WINDOW * 1000)
+    p.add_argument("--max-batch", type=int, default=SERVICE_MAX_BATCH)
+    p.add_argument("--queue-size", type=int, default=SERVICE_QUEUE_SIZE)
+    p.add_argument("--max-wait", type=float, default=SERVICE_MAX_WAIT)
+
+    p = sub.add_parser("loadgen", help="Load-test a running service")
+    p.add_argument("--url", default=f"http://{SERVICE_HOST}:{SERVICE_PORT}")
+    p.add_argument("--requests", type=int, default=10_000)
+    p.add_argument("--concurrency", type=int, default=64)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        server = ScoringServer(
+            args.host,
+            args.port,
+            window=args.window_ms / 1000,
+            max_batch=args.max_batch,
+            queue_size=args.queue_size,
+            max_wait=args.max_wait,
+        )
+        print(f"Scoring service on {server.url}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            server.batcher.close()
+    else:
+        from benchmarks import make_synthetic_apps
+
+        report = load_test(
+            args.url, make_synthetic_apps(1000), args.requests, args.concurrency
+        )
+        print(
+            f"{args.requests:,} requests, {args.concurrency} clients, "
+            f"{report['seconds']:.2f} s"
+        )
+        print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Non-blocking PayU settlement tracking.
+
+A disbursal is settled once the payment gateway reports a final status, which
+takes seconds. SettlementEngine tracks any number of in-flight transactions
+on one asyncio loop (a background thread, so Streamlit's script thread never
+waits). Each transaction is polled with exponential backoff and full jitter,
+so a month-end burst does not hit the gateway in lock-step. At most
+max_inflight gateway calls run at once, and a transaction still pending
+after `timeout` seconds is reported as expired.
+
+Every status change ("pending", then "settled", "failed" or "expired") is
+published to subscribers and kept for status() lookups. track() returns a
+future for the final event. The gateway is pluggable: any object with async
+initiate(txn_id, amount) and status(txn_id) methods that raises GatewayError
+on transient failures. StubPayUGateway simulates PayU latency, errors and
+declines for local runs and load tests.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+import metrics
+from config import (
+    PAYU_STUB_DECLINE_RATE,
+    PAYU_STUB_ERROR_RATE,
+    PAYU_STUB_LATENCY,
+    PAYU_STUB_SETTLE_SECONDS,
+    SETTLEMENT_BASE_DELAY,
+    SETTLEMENT_HISTORY,
+    SETTLEMENT_MAX_DELAY,
+    SETTLEMENT_MAX_INFLIGHT,
+    SETTLEMENT_TIMEOUT,
+)
+
+log = logging.getLogger(__name__)
+
+PENDING, SETTLED, FAILED, EXPIRED = "pending", "settled", "failed", "expired"
+FINAL_STATUSES = (SETTLED, FAILED, EXPIRED)
+
+
+class GatewayError(RuntimeError):
+    """Transient gateway failure (timeout, 5xx); the call is retried."""
+
+
+# --- Gateways --------------------------------------------------------------- #
+
+class StubPayUGateway:
+    """
+    In-process stand-in for PayU: every call takes `latency` seconds and
+    fails with GatewayError at `error_rate`; a disbursal settles (or, at
+    `decline_rate`, fails) `settle_seconds` after it was initiated.
+    """
+
+    def __init__(
+        self,
+        latency: Tuple[float, float] = PAYU_STUB_LATENCY,
+        settle_seconds: Tuple[float, float] = PAYU_STUB_SETTLE_SECONDS,
+        error_rate: float = PAYU_STUB_ERROR_RATE,
+        decline_rate: float = PAYU_STUB_DECLINE_RATE,
+        seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.settle_seconds = settle_seconds
+        self.error_rate = error_rate
+        self.decline_rate = decline_rate
+        self._rng = random.Random(seed)
+        self._txns: Dict[str, Tuple[float, bool, float]] = {}
+        self.calls = 0
+
+    async def _round_trip(self) -> None:
+        self.calls += 1
+        await asyncio.sleep(self._rng.uniform(*self.latency))
+        if self._rng.random() < self.error_rate:
+            raise GatewayError("PayU stub: upstream timeout")
+
+    async def initiate(self, txn_id: str, amount: float) -> None:
+        await self._round_trip()
+        # Idempotent per txn_id, like a retried PayU request
+        self._txns.setdefault(
+            txn_id,
+            (
+                time.monotonic() + self._rng.uniform(*self.settle_seconds),
+                self._rng.random() < self.decline_rate,
+                amount,
+            ),
+        )
+
+    async def status(self, txn_id: str) -> Dict[str, object]:
+        await self._round_trip()
+        settle_at, declined, amount = self._txns[txn_id]
+        if time.monotonic() < settle_at:
+            return {"status": PENDING, "amount": 0}
+        if declined:
+            return {"status": FAILED, "amount": 0}
+        return {"status": SETTLED, "amount": amount}
+
+
+# --- Engine ----------------------------------------------------------------- #
+
+class SettlementEngine:
+    """Concurrent settlement polling on a background event loop."""
+
+    def __init__(
+        self,
+        gateway=None,
+        base_delay: float = SETTLEMENT_BASE_DELAY,
+        max_delay: float = SETTLEMENT_MAX_DELAY,
+        timeout: float = SETTLEMENT_TIMEOUT,
+        max_inflight: int = SETTLEMENT_MAX_INFLIGHT,
+        history: int = SETTLEMENT_HISTORY,
+        seed: Optional[int] = None,
+    ):
+        self.gateway = gateway if gateway is not None else StubPayUGateway()
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.history = history
+        self._inflight = asyncio.Semaphore(max_inflight)
+        self._rng = random.Random(seed)
+        self._subscribers: List[Callable[[Dict[str, object]], None]] = []
+        self._status: "OrderedDict[str, Dict[str, object]]" = OrderedDict()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.polls = 0
+        self.gateway_errors = 0
+
+    def subscribe(self, callback: Callable[[Dict[str, object]], None]) -> None:
+        """Call `callback(event)` on every status change (on the engine's loop)."""
+        self._subscribers.append(callback)
+
+    def status(self, txn_id: str) -> Optional[Dict[str, object]]:
+        """Latest event for a transaction, or None if unknown."""
+        return self._status.get(txn_id)
+
+    def _publish(
+        self, txn_id: str, status: str, amount: float, polls: int, started: float
+    ) -> Dict[str, object]:
+        event = {
+            "txn_id": txn_id,
+            "status": status,
+            "amount": amount,
+            "polls": polls,
+            "seconds": round(time.monotonic() - started, 3),
+        }
+        if status in FINAL_STATUSES:
+            metrics.count(f"settlement.{status}")
+            metrics.observe("settlement.settle", event["seconds"])
+        self._status[txn_id] = event
+        self._status.move_to_end(txn_id)
+        while len(self._status) > self.history:
+            self._status.popitem(last=False)
+        for callback in self._subscribers:
+            try:
+                callback(event)
+            except Exception:  # one bad subscriber must not stall settlement
+                log.exception("Settlement subscriber failed for %s", txn_id)
+        return event
+
+    async def settle(self, txn_id: str, amount: float) -> Dict[str, object]:
+        """
+        Initiate a disbursal and poll until it is final; returns the final
+        event. Gateway errors are retried on the same backoff schedule. All
+        settle() calls of one engine must run on the same event loop.
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+        initiated, attempt, polls = False, 0, 0
+        while True:
+            result = None
+            try:
+                async with self._inflight:
+                    if not initiated:
+                        await self.gateway.initiate(txn_id, amount)
+                        initiated = True
+                        self._publish(txn_id, PENDING, 0, polls, started)
+                    else:
+                        polls += 1
+                        self.polls += 1
+                        result = await self.gateway.status(txn_id)
+            except GatewayError:
+                self.gateway_errors += 1
+                metrics.count("settlement.gateway_error")
+            if result is not None and result["status"] in (SETTLED, FAILED):
+                return self._publish(
+                    txn_id, result["status"], result["amount"], polls, started
+                )
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return self._publish(txn_id, EXPIRED, 0, polls, started)
+            # Full jitter: sleep a uniform share of the capped exponential delay
+            delay = min(self.max_delay, self.base_delay * 2 ** min(attempt, 30))
+            attempt += 1
+            await asyncio.sleep(min(self._rng.uniform(0, delay), remaining))
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="settlement", daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    def track(self, txn_id: str, amount: float) -> Future:
+        """Start settling in the background; the future resolves to the final event."""
+        return asyncio.run_coroutine_threadsafe(
+            self.settle(txn_id, amount), self._ensure_loop()
+        )
+
+    def close(self) -> None:
+        """Stop the background loop; unfinished track() futures are cancelled."""
+        with self._lock:
+            if self._loop is not None:
+                asyncio.run_coroutine_threadsafe(_cancel_tasks(), self._loop).result()
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join()
+                self._loop.close()
+                self._loop = self._thread = None
+
+
+async def _cancel_tasks() -> None:
+    tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+_ENGINE: Optional[SettlementEngine] = None
+_ENGINE_LOCK = threading.Lock()
+
+
+def get_settlement_engine() -> SettlementEngine:
+    """Process-wide engine (created on first use)."""
+    global _ENGINE
+    if _ENGINE is None:
+        with _ENGINE_LOCK:
+            if _ENGINE is None:
+                _ENGINE = SettlementEngine()
+    return _ENGINE
@@ -1,12 +1,10 @@
 import streamlit as st
 import pytesseract
-from PIL import Image
-import numpy as np
-import cv2
-import io
-from pdf2image import convert_from_bytes
 import os
 
+from doc_fields import application_fields, join_pages, parse_fields
+from ocr_engine import OcrBusyError, OcrEngine
+
 # --- Import localization functions ---
 from locales import LOCALES, get_translation
 # -------------------------------------
@@ -24,14 +22,23 @@ from locales import LOCALES, get_translation
 # POPPLER_PATH = r'C:\path\to\poppler-xx\Library\bin' 
 # os.environ['PATH'] += os.pathsep + POPPLER_PATH
 
-# --- OCR CORE FUNCTION (UNCHANGED) ---
+# --- OCR CORE FUNCTION ---
+
+@st.cache_resource
+def get_ocr_engine():
+    # One pool of warm OCR workers per server process, shared by all sessions
+    return OcrEngine(lang='eng')
 
-def extract_text_from_document(uploaded_file):
+def extract_text_from_document(uploaded_file, full_text=False):
     """
-    Extracts text from an uploaded image or PDF file using Tesseract.
-    (This function remains unchanged as per user request)
+    Extracts text and payslip fields (net salary, employer, account number)
+    from an uploaded image or PDF file using Tesseract. Returns (text, fields).
+    Images only have their labelled rows OCR'd (doc_fields.py) unless
+    full_text is set. PDF pages use their text layer when they have one; the
+    rest are OCR'd in parallel (ocr_engine.py), with a progress bar.
     """
     text = ""
+    fields = {}
     file_type = uploaded_file.type
     
     try:
@@ -39,46 +46,67 @@ def extract_text_from_document(uploaded_file):
         if file_type in ["image/jpeg", "image/png"]:
             st.info("Processing Image file...")
             
-            image_data = uploaded_file.read()
-            nparr = np.frombuffer(image_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if img is None:
-                st.error("Could not decode image. File might be corrupted.")
-                return ""
-            
-            # Preprocessing: Grayscale, Thresholding, Denoising
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            ret, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
-            denoised = cv2.medianBlur(thresh, 3) 
-            pil_image = Image.fromarray(denoised)
-            
-            text = pytesseract.image_to_string(pil_image, lang='eng')
-
-        # --- 2. Process PDF Files ---
+            try:
+                # Only the rows holding salary/employer/account labels are OCR'd
+                # at full resolution, in a warm worker
+                image_bytes = uploaded_file.read()
+                result = get_ocr_engine().extract_fields(image_bytes)
+                fields = result["fields"]
+                text = result["text"]
+                if full_text:
+                    # Whole page: preprocessed (grayscale, Otsu, denoise) and OCR'd
+                    text = get_ocr_engine().ocr_image(image_bytes)
+            except ValueError as e:
+                st.error(str(e))
+                return "", {}
+
+        # --- 2. Process PDF Files (all pages, streamed as they finish) ---
         elif file_type == "application/pdf":
             st.info("Processing PDF file...")
             
             pdf_bytes = uploaded_file.read()
-            images = convert_from_bytes(pdf_bytes, first_page=1, last_page=1)
+            progress = st.progress(0.0, text="Reading PDF...")
+            results = []
+            for result in get_ocr_engine().iter_pdf(pdf_bytes):
+                results.append(result)
+                path = "text layer" if result["source"] == "text" else "OCR"
+                progress.progress(
+                    result["done"] / result["planned"],
+                    text=f"Page {result['page']} via {path} ({result['done']}/{result['planned']})",
+                )
+                if "error" in result:
+                    st.warning(f"Page {result['page']} failed: {result['error']}")
+            progress.empty()
             
-            if images:
-                text = pytesseract.image_to_string(images[0], lang='eng')
+            if results:
+                text = join_pages(results)
+                fields = parse_fields(text)
+                if results[0].get("cached"):
+                    st.caption("Loaded from the OCR cache (same file processed before)")
+                from_layer = sum(r["source"] == "text" for r in results)
+                st.caption(f"{from_layer} page(s) read from the PDF text layer, {len(results) - from_layer} OCR'd")
+                if results[-1]["done"] < results[-1]["total"]:
+                    st.warning(
+                        f"Only the first {results[-1]['done']} of {results[-1]['total']} pages were read (page/size limit)."
+                    )
             else:
                 st.error("Could not convert PDF to image for OCR. Check Poppler configuration.")
 
         else:
             st.warning(f"Unsupported file type: {file_type}")
-            return ""
+            return "", {}
 
-        return text
+        return text, fields
 
+    except OcrBusyError as e:
+        st.error(f"{e}")
+        return "", {}
     except pytesseract.TesseractNotFoundError:
         st.error("Tesseract OCR is not found. Please check its installation and the path configuration in the code.")
-        return ""
+        return "", {}
     except Exception as e:
         st.error(f"An unexpected error occurred during OCR: {e}")
-        return ""
+        return "", {}
 
 # --- STREAMLIT UI ---
 
@@ -106,6 +134,7 @@ with st.sidebar:
     st.info(info_lang_select)
 
     st.header("2. Document Upload")
+    full_text = st.checkbox("OCR the full page of images (slower)", value=False)
 
 uploaded_file = st.file_uploader(
     "Upload a document (JPG, PNG, or PDF)", 
@@ -115,21 +144,26 @@ uploaded_file = st.file_uploader(
 if uploaded_file is not None:
     
     with st.spinner("Extracting text and determining status..."):
-        # 1. EXTRACT TEXT
-        extracted_text = extract_text_from_document(uploaded_file)
+        # 1. EXTRACT TEXT AND FIELDS
+        extracted_text, fields = extract_text_from_document(uploaded_file, full_text)
         
-        # 2. DUMMY LOAN DECISION LOGIC (NEW FEATURE)
-        loan_status = False
-        if extracted_text and len(extracted_text) > 100:
-            # DUMMY CHECK: ACCEPT if the extracted text is over 100 characters long
-            # PARAMETERS TO CHECK: "Salary" in extracted_text or "Income" in extracted_text or any required field.
-            loan_status = True
+        # 2. LOAN DECISION LOGIC: the document must show a salary
+        # (application_fields gives the credit_scoring inputs it supports)
+        application = application_fields(fields)
+        loan_status = application.get("monthly_income", 0) > 0
         
     st.markdown("---")
     
     if extracted_text.strip():
         st.subheader("✅ Extracted Text (English)")
         st.code(extracted_text, language='text', height=250)
+
+        st.subheader("Extracted Fields")
+        if fields:
+            st.json(fields)
+            st.caption(f"Scoring inputs: {application}")
+        else:
+            st.warning("No net salary, employer or account number found in the document.")
         
         # --- FINAL TRANSLATED RESULT DISPLAY ---
         st.subheader("Final Loan Status")
@@ -1,26 +1,53 @@
 # train_scratch.py (structure)
 
-import os, pickle
+import os, sys, pickle, json, argparse, hashlib, tempfile
+from datetime import datetime, timezone
 import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, roc_auc_score, classification_report
-from xgboost import XGBClassifier  
+import xgboost as xgb
+from xgboost import XGBClassifier
+
+from config import (
+    DATA_PATH,
+    FEATURE_ORDER,
+    MODEL_PATH,
+    TREES_PATH,
+    ARTIFACTS_DIR,
+    ARTIFACT_FORMAT_VERSION,
+    DATA_CACHE_DIR as CACHE_DIR,
+)
+from features import derive_features
+
+try:
+    import resource  # POSIX only; peak RSS reporting is skipped elsewhere
+except ImportError:
+    resource = None
 
 # ---------- Config ----------
 RANDOM_SEED = 42
-DATA_PATH = "credit_data.csv"
-MODEL_PATH = "models/loan_model.pkl"
-FEATURE_ORDER = [
-    "age",
-    "monthly_income",
-    "loan_amount",
-    "employment_years",
-    "debt_to_income",
-    "loan_to_income",
-    "employment_stability",
-    "existing_loans",
-]
+XGB_PARAMS = dict(
+    max_depth=4,
+    n_estimators=200,
+    learning_rate=0.1,
+    subsample=0.9,
+    colsample_bytree=0.9,
+    eval_metric="logloss",
+    random_state=RANDOM_SEED,
+)
+TEST_SIZE = 0.2
+CHUNK_SIZE = 500_000
+# Narrow dtypes for streaming reads (the derived columns are recomputed)
+CSV_DTYPES = {
+    "age": "float32",
+    "monthly_income": "float32",
+    "loan_amount": "float32",
+    "employment_years": "float32",
+    "monthly_expenses": "float32",
+    "existing_loans": "int8",
+    "approved": "int8",
+}
 
 # ---------- 1) Data loading / synthetic generation ----------
 def load_or_make_data():
@@ -32,13 +59,112 @@ def load_or_make_data():
         )
     return df
 
+# ---------- 1b) Columnar binary cache ----------
+def source_sha256(path, cache_dir=CACHE_DIR):
+    """
+    sha256 of the CSV, memoised in cache_dir/sources.json by (path, size, mtime)
+    so unchanged files are not re-hashed on every run.
+    """
+    st = os.stat(path)
+    stamp = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+    index_path = os.path.join(cache_dir, "sources.json")
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+    if stamp not in index:
+        index[stamp] = file_sha256(path)
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(index_path + ".tmp", "w") as f:
+            json.dump(index, f)
+        os.replace(index_path + ".tmp", index_path)
+    return index[stamp]
+
+def build_column_cache(path=DATA_PATH, cache_dir=CACHE_DIR, chunksize=CHUNK_SIZE):
+    """
+    One-time conversion of the CSV into cache_dir/<sha256>/: X.npy, a
+    Fortran-ordered float32 (n, 8) matrix in FEATURE_ORDER (each feature is a
+    contiguous column), and y.npy (int8). Derived columns already in the file
+    are used as-is; they are only computed when missing.
+    """
+    digest = source_sha256(path, cache_dir)
+    out_dir = os.path.join(cache_dir, digest)
+    if os.path.exists(os.path.join(out_dir, "meta.json")):
+        return out_dir
+
+    header = pd.read_csv(path, nrows=0).columns
+    derived_present = all(c in header for c in FEATURE_ORDER)
+    usecols = FEATURE_ORDER + ["approved"] if derived_present else list(CSV_DTYPES)
+    dtypes = {c: CSV_DTYPES.get(c, "float32") for c in usecols}
+    # Rows as pandas parses them (quoted newlines, no final newline), not lines
+    n_rows = sum(
+        len(c) for c in pd.read_csv(path, usecols=usecols[:1], chunksize=chunksize)
+    )
+
+    os.makedirs(out_dir, exist_ok=True)
+    X = np.lib.format.open_memmap(
+        os.path.join(out_dir, "X.npy"), mode="w+", dtype=np.float32,
+        shape=(n_rows, len(FEATURE_ORDER)), fortran_order=True,
+    )
+    y = np.lib.format.open_memmap(
+        os.path.join(out_dir, "y.npy"), mode="w+", dtype=np.int8, shape=(n_rows,)
+    )
+    start = 0
+    for chunk in pd.read_csv(path, usecols=usecols, dtype=dtypes, chunksize=chunksize):
+        if not derived_present:
+            add_features(chunk, inplace=True)
+        stop = start + len(chunk)
+        X[start:stop] = chunk[FEATURE_ORDER].to_numpy(dtype=np.float32)
+        y[start:stop] = chunk["approved"].to_numpy()
+        start = stop
+    X.flush()
+    y.flush()
+    del X, y
+    if start != n_rows:  # no meta.json, so the next run rebuilds
+        raise ValueError(f"{path}: sized the cache for {n_rows} rows, read {start}")
+
+    with open(os.path.join(out_dir, "meta.json"), "w") as f:
+        json.dump(
+            {
+                "source": os.path.abspath(path),
+                "sha256": digest,
+                "rows": n_rows,
+                "features": FEATURE_ORDER,
+                "derived_from_file": derived_present,
+            },
+            f,
+            indent=2,
+        )
+    print(f"Cached {n_rows} rows of {path} in {out_dir}")
+    return out_dir
+
+def load_cached_data(path=DATA_PATH, cache_dir=CACHE_DIR):
+    """
+    (X DataFrame, y Series) backed by memory-mapped cache files, building the
+    cache on first use. The Fortran-ordered matrix matches pandas' block layout,
+    so the DataFrame wraps the mapped pages without copying.
+    """
+    out_dir = build_column_cache(path, cache_dir)
+    X = np.load(os.path.join(out_dir, "X.npy"), mmap_mode="r")
+    y = np.load(os.path.join(out_dir, "y.npy"), mmap_mode="r")
+    return (
+        pd.DataFrame(X, columns=FEATURE_ORDER, copy=False),
+        pd.Series(y, name="approved", copy=False),
+    )
+
 # ---------- 2) Feature engineering ----------
-def add_features(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    inc = df["monthly_income"].clip(lower=1)
-    df["debt_to_income"] = (df["monthly_expenses"] / inc * 100).clip(0, 300)
-    df["loan_to_income"] = (df["loan_amount"] / (inc * 12) * 100).clip(0, 500)
-    df["employment_stability"] = (df["employment_years"] / df["age"]).clip(0, 1)
+def add_features(df: pd.DataFrame, inplace: bool = False) -> pd.DataFrame:
+    if not inplace:
+        df = df.copy()
+    derived = derive_features(
+        df["monthly_income"].to_numpy(),
+        df["loan_amount"].to_numpy(),
+        df["monthly_expenses"].to_numpy(),
+        df["age"].to_numpy(),
+        df["employment_years"].to_numpy(),
+    )
+    for name, values in derived.items():
+        df[name] = values
     return df
 
 def select_features(df: pd.DataFrame):
@@ -54,20 +180,13 @@ def split_data(X, y):
 
 # ---------- 4) Model training ----------
 def train_model(X_train, y_train):
-    model = XGBClassifier(
-        max_depth=4,
-        n_estimators=200,
-        learning_rate=0.1,
-        subsample=0.9,
-        colsample_bytree=0.9,
-        eval_metric="logloss",
-        random_state=RANDOM_SEED,
-    )
+    model = XGBClassifier(**XGB_PARAMS)
     model.fit(X_train, y_train)
     return model
 
 # ---------- 5) Evaluation ----------
 def evaluate(model, X_train, y_train, X_test, y_test):
+    metrics = {}
     for split_name, X, y in [
         ("train", X_train, y_train),
         ("test", X_test, y_test),
@@ -77,26 +196,291 @@ def evaluate(model, X_train, y_train, X_test, y_test):
         acc = accuracy_score(y, preds)
         auc = roc_auc_score(y, proba)
         print(f"{split_name} accuracy: {acc:.3f} | AUC: {auc:.3f}")
+        metrics[f"{split_name}_accuracy"] = float(acc)
+        metrics[f"{split_name}_auc"] = float(auc)
     print("\nClassification report (test):")
     print(classification_report(y_test, model.predict(X_test)))
+    return metrics
 
 # ---------- 6) Save artifacts ----------
-def save_model(model):
-    os.makedirs("models", exist_ok=True)
+def file_sha256(path, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def save_artifact(model, metrics=None, data_path=DATA_PATH):
+    """
+    Write a versioned, pickle-free artifact: ARTIFACTS_DIR/<version>/ holding
+    booster.ubj, trees.npz and manifest.json (feature order, hash of the
+    training data at data_path, metrics).
+    The manifest is written last, so a directory without one is never loaded.
+    Versions carry microseconds and an existing directory is never reused.
+    """
+    created = datetime.now(timezone.utc)
+    version = created.strftime("v%Y%m%d%H%M%S%f")
+    artifact_dir = os.path.join(ARTIFACTS_DIR, version)
+    os.makedirs(ARTIFACTS_DIR, exist_ok=True)
+    os.mkdir(artifact_dir)  # FileExistsError rather than overwriting a version
+    model.get_booster().save_model(os.path.join(artifact_dir, "booster.ubj"))
+    export_trees(model, os.path.join(artifact_dir, "trees.npz"))
+    manifest = {
+        "format_version": ARTIFACT_FORMAT_VERSION,
+        "version": version,
+        "created_at": created.isoformat(),
+        "booster": "booster.ubj",
+        "trees": "trees.npz",
+        "feature_order": FEATURE_ORDER,
+        "data_sha256": (
+            file_sha256(data_path) if data_path and os.path.exists(data_path) else None
+        ),
+        "metrics": metrics or {},
+    }
+    tmp_path = os.path.join(artifact_dir, "manifest.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(artifact_dir, "manifest.json"))
+    print(f"Saved artifact {version} to {artifact_dir}")
+    return artifact_dir
+
+def save_model(model, metrics=None, data_path=DATA_PATH):
+    os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
+    # Legacy pickle, still read by older deployments
     with open(MODEL_PATH, "wb") as f:
         pickle.dump({"model": model, "features": FEATURE_ORDER}, f)
     print(f"Saved model to {MODEL_PATH}")
+    return save_artifact(model, metrics, data_path)
+
+# ---------- 7) Tree-array export ----------
+def export_trees(model, path=TREES_PATH):
+    """
+    Flatten the booster into flat node arrays for credit_scoring.TreeEnsemble.
+    All trees share one node table; tree t starts at roots[t]. Leaves point to
+    themselves so a fixed number of traversal steps (max depth) lands every row
+    on a leaf. Threshold/leaf values are the booster's own float32 values.
+    """
+    booster = model.get_booster()
+    learner = json.loads(booster.save_raw(raw_format="json"))["learner"]
+    trees = learner["gradient_booster"]["model"]["trees"]
+
+    cols = {k: [] for k in ("feature", "threshold", "left", "right", "missing", "value")}
+    roots, max_depth, offset = [], 0, 0
+    for tree in trees:
+        lc = np.asarray(tree["left_children"], dtype=np.int32)
+        rc = np.asarray(tree["right_children"], dtype=np.int32)
+        cond = np.asarray(tree["split_conditions"], dtype=np.float32)
+        default_left = np.asarray(tree["default_left"], dtype=bool)
+        leaf = lc == -1
+        own = np.arange(len(lc), dtype=np.int32)
+        left = np.where(leaf, own, lc)
+        right = np.where(leaf, own, rc)
+
+        cols["feature"].append(np.where(leaf, 0, tree["split_indices"]))
+        cols["threshold"].append(np.where(leaf, np.float32(0), cond))
+        cols["left"].append(left + offset)
+        cols["right"].append(right + offset)
+        cols["missing"].append(np.where(default_left, left, right) + offset)
+        cols["value"].append(np.where(leaf, cond, np.float32(0)))
+
+        # Children always have larger node ids than their parent
+        depth = np.zeros(len(lc), dtype=np.int32)
+        for i in np.flatnonzero(~leaf):
+            depth[lc[i]] = depth[rc[i]] = depth[i] + 1
+        max_depth = max(max_depth, int(depth.max()))
+        roots.append(offset)
+        offset += len(lc)
+
+    base_score = float(str(learner["learner_model_param"]["base_score"]).strip("[]"))
+    if learner["objective"]["name"] == "binary:logistic":
+        base_margin = float(np.log(base_score / (1 - base_score)))
+    else:
+        base_margin = base_score
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.savez(
+        path,
+        feature=np.concatenate(cols["feature"]).astype(np.int32),
+        threshold=np.concatenate(cols["threshold"]).astype(np.float32),
+        left=np.concatenate(cols["left"]).astype(np.int32),
+        right=np.concatenate(cols["right"]).astype(np.int32),
+        missing=np.concatenate(cols["missing"]).astype(np.int32),
+        value=np.concatenate(cols["value"]).astype(np.float32),
+        roots=np.asarray(roots, dtype=np.int32),
+        depth=np.int32(max_depth),
+        base_margin=np.float64(base_margin),
+        features=np.asarray(FEATURE_ORDER),
+    )
+    print(f"Exported {len(trees)} trees ({offset} nodes) to {path}")
+
+# ---------- 8) Streaming (out-of-core) training ----------
+def iter_chunks(path=DATA_PATH, chunksize=CHUNK_SIZE):
+    """Yield (X float32, y int8, is_test bool) per CSV chunk, features added in place."""
+    reader = pd.read_csv(
+        path, usecols=list(CSV_DTYPES), dtype=CSV_DTYPES, chunksize=chunksize
+    )
+    for i, chunk in enumerate(reader):
+        add_features(chunk, inplace=True)
+        X = chunk[FEATURE_ORDER].to_numpy(dtype=np.float32)
+        y = chunk["approved"].to_numpy()
+        # Seeded per chunk, so every pass over the file assigns the same split
+        rng = np.random.default_rng([RANDOM_SEED, i])
+        yield X, y, rng.random(len(chunk)) < TEST_SIZE
+
+class ChunkIter(xgb.DataIter):
+    """Feeds one side ("train"/"test") of the on-the-fly split to XGBoost."""
+
+    def __init__(self, path, part, chunksize=CHUNK_SIZE, cache_prefix=None):
+        self.path = path
+        self.part = part
+        self.chunksize = chunksize
+        self._chunks = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self._chunks is None:
+            self._chunks = iter_chunks(self.path, self.chunksize)
+        for X, y, is_test in self._chunks:
+            mask = is_test if self.part == "test" else ~is_test
+            if mask.any():
+                input_data(data=X[mask], label=y[mask], feature_names=FEATURE_ORDER)
+                return 1
+        return 0
+
+    def reset(self):
+        self._chunks = None
+
+def booster_params(params=XGB_PARAMS):
+    """Translate XGBClassifier kwargs into native xgb.train params."""
+    return {
+        "objective": "binary:logistic",
+        "tree_method": "hist",
+        "max_depth": params["max_depth"],
+        "eta": params["learning_rate"],
+        "subsample": params["subsample"],
+        "colsample_bytree": params["colsample_bytree"],
+        "eval_metric": ["logloss", "auc"],
+        "seed": params["random_state"],
+        "min_child_weight": params.get("min_child_weight", 1),
+    }
+
+def as_classifier(booster):
+    """Wrap a native Booster as an XGBClassifier for save_model/export_trees."""
+    model = XGBClassifier()
+    model.load_model(bytearray(booster.save_raw(raw_format="ubj")))
+    return model
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+
+def train_streaming(path=DATA_PATH, chunksize=CHUNK_SIZE):
+    """
+    Out-of-core training: the CSV is read in narrow-dtype chunks, split on the
+    fly, and fed through external-memory DMatrix caches, so peak memory is
+    bounded by the chunk size rather than the file size.
+    """
+    with tempfile.TemporaryDirectory(prefix="xgb-cache-") as cache_dir:
+        dtrain = xgb.DMatrix(
+            ChunkIter(path, "train", chunksize, os.path.join(cache_dir, "train"))
+        )
+        dtest = xgb.DMatrix(
+            ChunkIter(path, "test", chunksize, os.path.join(cache_dir, "test"))
+        )
+        booster = xgb.train(
+            booster_params(),
+            dtrain,
+            num_boost_round=XGB_PARAMS["n_estimators"],
+            evals=[(dtest, "test")],
+            verbose_eval=50,
+        )
+        train_rows = dtrain.num_row()
+        y_test = dtest.get_label()
+        proba = booster.predict(dtest)
+        # Release the page caches before their directory is removed
+        del dtrain, dtest
+    metrics = {
+        "train_rows": int(train_rows),
+        "test_rows": int(len(y_test)),
+        "test_accuracy": float(accuracy_score(y_test, proba > 0.5)),
+        "test_auc": float(roc_auc_score(y_test, proba)),
+    }
+    print(
+        f"test accuracy: {metrics['test_accuracy']:.3f} | "
+        f"AUC: {metrics['test_auc']:.3f}"
+    )
+    rss = peak_rss_mb()
+    if rss is not None:
+        metrics["peak_rss_mb"] = round(rss, 1)
+        print(f"peak RSS: {rss:.1f} MB")
+    return as_classifier(booster), metrics
 
-# ---------- 7) Main flow ----------
-def main():
+# ---------- 9) Main flow ----------
+def main(use_cache=True):
     np.random.seed(RANDOM_SEED)
-    df = load_or_make_data()
-    df = add_features(df)
-    X, y = select_features(df)
+    if use_cache and os.path.exists(DATA_PATH):
+        X, y = load_cached_data(DATA_PATH)
+    else:
+        df = load_or_make_data()
+        df = add_features(df)
+        X, y = select_features(df)
     X_train, X_test, y_train, y_test = split_data(X, y)
     model = train_model(X_train, y_train)
-    evaluate(model, X_train, y_train, X_test, y_test)
-    save_model(model)
+    metrics = evaluate(model, X_train, y_train, X_test, y_test)
+    save_model(model, metrics)
+    export_trees(model)
+
+def main_evaluate(model_path=MODEL_PATH):
+    """Offline evaluation of a saved model on the full (cached) dataset."""
+    with open(model_path, "rb") as f:
+        obj = pickle.load(f)
+    model = obj.get("model") if isinstance(obj, dict) else obj
+    X, y = load_cached_data(DATA_PATH)
+    proba = model.predict_proba(X)[:, 1]
+    print(
+        f"{model_path} on {len(y)} rows: accuracy "
+        f"{accuracy_score(y, proba > 0.5):.3f} | AUC: {roc_auc_score(y, proba):.3f}"
+    )
+
+def main_streaming(chunksize=CHUNK_SIZE):
+    if not os.path.exists(DATA_PATH):
+        raise FileNotFoundError(
+            f"{DATA_PATH} not found. Run make_dataset.py to generate it."
+        )
+    model, metrics = train_streaming(DATA_PATH, chunksize)
+    save_model(model, metrics)
+    export_trees(model)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train and export the loan model")
+    parser.add_argument(
+        "--export-trees",
+        action="store_true",
+        help=f"Only export tree arrays from the existing {MODEL_PATH}",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Train out-of-core from CSV chunks (for files larger than memory)",
+    )
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    parser.add_argument(
+        "--evaluate", action="store_true", help=f"Evaluate {MODEL_PATH} on the dataset"
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Parse the CSV, bypassing the cache"
+    )
+    args = parser.parse_args()
+    if args.export_trees:
+        with open(MODEL_PATH, "rb") as f:
+            obj = pickle.load(f)
+        export_trees(obj.get("model") if isinstance(obj, dict) else obj)
+    elif args.stream:
+        main_streaming(args.chunksize)
+    elif args.evaluate:
+        main_evaluate()
+    else:
+        main(use_cache=not args.no_cache)
\ No newline at end of file
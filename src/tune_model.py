@@ -0,0 +1,184 @@
+"""
+Hyperparameter search for the loan model.
+
+Runs stratified k-fold CV over SEARCH_SPACE in a process pool. Each worker
+builds the fold DMatrix objects once and reuses them for every trial it runs,
+every fold uses early stopping on validation AUC, and trials whose running
+mean AUC falls clearly behind the best finished trial are pruned. The best
+configuration is refit on all data and written through train_model.save_model.
+
+    python tune_model.py --trials 40 --folds 5
+"""
+import argparse
+import csv
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import xgboost as xgb
+from sklearn.model_selection import ParameterSampler, StratifiedKFold
+from xgboost import XGBClassifier
+
+import train_model
+from config import MODELS_DIR
+from train_model import FEATURE_ORDER, RANDOM_SEED, XGB_PARAMS
+
+LEADERBOARD_PATH = os.path.join(MODELS_DIR, "tuning_leaderboard.csv")
+SEARCH_SPACE = {
+    "max_depth": [3, 4, 5, 6, 8],
+    "learning_rate": [0.03, 0.05, 0.1, 0.2],
+    "subsample": [0.7, 0.8, 0.9, 1.0],
+    "colsample_bytree": [0.6, 0.8, 0.9, 1.0],
+    "min_child_weight": [1, 3, 5, 10],
+}
+MAX_ROUNDS = 1000
+EARLY_STOPPING_ROUNDS = 30
+# A trial is pruned once its running mean AUC is this far below the best trial
+PRUNE_MARGIN = 0.01
+
+# Per-worker state (set by _init_worker)
+_FOLDS = {}
+_DATA = None
+_BEST_AUC = None
+_N_FOLDS = None
+_NTHREAD = 1
+
+
+# --- Worker side ------------------------------------------------------------ #
+
+def _init_worker(data_path, n_folds, best_auc, nthread):
+    global _DATA, _BEST_AUC, _N_FOLDS, _NTHREAD
+    # Memory-mapped cache: workers share the page cache instead of copying
+    X, y = train_model.load_cached_data(data_path)
+    _DATA = (X.to_numpy(), y.to_numpy())
+    _BEST_AUC = best_auc
+    _N_FOLDS = n_folds
+    _NTHREAD = nthread
+
+
+def _fold(i):
+    """(dtrain, dvalid) for fold i, built once per worker."""
+    if i not in _FOLDS:
+        X, y = _DATA
+        splitter = StratifiedKFold(_N_FOLDS, shuffle=True, random_state=RANDOM_SEED)
+        train_idx, valid_idx = list(splitter.split(X, y))[i]
+        _FOLDS[i] = (
+            xgb.DMatrix(X[train_idx], label=y[train_idx], feature_names=FEATURE_ORDER),
+            xgb.DMatrix(X[valid_idx], label=y[valid_idx], feature_names=FEATURE_ORDER),
+        )
+    return _FOLDS[i]
+
+
+def run_trial(trial_id, params):
+    """Cross-validate one configuration; returns a leaderboard row."""
+    t0 = time.perf_counter()
+    native = train_model.booster_params({**XGB_PARAMS, **params})
+    native.update(eval_metric="auc", nthread=_NTHREAD)
+    aucs, rounds, pruned = [], [], False
+    for i in range(_N_FOLDS):
+        dtrain, dvalid = _fold(i)
+        booster = xgb.train(
+            native,
+            dtrain,
+            num_boost_round=MAX_ROUNDS,
+            evals=[(dvalid, "valid")],
+            early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+            verbose_eval=False,
+        )
+        aucs.append(booster.best_score)
+        rounds.append(booster.best_iteration + 1)
+        if i + 1 < _N_FOLDS and np.mean(aucs) < _BEST_AUC.value - PRUNE_MARGIN:
+            pruned = True
+            break
+    return {
+        "trial": trial_id,
+        **params,
+        "mean_auc": round(float(np.mean(aucs)), 6),
+        "std_auc": round(float(np.std(aucs)), 6),
+        "folds": len(aucs),
+        "rounds": int(np.mean(rounds)),
+        "pruned": pruned,
+        "wall_time_s": round(time.perf_counter() - t0, 3),
+    }
+
+
+# --- Driver ----------------------------------------------------------------- #
+
+def tune(data_path, n_trials=40, n_folds=5, workers=None):
+    """Run the search and return leaderboard rows sorted by mean AUC."""
+    workers = workers or os.cpu_count() or 1
+    nthread = max(1, (os.cpu_count() or 1) // workers)
+    train_model.build_column_cache(data_path)  # build once before forking
+    trials = list(
+        ParameterSampler(SEARCH_SPACE, n_iter=n_trials, random_state=RANDOM_SEED)
+    )
+    best_auc = mp.Value("d", 0.0)
+    rows = []
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(data_path, n_folds, best_auc, nthread),
+    ) as pool:
+        futures = [pool.submit(run_trial, i, p) for i, p in enumerate(trials)]
+        for fut in as_completed(futures):
+            row = fut.result()
+            rows.append(row)
+            if not row["pruned"] and row["mean_auc"] > best_auc.value:
+                best_auc.value = row["mean_auc"]
+            status = "pruned" if row["pruned"] else f"best {best_auc.value:.4f}"
+            print(
+                f"trial {row['trial']:>3}: AUC {row['mean_auc']:.4f} "
+                f"({row['folds']} folds, {row['wall_time_s']:.1f}s) {status}"
+            )
+    rows.sort(key=lambda r: (r["pruned"], -r["mean_auc"]))
+    return rows
+
+
+def write_leaderboard(rows, path=LEADERBOARD_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Wrote leaderboard ({len(rows)} trials) to {path}")
+
+
+def refit_best(best, data_path):
+    """Fit the winning configuration on all data and save it."""
+    params = {k: best[k] for k in SEARCH_SPACE}
+    model = XGBClassifier(**{**XGB_PARAMS, **params, "n_estimators": best["rounds"]})
+    X, y = train_model.load_cached_data(data_path)
+    model.fit(X, y)
+    metrics = {"cv_auc": best["mean_auc"], "cv_auc_std": best["std_auc"], **params}
+    train_model.save_model(model, metrics, data_path)
+    train_model.export_trees(model)
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel k-fold hyperparameter search")
+    parser.add_argument("--data", default=train_model.DATA_PATH)
+    parser.add_argument("--trials", type=int, default=40)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None, help="Default: CPU count")
+    parser.add_argument("--leaderboard", default=LEADERBOARD_PATH)
+    parser.add_argument(
+        "--no-save", action="store_true", help="Only write the leaderboard"
+    )
+    args = parser.parse_args()
+
+    rows = tune(args.data, args.trials, args.folds, args.workers)
+    write_leaderboard(rows, args.leaderboard)
+    best = rows[0]
+    print(
+        f"Best trial {best['trial']}: AUC {best['mean_auc']:.4f} "
+        f"({best['rounds']} rounds)"
+    )
+    if not args.no_save:
+        refit_best(best, args.data)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+import numpy as np
+
+import train_model
+
+HEADER = "age,monthly_income,loan_amount,employment_years,monthly_expenses,"
+HEADER += "existing_loans,approved,note"
+ROWS = [
+    '30,50000,300000,5,20000,1,1,"salaried\nno defaults"',
+    "45,80000,500000,12,30000,0,1,",
+    '52,20000,400000,2,15000,3,0,"two\nline\nbreaks"',  # no final newline
+]
+
+
+def test_cache_rows_follow_csv_records_not_lines(tmp_path):
+    path = tmp_path / "credit_data.csv"
+    path.write_text("\n".join([HEADER, *ROWS]))
+    X, y = train_model.load_cached_data(str(path), cache_dir=str(tmp_path / "cache"))
+    assert X.shape == (3, len(train_model.FEATURE_ORDER))
+    np.testing.assert_array_equal(y.to_numpy(), [1, 1, 0])
+    np.testing.assert_array_equal(X["age"].to_numpy(), [30, 45, 52])
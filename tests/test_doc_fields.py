@@ -0,0 +1,52 @@
+import pytest
+
+from doc_fields import application_fields, parse_amount, parse_fields
+
+
+@pytest.mark.parametrize(
+    "line, net",
+    [
+        ("Net Pay Rs. 45,000.00 for March 2024", 45000.0),
+        ("Net Salary: 45000 (Ref 12)", 45000.0),
+        ("Gross 60,000 Net Pay 52,300 Deductions 7,700", 52300.0),
+        ("Net Pay (March 2024): 72,315.50", 72315.5),
+        ("Net Pay: Rs.45000/-", 45000.0),
+        ("Take home pay INR 38000", 38000.0),
+        ("Net Amount ₹ 1,20,000.00", 120000.0),
+    ],
+)
+def test_net_salary_is_first_plausible_amount_after_label(line, net):
+    assert parse_fields(line)["net_salary"] == net
+
+
+@pytest.mark.parametrize(
+    "text", ["Net Pay for March 2024", "Net Pay (Ref 12)", "Net Salary: see page 2"]
+)
+def test_no_plausible_amount(text):
+    assert "net_salary" not in parse_fields(text)
+
+
+def test_parse_amount():
+    assert parse_amount("Rs. 1,20,000.00") == 120000.0
+    assert parse_amount("2024 then 850") is None
+    assert parse_amount("Ref 123456789") is None
+
+
+def test_payslip_fields():
+    text = "\n".join(
+        [
+            "PAYSLIP FOR THE MONTH OF MARCH 2024",
+            "Employer Name: Acme Technologies Pvt Ltd",
+            "Bank A/C No: 0012 3456 7890    IFSC: HDFC0001234",
+            "Gross Earnings          Rs. 86,600.00",
+            "Net Pay                 Rs. 72,315.00",
+        ]
+    )
+    fields = parse_fields(text)
+    assert fields == {
+        "net_salary": 72315.0,
+        "gross_salary": 86600.0,
+        "employer": "Acme Technologies Pvt Ltd",
+        "account_number": "001234567890",
+    }
+    assert application_fields(fields) == {"monthly_income": 72315.0}
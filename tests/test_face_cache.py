@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+
+from face_cache import EmbeddingCache
+
+
+def encoding(seed):
+    return np.random.default_rng(seed).normal(0, 0.1, 128)
+
+
+def test_memory_and_disk_hits(tmp_path):
+    cache = EmbeddingCache(cache_dir=str(tmp_path), capacity=1)
+    calls = []
+    for _ in range(2):
+        cache.get_or_compute(b"photo", "hog", lambda: calls.append(1) or encoding(0))
+    assert len(calls) == 1 and cache.stats()["memory_hits"] == 1
+
+    cache.put(cache.key(b"other", "hog"), encoding(1))  # pushes "photo" out of memory
+    np.testing.assert_array_equal(cache.get(cache.key(b"photo", "hog")), encoding(0))
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_no_face_is_cached():
+    cache = EmbeddingCache(cache_dir=None)
+    cache.put("k", np.empty(0))
+    assert cache.get("k").size == 0
+
+
+def test_disk_store_is_bounded_lru(tmp_path):
+    entry = EmbeddingCache(cache_dir=None)
+    cache = EmbeddingCache(cache_dir=str(tmp_path), capacity=1, max_bytes=3 * 1152)
+    keys = [entry.key(bytes([i]), "hog") for i in range(5)]
+    for i, key in enumerate(keys[:3]):
+        cache.put(key, encoding(i))
+    cache._memory.clear()
+    assert cache.get(keys[0]) is not None  # now most recently used
+    cache.put(keys[3], encoding(3))
+    cache.put(keys[4], encoding(4))
+
+    stats = cache.stats()
+    assert stats["disk_bytes"] <= cache.max_bytes and stats["evictions"] == 2
+    on_disk = {n[:-4] for _, _, files in os.walk(tmp_path) for n in files}
+    assert on_disk == {keys[0], keys[3], keys[4]}
+
+    reopened = EmbeddingCache(cache_dir=str(tmp_path), max_bytes=cache.max_bytes)
+    assert reopened.stats()["disk_entries"] == 3
+    assert reopened.disk_bytes == stats["disk_bytes"]
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from face_index import FaceIndex
+
+
+def encodings(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, 0.1, (n, 128)).astype(np.float32)
+
+
+def brute_force(data, queries, k):
+    d = np.linalg.norm(queries[:, None, :] - data[None, :, :], axis=2)
+    order = np.argsort(d, axis=1)[:, :k]
+    return np.take_along_axis(d, order, axis=1), order
+
+
+@pytest.mark.parametrize("k", [1, 5])
+def test_exact_search_matches_brute_force(k):
+    data, queries = encodings(500), encodings(20, seed=1)
+    index = FaceIndex()
+    index.add(data)
+    dist, ids = index.search(queries, k=k)
+    want_d, want_ids = brute_force(data, queries, k)
+    np.testing.assert_array_equal(ids, want_ids)
+    np.testing.assert_allclose(dist, want_d, rtol=1e-4, atol=1e-5)
+
+
+def test_search_pads_missing_slots():
+    index = FaceIndex()
+    index.add(encodings(3))
+    dist, ids = index.search(encodings(2, seed=1), k=5)
+    assert ids.shape == (2, 5)
+    assert (ids[:, 3:] == -1).all() and np.isinf(dist[:, 3:]).all()
+    assert sorted(ids[0, :3].tolist()) == [0, 1, 2]
+
+
+def test_empty_index():
+    index = FaceIndex()
+    dist, ids = index.search(encodings(2), k=3)
+    assert ids.shape == (2, 3) and (ids == -1).all() and np.isinf(dist).all()
+    assert index.matches(encodings(1)[0]) == []
+    with pytest.raises(ValueError):
+        index.train_ivf(nlist=4)
+
+
+def test_ivf_probing_every_list_is_exact():
+    data, queries = encodings(2000), encodings(30, seed=1)
+    index = FaceIndex()
+    index.add(data)
+    index.train_ivf(nlist=16, seed=0)
+    index.add(encodings(100, seed=2))  # lands in the list tails
+    want_d, want_ids = index.search(queries, k=5)
+    for q in (queries[:3], queries):  # per-query and per-list paths
+        dist, ids = index.search(q, k=5, exact=False, nprobe=16)
+        np.testing.assert_array_equal(ids, want_ids[: len(q)])
+        np.testing.assert_allclose(dist, want_d[: len(q)], rtol=1e-5)
+
+
+def test_ivf_finds_stored_face():
+    data = encodings(2000)
+    index = FaceIndex(dtype="int8")
+    ids = index.add(data)
+    index.train_ivf(nlist=16, seed=0)
+    found = index.matches(data[123], threshold=0.05, exact=False, nprobe=2)
+    assert found and found[0][0] == ids[123]
+
+
+def test_save_load_roundtrip(tmp_path):
+    data = encodings(300)
+    index = FaceIndex(dtype="float16")
+    index.add(data)
+    index.train_ivf(nlist=8, seed=0)
+    index.add(encodings(10, seed=3))
+    path = str(tmp_path / "faces.npz")
+    index.save(path)
+    loaded = FaceIndex.load(path)
+    queries = encodings(5, seed=4)
+    for exact in (True, False):
+        want = index.search(queries, k=3, exact=exact, nprobe=8)
+        got = loaded.search(queries, k=3, exact=exact, nprobe=8)
+        np.testing.assert_array_equal(got[1], want[1])
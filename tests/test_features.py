@@ -0,0 +1,76 @@
+import math
+
+import numpy as np
+import pytest
+
+from config import FEATURE_ORDER
+from features import DERIVED_BOUNDS, compute_features, feature_row, input_columns
+
+
+def batch_row(app):
+    with np.errstate(over="ignore", invalid="ignore"):
+        feats = compute_features(input_columns([app]))[0]
+    return dict(zip(FEATURE_ORDER, feats))
+
+
+def random_apps(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            "age": float(rng.integers(18, 80)),
+            "monthly_income": float(rng.uniform(0, 300000)),
+            "loan_amount": float(rng.uniform(1000, 5000000)),
+            "employment_years": float(rng.integers(0, 40)),
+            "monthly_expenses": float(rng.uniform(0, 200000)),
+            "existing_loans": float(rng.integers(0, 5)),
+        }
+        for _ in range(n)
+    ]
+
+
+EDGE_APPS = [
+    {},
+    {"age": 30, "monthly_income": 0, "loan_amount": 500000},
+    {"age": 30, "monthly_income": -5000, "loan_amount": 500000},
+    {"age": 0, "monthly_income": 40000, "employment_years": 5},
+    {"age": -3, "monthly_income": 40000, "employment_years": 5},
+    {"age": 25, "monthly_income": 40000, "employment_years": 60},
+    {"age": 40, "monthly_income": 0.5, "monthly_expenses": 100000},
+    {"age": 40, "monthly_income": 40000, "monthly_expenses": float("nan")},
+    {"age": float("nan"), "monthly_income": float("nan"), "loan_amount": 1e6},
+    {"age": 40, "monthly_income": float("inf"), "loan_amount": float("inf")},
+    {"age": 40, "monthly_income": 40000, "monthly_expenses": float("inf")},
+    {"age": 40, "monthly_income": 1e12, "loan_amount": 1e15},
+    {"age": "33", "monthly_income": "25000", "loan_amount": "100000"},
+]
+
+
+@pytest.mark.parametrize("app", EDGE_APPS + random_apps(200))
+def test_feature_row_matches_batch_kernel(app):
+    row = feature_row(app)
+    assert list(row) == FEATURE_ORDER
+    expected = batch_row(app)
+    for name in FEATURE_ORDER:
+        assert isinstance(row[name], float)
+        got, want = row[name], float(expected[name])
+        assert got == want or (math.isnan(got) and math.isnan(want)), name
+
+
+def test_derived_features_are_clipped():
+    app = {
+        "age": 20,
+        "monthly_income": 0,
+        "employment_years": 50,
+        "loan_amount": 1e9,
+        "monthly_expenses": 1e9,
+    }
+    row = feature_row(app)
+    for name, (lo, hi) in DERIVED_BOUNDS.items():
+        assert lo <= row[name] <= hi
+    assert row["debt_to_income"] == DERIVED_BOUNDS["debt_to_income"][1]
+    assert row["employment_stability"] == 1.0
+
+
+def test_missing_expenses_default_to_half_income():
+    row = feature_row({"age": 30, "monthly_income": 40000})
+    assert row["debt_to_income"] == 50.0
@@ -0,0 +1,116 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from ledger import Ledger
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = Ledger(str(tmp_path / "ledger.db"), synchronous="NORMAL")
+    yield ledger
+    ledger.close()
+
+
+def hold_write_lock(path):
+    """Open a write transaction so the writer thread blocks on its next BEGIN."""
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("BEGIN IMMEDIATE")
+    return conn
+
+
+def test_idempotent_post_moves_money_once(ledger):
+    first = ledger.post("W1", 500.25, idempotency_key="settle:PU1")
+    again = ledger.post("W1", 500.25, idempotency_key="settle:PU1")
+    assert not first["duplicate"] and again["duplicate"]
+    assert again["txn_id"] == first["txn_id"] and again["seq"] == first["seq"]
+    assert ledger.balance("W1") == 500.25
+    assert ledger.account("W1")["postings"] == 1
+    with pytest.raises(ValueError):
+        ledger.post("W1", 999, idempotency_key="settle:PU1")
+    assert ledger.balance("W1") == 500.25
+
+
+def test_concurrent_duplicates_post_once(ledger):
+    futures = [
+        ledger.submit("W2", 100, idempotency_key="settle:PU2") for _ in range(50)
+    ]
+    rows = [f.result()[0] for f in futures]
+    assert sum(not r["duplicate"] for r in rows) == 1
+    assert len({r["txn_id"] for r in rows}) == 1
+    assert ledger.balance("W2") == 100
+
+
+def test_group_commit_batches_queued_postings(ledger):
+    ledger.next_txn_id()  # reserve an ID block before the database is locked
+    blocker = hold_write_lock(ledger.path)
+    try:
+        futures = [ledger.submit("W3", 1)]
+        time.sleep(0.2)  # the writer has taken this one and waits for the lock
+        futures += [ledger.submit("W3", 1) for _ in range(499)]
+    finally:
+        blocker.execute("ROLLBACK")
+        blocker.close()
+    rows = [f.result()[0] for f in futures]
+    assert ledger.commits == 2 and ledger.committed == 500
+    assert len({r["txn_id"] for r in rows}) == 500
+    assert [r["seq"] for r in rows] == sorted(r["seq"] for r in rows)
+    assert ledger.balance("W3") == 500
+    assert ledger.verify() == 0
+
+
+def test_bad_submission_fails_alone_in_its_group(ledger):
+    ledger.post("W4", 10, idempotency_key="k1")
+    blocker = hold_write_lock(ledger.path)
+    try:
+        first = ledger.submit("W4", 1)
+        time.sleep(0.2)
+        good = ledger.submit_many([{"account": "W4", "amount": 2}] * 3)
+        bad = ledger.submit("W4", 99, idempotency_key="k1")  # reused for new amount
+        dup = ledger.submit("W4", 10, idempotency_key="k1")
+    finally:
+        blocker.execute("ROLLBACK")
+        blocker.close()
+    first.result()
+    assert len(good.result()) == 3
+    with pytest.raises(ValueError):
+        bad.result()
+    assert dup.result()[0]["duplicate"]
+    assert ledger.balance("W4") == 17
+    assert ledger.verify() == 0
+
+
+def test_txn_ids_unique_across_processes_sharing_a_file(tmp_path):
+    path = str(tmp_path / "ids.db")
+    ledgers = [Ledger(path, id_block=10) for _ in range(2)]
+    try:
+        ids = []
+
+        def take(source):
+            ids.extend(source.next_txn_id() for _ in range(25))
+
+        threads = [threading.Thread(target=take, args=(each,)) for each in ledgers]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(set(ids)) == 50
+        mine = [ledgers[0].next_txn_id() for _ in range(15)]
+        assert mine == sorted(mine)
+    finally:
+        for each in ledgers:
+            each.close()
+
+
+def test_postings_are_append_only(ledger):
+    ledger.post("W5", 1)
+    conn = sqlite3.connect(ledger.path)
+    try:
+        with pytest.raises(sqlite3.DatabaseError, match="append-only"):
+            conn.execute("UPDATE postings SET amount = 0")
+        with pytest.raises(sqlite3.DatabaseError, match="append-only"):
+            conn.execute("DELETE FROM postings")
+    finally:
+        conn.close()
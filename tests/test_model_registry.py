@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import model_registry
+from model_registry import ModelRegistry, list_artifacts
+
+
+def write_artifact(root, version, created_at):
+    os.makedirs(os.path.join(root, version))
+    with open(os.path.join(root, version, "manifest.json"), "w") as f:
+        json.dump({"version": version, "created_at": created_at}, f)
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """Replace model loading with a recorder; versions in `broken` fail to load."""
+    calls, broken = [], set()
+
+    def fake_load_path(path):
+        version = os.path.basename(path)
+        calls.append(version)
+        time.sleep(0.01)
+        if version in broken:
+            raise ValueError(f"corrupt {version}")
+        return object(), {"version": version}
+
+    monkeypatch.setattr(model_registry, "load_path", fake_load_path)
+    return calls, broken
+
+
+def test_versions_ordered_by_manifest_time(tmp_path):
+    root = str(tmp_path)
+    write_artifact(root, "zeta", "2024-01-01T00:00:00+00:00")
+    write_artifact(root, "alpha", "2024-03-01T00:00:00+00:00")
+    os.makedirs(os.path.join(root, "unfinished"))  # no manifest yet
+    assert list_artifacts(root) == ["zeta", "alpha"]
+    assert model_registry.latest_artifact(root).endswith("alpha")
+
+
+def test_concurrent_first_get_loads_once(tmp_path, loads):
+    calls, _ = loads
+    write_artifact(str(tmp_path), "v1", "2024-01-01T00:00:00+00:00")
+    registry = ModelRegistry(root=str(tmp_path), legacy_path=str(tmp_path / "none"))
+    threads = [threading.Thread(target=registry.get) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls == ["v1"]
+    assert registry.champion_version() == "v1"
+
+
+def test_failed_artifact_is_retried_with_backoff(tmp_path, loads):
+    calls, broken = loads
+    root = str(tmp_path)
+    write_artifact(root, "v1", "2024-01-01T00:00:00+00:00")
+    registry = ModelRegistry(root=root, poll_interval=0.05, retry_max=0.1)
+    registry.refresh()
+    write_artifact(root, "v2", "2024-02-01T00:00:00+00:00")
+    broken.add("v2")
+
+    with pytest.raises(ValueError):
+        registry.refresh()
+    assert registry.refresh() == "v1"  # retry not due yet: champion keeps serving
+    assert calls == ["v1", "v2"]
+
+    broken.clear()
+    time.sleep(0.06)
+    assert registry.refresh() == "v2"
+    assert calls == ["v1", "v2", "v2"]
+
+
+def test_retry_delay_is_capped(tmp_path, loads):
+    _, broken = loads
+    write_artifact(str(tmp_path), "v1", "2024-01-01T00:00:00+00:00")
+    broken.add("v1")
+    registry = ModelRegistry(root=str(tmp_path), poll_interval=1.0, retry_max=4.0)
+    path = os.path.join(str(tmp_path), "v1")
+    registry._failures[path] = (5, 0.0, None)  # five failed attempts, retry due now
+    with pytest.raises(ValueError):
+        registry.refresh()
+    attempts, next_retry, error = registry._failures[path]
+    assert attempts == 6 and isinstance(error, ValueError)
+    assert next_retry - time.monotonic() <= 4.0
+
+
+def test_broken_newest_falls_back_to_older_artifact(tmp_path, loads):
+    calls, broken = loads
+    root = str(tmp_path)
+    write_artifact(root, "v1", "2024-01-01T00:00:00+00:00")
+    write_artifact(root, "v2", "2024-02-01T00:00:00+00:00")
+    broken.add("v2")
+    registry = ModelRegistry(root=root, poll_interval=0.05, legacy_path=root + "/no")
+    assert registry.get().version == "v1"
+    assert calls == ["v2", "v1"]
+
+    broken.clear()  # the newest is promoted once its retry is due
+    time.sleep(0.06)
+    assert registry.refresh() == "v2"
+
+
+def test_broken_artifacts_fall_back_to_legacy_pickle(tmp_path, loads):
+    calls, broken = loads
+    root = str(tmp_path / "artifacts")
+    write_artifact(root, "v1", "2024-01-01T00:00:00+00:00")
+    write_artifact(root, "v2", "2024-02-01T00:00:00+00:00")
+    legacy = tmp_path / "loan_model.pkl"
+    legacy.write_bytes(b"")
+    broken.update({"v1", "v2"})
+    registry = ModelRegistry(root=root, legacy_path=str(legacy))
+    for _ in range(3):  # every call, not just the first after a restart
+        assert registry.get().version == "loan_model.pkl"
+    assert calls == ["v2", "v1", "loan_model.pkl"]
+
+
+def test_no_loadable_model_reports_the_load_failure(tmp_path, loads):
+    _, broken = loads
+    write_artifact(str(tmp_path), "v1", "2024-01-01T00:00:00+00:00")
+    broken.add("v1")
+    registry = ModelRegistry(root=str(tmp_path), legacy_path=str(tmp_path / "no"))
+    with pytest.raises(ValueError, match="corrupt v1"):
+        registry.get()
+    with pytest.raises(FileNotFoundError, match="corrupt v1"):
+        registry.get()  # retry not due: the recorded failure is reported
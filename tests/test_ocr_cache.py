@@ -0,0 +1,52 @@
+import threading
+
+from ocr_cache import OcrCache
+
+SETTINGS = {"kind": "pdf", "backend": "tesserocr", "lang": "eng"}
+
+
+def test_results_survive_a_restart(tmp_path):
+    cache = OcrCache(cache_dir=str(tmp_path))
+    key = cache.key(b"%PDF-1.4", SETTINGS)
+    cache.put(key, [{"page": 1, "text": "Net Pay 45,000"}])
+    reopened = OcrCache(cache_dir=str(tmp_path))
+    assert reopened.get(key) == [{"page": 1, "text": "Net Pay 45,000"}]
+    assert reopened.stats()["disk_hits"] == 1
+    assert cache.key(b"%PDF-1.4", {**SETTINGS, "lang": "hin"}) != key
+
+
+def test_callers_get_private_copies():
+    cache = OcrCache(cache_dir=None)
+    value = [{"page": 1, "text": "a"}]
+    cache.put("k", value)
+    value[0]["text"] = "changed after put"
+    got = cache.get("k")
+    got[0]["text"] = "changed after get"
+    assert cache.get("k") == [{"page": 1, "text": "a"}]
+
+
+def test_disk_write_does_not_block_readers(tmp_path):
+    cache = OcrCache(cache_dir=str(tmp_path))
+    cache.put("ready", {"text": "x"})
+    writing, release = threading.Event(), threading.Event()
+    dumps = cache.dumps
+
+    def slow_dumps(value):
+        writing.set()
+        release.wait(5)
+        return dumps(value)
+
+    cache.dumps = slow_dumps
+    writer = threading.Thread(target=cache.put, args=("slow", {"text": "y"}))
+    writer.start()
+    try:
+        assert writing.wait(5)
+        got = []
+        reader = threading.Thread(target=lambda: got.append(cache.get("ready")))
+        reader.start()
+        reader.join(1)  # answered while the write is still in flight
+        assert got == [{"text": "x"}]
+    finally:
+        release.set()
+        writer.join()
+    assert cache.get("slow") == {"text": "y"}
@@ -0,0 +1,143 @@
+import threading
+
+import pytest
+
+from pipeline import (
+    DONE,
+    FAILED,
+    SKIPPED,
+    Pipeline,
+    Stage,
+    aide_stages,
+    make_document_stage,
+)
+
+APPLICATION = {
+    "name": "Asha",
+    "age": 30,
+    "income": 80000,
+    "loan_amount": 300000,
+    "employment": 5,
+    "loan_type": "Home Loan",
+}
+
+
+@pytest.fixture
+def make_pipeline():
+    pipelines = []
+
+    def make(stages, workers=4):
+        pipelines.append(Pipeline(stages, workers=workers))
+        return pipelines[-1]
+
+    yield make
+    for pipeline in pipelines:
+        pipeline.close()
+
+
+class FakeOcr:
+    """iter_pdf() over canned page texts, recording how far it was read."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.read = 0
+        self.closed = False
+
+    def iter_pdf(self, data):
+        try:
+            for page, text in enumerate(self.pages, 1):
+                self.read = page
+                yield {"page": page, "text": text}
+        finally:
+            self.closed = True
+
+
+class FakeFaces:
+    def compare(self, id_image, selfie_image, id_digest=None, selfie_digest=None):
+        return {"match": True, "confidence": 90.0, "distance": 1.0}
+
+
+def test_stages_run_in_dependency_order_and_overlap(make_pipeline):
+    both_running = threading.Barrier(2, timeout=5)  # a and b must overlap
+
+    def leaf(value):
+        def fn(inputs, deps):
+            both_running.wait()
+            return value
+
+        return fn
+
+    pipeline = make_pipeline(
+        [
+            Stage("a", leaf(1)),
+            Stage("b", leaf(2)),
+            Stage("c", lambda inputs, deps: deps["a"] + deps["b"], ("a", "b")),
+        ]
+    )
+    run = pipeline.run({})
+    assert run.result("c", timeout=5) == 3
+    run.wait(5)
+    assert run.done and run.status == {"a": DONE, "b": DONE, "c": DONE}
+    events = [(e["stage"], e["status"]) for e in run.events(timeout=1)]
+    assert events.index(("c", "running")) > max(
+        events.index(("a", "done")), events.index(("b", "done"))
+    )
+
+
+def test_failed_stage_skips_its_dependents_only(make_pipeline):
+    def fail(inputs, deps):
+        raise ValueError("bad input")
+
+    pipeline = make_pipeline(
+        [
+            Stage("a", fail),
+            Stage("b", lambda inputs, deps: 1, ("a",)),
+            Stage("c", lambda inputs, deps: 2, ("b",)),
+            Stage("d", lambda inputs, deps: 3),
+        ]
+    )
+    run = pipeline.run({})
+    run.wait(5)
+    assert run.done
+    assert run.status == {"a": FAILED, "b": SKIPPED, "c": SKIPPED, "d": DONE}
+    assert run.results == {"d": 3}
+    with pytest.raises(ValueError):
+        run.result("a")
+    with pytest.raises(RuntimeError, match="skipped"):
+        run.result("c")
+
+
+def test_dependencies_must_be_declared_first():
+    with pytest.raises(ValueError):
+        Pipeline([Stage("b", lambda inputs, deps: 1, ("a",)), Stage("a", min)])
+
+
+def test_rex_stops_reading_once_income_is_found():
+    ocr = FakeOcr(["Statement", "Net Pay: Rs. 45,000.00", "page 3", "page 4"])
+    result = make_document_stage(ocr, max_pages=4)({"documents": [(b"", True)]}, {})
+    assert result["monthly_income"] == 45000.0
+    assert ocr.read == 2 and ocr.closed
+
+
+def test_rex_stops_at_max_pages():
+    ocr = FakeOcr([f"page {i}" for i in range(10)])
+    result = make_document_stage(ocr, max_pages=3)({"documents": [(b"", True)]}, {})
+    assert "monthly_income" not in result
+    assert ocr.read == 3 and ocr.closed
+
+
+def test_aide_stages_decide_an_application(make_pipeline):
+    ocr = FakeOcr(["Net Pay: 80,000"])
+    pipeline = make_pipeline(aide_stages(ocr, FakeFaces()))
+    run = pipeline.run(
+        {
+            "application": APPLICATION,
+            "documents": [(b"", True)],
+            "id_image": None,
+            "selfie_image": None,
+        }
+    )
+    results = run.wait(5)
+    assert run.done and not run.errors
+    assert results["victor"]["income_verified"] is True
+    assert results["sage"]["approved"] and results["sage"]["rate"] == 9.5
@@ -0,0 +1,88 @@
+import pickle
+
+import numpy as np
+import pytest
+
+xgb = pytest.importorskip("xgboost")
+
+import credit_scoring
+from config import FEATURE_ORDER
+from credit_scoring import TreeEnsemble
+from features import compute_features, input_columns
+from model_registry import ModelRegistry
+from test_features import random_apps
+
+
+@pytest.fixture(scope="module")
+def model():
+    apps = random_apps(2000, seed=1)
+    X = compute_features(input_columns(apps)).astype(np.float32)
+    # Label on the derived ratios so the trees split on them
+    col = {name: X[:, i] for i, name in enumerate(FEATURE_ORDER)}
+    y = ((col["debt_to_income"] < 60) & (col["loan_to_income"] < 250)) | (
+        col["employment_stability"] > 0.5
+    )
+    clf = xgb.XGBClassifier(n_estimators=30, max_depth=4, random_state=0)
+    return clf.fit(X, y.astype(int))
+
+
+@pytest.fixture
+def registry(model, tmp_path, monkeypatch):
+    path = tmp_path / "loan_model.pkl"
+    with open(path, "wb") as f:
+        pickle.dump({"model": model, "features": FEATURE_ORDER}, f)
+    registry = ModelRegistry(root=str(tmp_path / "artifacts"), legacy_path=str(path))
+    monkeypatch.setattr(credit_scoring, "_REGISTRY", registry)
+    return registry
+
+
+APPS = [
+    {},
+    {"age": 30, "monthly_income": 0, "loan_amount": 500000},
+    {"age": 0, "monthly_income": 40000, "employment_years": 5},
+    {"age": 40, "monthly_income": 40000, "monthly_expenses": float("nan")},
+    {"age": 25, "monthly_income": 40000, "loan_amount": 100000, "existing_loans": 4},
+] + random_apps(100, seed=2)
+
+
+def test_single_fast_and_batch_paths_agree(registry):
+    batch = credit_scoring.predict_loan_approval_batch(APPS)
+    for app, row in zip(APPS, batch):
+        single = credit_scoring.predict_loan_approval(app)
+        fast = credit_scoring.predict_loan_approval_fast(app)
+        assert single["method"] == "model" and fast["method"] == "model_fast"
+        p = single["approval_probability"]
+        assert fast["approval_probability"] == pytest.approx(p, abs=1e-6)
+        assert row["probability"] == pytest.approx(p, abs=1e-6)
+        assert single["approved"] == fast["approved"] == bool(row["approved"])
+        assert single["features_used"] == fast["features_used"]
+
+
+def test_tree_ensemble_matches_booster(model, tmp_path):
+    import train_model
+
+    path = str(tmp_path / "trees.npz")
+    train_model.export_trees(model, path)
+    trees = TreeEnsemble.load(path)
+    X = compute_features(input_columns(APPS)).astype(np.float32)
+    X[::7, 3] = np.nan  # missing values follow the default branch
+    np.testing.assert_allclose(
+        trees.predict_proba(X), model.predict_proba(X), rtol=1e-5, atol=1e-6
+    )
+    by_trees = credit_scoring.predict_loan_approval_batch(APPS, model=trees)
+    by_model = credit_scoring.predict_loan_approval_batch(APPS, model=model)
+    np.testing.assert_allclose(
+        by_trees["probability"], by_model["probability"], rtol=1e-5, atol=1e-6
+    )
+    np.testing.assert_array_equal(by_trees["risk_level"], by_model["risk_level"])
+
+
+def test_batch_falls_back_to_rules_without_a_model(tmp_path, monkeypatch):
+    missing = str(tmp_path / "none.pkl")
+    registry = ModelRegistry(root=str(tmp_path / "artifacts"), legacy_path=missing)
+    monkeypatch.setattr(credit_scoring, "_REGISTRY", registry)
+    batch = credit_scoring.predict_loan_approval_batch(APPS[:5])
+    for app, row in zip(APPS[:5], batch):
+        single = credit_scoring.predict_loan_approval(app)
+        assert single["method"] == "rule_based"
+        assert bool(row["approved"]) == single["approved"]
@@ -0,0 +1,154 @@
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+import scoring_service
+from scoring_service import (
+    MicroBatcher,
+    Overloaded,
+    ScoringServer,
+    score_batch,
+    validate,
+)
+
+APP = {"age": 30, "monthly_income": 50000, "loan_amount": 300000}
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {**APP, "tenure_years": 1e6},
+        {**APP, "tenure_years": 0},
+        {**APP, "tenure_years": -5},
+        {**APP, "monthly_income": -50000},
+        {**APP, "loan_amount": -1},
+        {**APP, "age": float("nan")},
+        {**APP, "existing_loans": True},
+        {**APP, "employment_years": "2"},
+        {"age": 30},
+        [APP],
+    ],
+)
+def test_validate_rejects_out_of_range(payload):
+    with pytest.raises(ValueError):
+        validate(payload)
+
+
+def test_validate_keeps_known_fields():
+    assert validate({**APP, "tenure_years": 3, "note": "x"}) == {
+        **APP,
+        "tenure_years": 3,
+    }
+
+
+def test_score_batch_prices_every_row():
+    results = score_batch([APP, {**APP, "tenure_years": 3}])
+    assert len(results) == 2
+    for result in results:
+        assert 0.0 <= result["approval_probability"] <= 1.0
+        assert result["emi"] > 0
+    assert results[1]["emi"] > results[0]["emi"]  # shorter tenure
+
+
+def test_failing_row_does_not_fail_its_batch():
+    def score(apps):
+        if any(app.get("bad") for app in apps):
+            raise OverflowError("bad row")
+        return [app["id"] for app in apps]
+
+    release = threading.Event()
+    batcher = MicroBatcher(lambda apps: release.wait() and score(apps), window=0.05)
+    try:
+        futures = [batcher.submit({"id": i, "bad": i == 3}) for i in range(6)]
+        release.set()
+        for i, future in enumerate(futures):
+            if i == 3:
+                with pytest.raises(OverflowError):
+                    future.result(5)
+            else:
+                assert future.result(5) == i
+    finally:
+        batcher.close()
+    assert batcher.stats["errors"] == 1
+
+
+def test_full_queue_sheds():
+    release = threading.Event()
+    batcher = MicroBatcher(
+        lambda apps: release.wait() and apps, window=0, max_batch=1, queue_size=2
+    )
+    try:
+        first = batcher.submit({})  # taken by the batch thread, which then blocks
+        while batcher.queued():
+            pass
+        queued = [batcher.submit({}), batcher.submit({})]
+        with pytest.raises(Overloaded):
+            batcher.submit({})
+        release.set()
+        assert [f.result(5) for f in [first, *queued]] == [{}, {}, {}]
+    finally:
+        release.set()
+        batcher.close()
+    assert batcher.stats["shed_full"] == 1
+
+
+def test_stale_requests_are_shed():
+    release = threading.Event()
+    batcher = MicroBatcher(
+        lambda apps: release.wait() and apps, window=0, max_batch=1, max_wait=0.2
+    )
+    try:
+        first = batcher.submit({})
+        while batcher.queued():
+            time.sleep(0.001)
+        stale = batcher.submit({})
+        threading.Timer(0.5, release.set).start()
+        assert first.result(5) == {}
+        with pytest.raises(Overloaded):
+            stale.result(5)
+    finally:
+        release.set()
+        batcher.close()
+
+
+def post(server, body, headers=None):
+    host, port = server.server_address[:2]
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    try:
+        conn.request("POST", "/score", body, headers or {})
+        response = conn.getresponse()
+        return response.status, json.loads(response.read()), response
+    finally:
+        conn.close()
+
+
+def test_oversized_body_is_refused(monkeypatch):
+    monkeypatch.setattr(scoring_service, "SERVICE_MAX_BODY_BYTES", 100)
+    server = ScoringServer(port=0, score=lambda apps: apps).start()
+    try:
+        status, body, _ = post(server, json.dumps([APP] * 10))
+        assert status == 413 and "100 bytes" in body["error"]
+        status, body, _ = post(server, json.dumps(APP))
+        assert status == 200 and body == APP
+    finally:
+        server.close()
+
+
+def test_stuck_scoring_times_out(monkeypatch):
+    monkeypatch.setattr(scoring_service, "SERVICE_SCORE_TIMEOUT", 0.2)
+    release = threading.Event()
+    server = ScoringServer(
+        port=0, score=lambda apps: release.wait() and apps, max_wait=0.1
+    ).start()
+    try:
+        t0 = time.monotonic()
+        status, body, response = post(server, json.dumps(APP))
+        assert status == 503 and body["error"] == "Scoring timed out"
+        assert response.getheader("Retry-After") == "1"
+        assert time.monotonic() - t0 < 2
+    finally:
+        release.set()
+        server.close()
@@ -0,0 +1,106 @@
+import logging
+import random
+import time
+from concurrent.futures import CancelledError
+
+import pytest
+
+from settlement import (
+    EXPIRED,
+    FINAL_STATUSES,
+    PENDING,
+    SETTLED,
+    SettlementEngine,
+    StubPayUGateway,
+)
+
+
+class RecordingRandom(random.Random):
+    """Records the upper bound of every jittered backoff delay."""
+
+    def __init__(self, seed):
+        super().__init__(seed)
+        self.bounds = []
+
+    def uniform(self, a, b):
+        self.bounds.append(b)
+        return super().uniform(a, b)
+
+
+@pytest.fixture
+def make_engine():
+    engines = []
+
+    def make(gateway, **kwargs):
+        engines.append(SettlementEngine(gateway, seed=0, **kwargs))
+        return engines[-1]
+
+    yield make
+    for engine in engines:
+        engine.close()
+
+
+def stub(**kwargs):
+    options = dict(latency=(0.0, 0.0), error_rate=0.0, decline_rate=0.0, seed=1)
+    options.update(kwargs)
+    return StubPayUGateway(**options)
+
+
+def test_backoff_doubles_up_to_max_delay(make_engine):
+    engine = make_engine(
+        stub(settle_seconds=(0.3, 0.3)), base_delay=0.01, max_delay=0.04, timeout=5
+    )
+    engine._rng = RecordingRandom(0)
+    event = engine.track("t1", 100.0).result(timeout=5)
+    assert event["status"] == SETTLED and event["amount"] == 100.0
+    bounds = engine._rng.bounds
+    assert len(bounds) >= 4
+    assert bounds == [min(0.04, 0.01 * 2**i) for i in range(len(bounds))]
+    assert event["polls"] == engine.polls
+
+
+def test_gateway_errors_are_retried(make_engine):
+    gateway = stub(settle_seconds=(0.05, 0.05), error_rate=0.5, seed=3)
+    engine = make_engine(gateway, base_delay=0.005, max_delay=0.02, timeout=5)
+    events = [engine.track(f"t{i}", 10.0) for i in range(5)]
+    finals = [future.result(timeout=5) for future in events]
+    assert engine.gateway_errors > 0
+    assert all(event["status"] in FINAL_STATUSES for event in finals)
+    assert all(event["status"] != EXPIRED for event in finals)
+
+
+def test_pending_transaction_expires(make_engine):
+    engine = make_engine(
+        stub(settle_seconds=(10.0, 10.0)), base_delay=0.01, max_delay=0.05, timeout=0.2
+    )
+    event = engine.track("t1", 50.0).result(timeout=5)
+    assert event["status"] == EXPIRED and event["amount"] == 0
+    assert 0.2 <= event["seconds"] < 1.0
+    assert engine.status("t1") == event
+
+
+def test_close_cancels_unfinished_tracking(make_engine):
+    engine = make_engine(
+        stub(settle_seconds=(10.0, 10.0)), base_delay=0.01, max_delay=0.05, timeout=30
+    )
+    future = engine.track("t1", 50.0)
+    deadline = time.monotonic() + 5
+    while engine.status("t1") is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert engine.status("t1")["status"] == PENDING
+    engine.close()
+    with pytest.raises(CancelledError):
+        future.result(timeout=5)
+    engine.close()  # idempotent
+
+
+def test_failing_subscriber_is_logged_not_raised(make_engine, caplog):
+    engine = make_engine(stub(settle_seconds=(0.0, 0.0)), base_delay=0.01)
+    seen = []
+    engine.subscribe(lambda event: 1 / 0)
+    engine.subscribe(seen.append)
+    with caplog.at_level(logging.ERROR, logger="settlement"):
+        event = engine.track("t1", 5.0).result(timeout=5)
+    assert event["status"] == SETTLED
+    assert [e["status"] for e in seen] == [PENDING, SETTLED]
+    assert "subscriber failed" in caplog.text